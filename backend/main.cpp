@@ -29,6 +29,7 @@
 #include "src/infrastructure/ConnectionManager.h"
 #include "src/infrastructure/FileNotificationRepository.h"
 #include "src/application/NotificationService.h"
+#include "src/utils/RequestFramer.h"
 
 using json = nlohmann::json;
 
@@ -51,39 +52,53 @@ void handleClient(
 
     std::optional<UUIDv4::UUID> authenticatedUserId;
 
+    RequestFramer framer;
     bool shouldClose = false;
     while(!shouldClose) {
-        char buff[4096] = {};
-        ssize_t n = recv(client_socket, buff, sizeof(buff)-1, 0);
+        char buff[4096];
+        ssize_t n = recv(client_socket, buff, sizeof(buff), 0);
         if(n > 0) {
-            try {
-                json request;
+            framer.append(buff, n);
+            if(framer.overflowed()) {
+                Logger::log(std::format("Request from {}:{} exceeds the frame limit", clientIP, clientPort), Logger::Level::ERROR, Logger::Importance::MEDIUM);
+                shouldClose = true;
+            }
+
+            // Odpowiedzi idą w kolejności żądań, więc klient może wysłać kilka naraz
+            while(!shouldClose) {
+                std::optional<std::string> frame = framer.next();
+                if(!frame.has_value())
+                    break;
+
                 try {
-                    request = json::parse(buff);
-                } catch(const std::exception&) {
-                    Logger::log(std::format("Received text: {}", std::string(buff)), Logger::Level::WARNING, Logger::Importance::LOW);
-                    request = json::parse("{}");
-                }
+                    json request;
+                    try {
+                        request = json::parse(frame.value());
+                    } catch(const std::exception&) {
+                        Logger::log(std::format("Received text: {}", frame.value()), Logger::Level::WARNING, Logger::Importance::LOW);
+                        request = json::parse("{}");
+                    }
 
-                Logger::log(std::format("Request from {}:{}: {}", clientIP, clientPort, request.dump()), Logger::Level::INFO, Logger::Importance::LOW);
+                    Logger::log(std::format("Request from {}:{}: {}", clientIP, clientPort, request.dump()), Logger::Level::INFO, Logger::Importance::LOW);
 
-                const json response = handleRequestService.handleRequest(request, client_socket, authenticatedUserId);
+                    const json response = handleRequestService.handleRequest(request, client_socket, authenticatedUserId);
 
-                std::string responseStr = response.dump() + "\n";
-                ssize_t sent = send(client_socket, responseStr.c_str(), responseStr.size(), 0);
+                    std::string responseStr = response.dump() + "\n";
+                    ssize_t sent = send(client_socket, responseStr.c_str(), responseStr.size(), 0);
 
-                if (response.contains("close"))
-                    shouldClose = true;
+                    if (response.contains("close"))
+                        shouldClose = true;
 
-                if(sent == -1) {
-                    Logger::log(std::format("Error sending response to {}:{}", clientIP, clientPort), Logger::Level::ERROR, Logger::Importance::MEDIUM);
-                    shouldClose = true;
-                } else
-                    Logger::log(std::format("Response to {}:{}: {}", clientIP, clientPort, responseStr), Logger::Level::INFO, Logger::Importance::LOW);
+                    if(sent == -1) {
+                        Logger::log(std::format("Error sending response to {}:{}", clientIP, clientPort), Logger::Level::ERROR, Logger::Importance::MEDIUM);
+                        shouldClose = true;
+                    } else
+                        Logger::log(std::format("Response to {}:{}: {}", clientIP, clientPort, responseStr), Logger::Level::INFO, Logger::Importance::LOW);
 
-            } catch(const std::exception& e) {
-                Logger::log(std::format("Internal error for {}:{}: {}", clientIP, clientPort, e.what()), Logger::Level::ERROR, Logger::Importance::HIGH);
-                shouldClose = true;
+                } catch(const std::exception& e) {
+                    Logger::log(std::format("Internal error for {}:{}: {}", clientIP, clientPort, e.what()), Logger::Level::ERROR, Logger::Importance::HIGH);
+                    shouldClose = true;
+                }
             }
         } else if(n == 0) {
             Logger::log(std::format("Client {}:{} disconnected", clientIP, clientPort), Logger::Level::INFO, Logger::Importance::LOW);
@@ -95,7 +110,7 @@ void handleClient(
     }
 
     if(authenticatedUserId.has_value())
-        connectionManager->unregisterConnection(authenticatedUserId.value());
+        connectionManager->unregisterConnection(authenticatedUserId.value(), client_socket);
 
 
     close(client_socket);
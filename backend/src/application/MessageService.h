@@ -1,6 +1,11 @@
 #pragma once
+#include <condition_variable>
+#include <deque>
 #include <memory>
+#include <mutex>
+#include <optional>
 #include <random>
+#include <unordered_map>
 #include "../domain/message/MessageRepository.h"
 #include "../domain/group/GroupRepository.h"
 #include "../domain/user/UserRepository.h"
@@ -10,6 +15,12 @@
 #include "../exceptions/not_group_member_error.h"
 #include "NotificationService.h"
 
+// Identyfikator i czas zapisu wysłanej wiadomości - klient zastępuje nimi swoją lokalną kopię
+struct SentMessage {
+    UUIDv4::UUID messageId;
+    std::chrono::system_clock::time_point sentAt;
+};
+
 class MessageService {
     std::shared_ptr<MessageRepository> messageRepo;
     std::shared_ptr<GroupRepository> groupRepo;
@@ -18,6 +29,45 @@ class MessageService {
     std::shared_ptr<NotificationService> notificationService;
     UUIDv4::UUIDGenerator<std::mt19937_64> uuidGenerator;
 
+    // Klucze idempotencji nadane przez klienta (nadawca + clientMessageId) dla ostatnio
+    // zapisanych wiadomości - ponowione po zerwaniu połączenia żądanie nie tworzy duplikatu.
+    // clientMessageId jest też zapisywany z wiadomością w repozytorium: mapa to tylko pamięć
+    // podręczna ostatnich wysyłek tego procesu, a ponowienie spoza niej (po restarcie serwera
+    // albo po maxClientMessageIds innych wiadomościach) rozpoznaje zapis w repozytorium.
+    // Muteks chroni tylko mapę: klucz jest rezerwowany (pusta wartość), zapis i rozesłanie
+    // powiadomień idą bez blokady, a duplikat w tym czasie czeka na wynik rezerwacji
+    static constexpr size_t maxClientMessageIds = 10000;
+    std::mutex clientMessageIdsMutex;
+    std::condition_variable clientMessageIdsChanged;
+    std::unordered_map<std::string, std::optional<SentMessage>> clientMessageIds;
+    std::deque<std::string> clientMessageIdsOrder;
+
+    // Rezerwacja klucza na czas wysyłania; bez publish() zwalniana przy wyjściu (np. wyjątek
+    // walidacji), żeby czekający duplikat mógł spróbować sam
+    class ClientMessageReservation {
+        MessageService& service;
+        std::string key;
+
+    public:
+        ClientMessageReservation(MessageService& service, std::string key)
+            : service(service), key(std::move(key)) {}
+
+        ClientMessageReservation(const ClientMessageReservation&) = delete;
+        ClientMessageReservation& operator=(const ClientMessageReservation&) = delete;
+
+        ~ClientMessageReservation() {
+            if(!key.empty())
+                service.releaseClientMessageId(key);
+        }
+
+        void publish(const SentMessage& sent) {
+            if(key.empty())
+                return;
+            service.publishClientMessageId(key, sent);
+            key.clear();
+        }
+    };
+
 public:
     MessageService(std::shared_ptr<MessageRepository> mRepo,
                    std::shared_ptr<GroupRepository> gRepo,
@@ -30,9 +80,19 @@ public:
           friendshipRepo(std::move(fRepo)),
           notificationService(std::move(nService)) {}
 
-    UUIDv4::UUID sendGroupMessage(const UUIDv4::UUID& senderId,
+    SentMessage sendGroupMessage(const UUIDv4::UUID& senderId,
                                   const UUIDv4::UUID& groupId,
-                                  const std::string& content) {
+                                  const std::string& content,
+                                  const std::string& clientMessageId = "") {
+        const auto key = clientMessageId.empty() ? std::string() : senderId.str() + ":" + clientMessageId;
+        if(const auto existing = reserveClientMessageId(key); existing.has_value())
+            return existing.value();
+        ClientMessageReservation reservation(*this, key);
+        if(const auto stored = findStoredClientMessage(senderId, clientMessageId); stored.has_value()) {
+            reservation.publish(stored.value());
+            return stored.value();
+        }
+
         if(!userRepo->exists(senderId))
             throw user_not_found_error();
 
@@ -45,7 +105,7 @@ public:
         
         const auto senderName = userRepo->findByUUID(senderId)->username;
         const auto now = std::chrono::system_clock::now();
-        const auto messageId = uuidGenerator.getUUID();
+        const auto messageId = nextMessageId();
 
         const Message message{
             messageId,
@@ -55,20 +115,36 @@ public:
             senderName,
             content,
             now,
-            now
+            now,
+            clientMessageId
         };
 
         if(!messageRepo->save(message))
             throw std::runtime_error("Failed to send message");
 
+        // Wynik jest publikowany zaraz po zapisie - duplikat nie czeka na rozesłanie powiadomień,
+        // a błąd przy rozsyłaniu nie zwalnia klucza zapisanej już wiadomości
+        const SentMessage sent{messageId, now};
+        reservation.publish(sent);
+
         notifyGroupMembers(group.value(), senderId, message);
 
-        return messageId;
+        return sent;
     }
 
-    UUIDv4::UUID sendPrivateMessage(const UUIDv4::UUID& senderId,
+    SentMessage sendPrivateMessage(const UUIDv4::UUID& senderId,
                                     const UUIDv4::UUID& receiverId,
-                                    const std::string& content) {
+                                    const std::string& content,
+                                    const std::string& clientMessageId = "") {
+        const auto key = clientMessageId.empty() ? std::string() : senderId.str() + ":" + clientMessageId;
+        if(const auto existing = reserveClientMessageId(key); existing.has_value())
+            return existing.value();
+        ClientMessageReservation reservation(*this, key);
+        if(const auto stored = findStoredClientMessage(senderId, clientMessageId); stored.has_value()) {
+            reservation.publish(stored.value());
+            return stored.value();
+        }
+
         if(!userRepo->exists(senderId))
             throw user_not_found_error();
 
@@ -80,7 +156,7 @@ public:
 
         const auto senderName = userRepo->findByUUID(senderId)->username;
         const auto now = std::chrono::system_clock::now();
-        const auto messageId = uuidGenerator.getUUID();
+        const auto messageId = nextMessageId();
         
         const Message message{
             messageId,
@@ -90,15 +166,19 @@ public:
             senderName,
             content,
             now,
-            now
+            now,
+            clientMessageId
         };
 
         if(!messageRepo->save(message))
             throw std::runtime_error("Failed to send message");
 
+        const SentMessage sent{messageId, now};
+        reservation.publish(sent);
+
         notifyPrivateMessage(receiverId, message);
 
-        return messageId;
+        return sent;
     }
 
     std::vector<Message> getGroupMessages(const UUIDv4::UUID& groupId,
@@ -151,6 +231,63 @@ public:
     }
 
 private:
+    UUIDv4::UUID nextMessageId() {
+        // Generator nie jest bezpieczny dla wątków, a wysyłki z różnych połączeń biegną równolegle
+        std::lock_guard<std::mutex> lock(clientMessageIdsMutex);
+        return uuidGenerator.getUUID();
+    }
+
+    std::optional<SentMessage> findStoredClientMessage(const UUIDv4::UUID& senderId, const std::string& clientMessageId) const {
+        // Wywoływane z zarezerwowanym kluczem, więc żadna równoległa wysyłka nie zapisuje go w tym czasie
+        if(clientMessageId.empty())
+            return std::nullopt;
+        const auto message = messageRepo->findByClientMessageId(senderId, clientMessageId);
+        if(!message.has_value())
+            return std::nullopt;
+        return SentMessage{message->messageId, message->sentAt};
+    }
+
+    std::optional<SentMessage> reserveClientMessageId(const std::string& key) {
+        // Wynik wcześniejszego wysłania z tym kluczem albo nullopt, gdy klucz został
+        // zarezerwowany dla tego wywołania (pusty klucz - bez idempotencji)
+        if(key.empty())
+            return std::nullopt;
+        std::unique_lock<std::mutex> lock(clientMessageIdsMutex);
+        while(true) {
+            const auto it = clientMessageIds.find(key);
+            if(it == clientMessageIds.end()) {
+                clientMessageIds.emplace(key, std::nullopt);
+                return std::nullopt;
+            }
+            if(it->second.has_value())
+                return it->second;
+            clientMessageIdsChanged.wait(lock);
+        }
+    }
+
+    void publishClientMessageId(const std::string& key, const SentMessage& sent) {
+        {
+            std::lock_guard<std::mutex> lock(clientMessageIdsMutex);
+            clientMessageIds.insert_or_assign(key, sent);
+            clientMessageIdsOrder.push_back(key);
+
+            // Usuwane są tylko opublikowane klucze - rezerwacji w toku nie ma w kolejce
+            while(clientMessageIdsOrder.size() > maxClientMessageIds) {
+                clientMessageIds.erase(clientMessageIdsOrder.front());
+                clientMessageIdsOrder.pop_front();
+            }
+        }
+        clientMessageIdsChanged.notify_all();
+    }
+
+    void releaseClientMessageId(const std::string& key) {
+        {
+            std::lock_guard<std::mutex> lock(clientMessageIdsMutex);
+            clientMessageIds.erase(key);
+        }
+        clientMessageIdsChanged.notify_all();
+    }
+
     void notifyGroupMembers(const Group& group, const UUIDv4::UUID& senderId, const Message& message) const {
         nlohmann::json notification;
         notification["type"] = "NEW_GROUP_MESSAGE";
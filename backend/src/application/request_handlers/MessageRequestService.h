@@ -34,12 +34,14 @@ public:
         if (groupIdStr.size() != 36)
             throw std::runtime_error("Invalid group ID");
 
-        const auto messageId = messageService->sendGroupMessage(userUUID, groupUuid, content);
+        const std::string clientMessageId = request.value("clientMessageId", "");
+        const auto sent = messageService->sendGroupMessage(userUUID, groupUuid, content, clientMessageId);
 
         json response;
         response["code"] = 200;
         response["message"] = "Group message sent successfully";
-        response["messageId"] = messageId.str();
+        response["messageId"] = sent.messageId.str();
+        response["sentAt"] = std::chrono::system_clock::to_time_t(sent.sentAt);
         return response;
     }
 };
@@ -129,12 +131,14 @@ public:
         if (!receiverUser.has_value())
             throw user_not_found_error();
 
-        const auto messageId = messageService->sendPrivateMessage(userUUID, receiverUser->uuid, content);
+        const std::string clientMessageId = request.value("clientMessageId", "");
+        const auto sent = messageService->sendPrivateMessage(userUUID, receiverUser->uuid, content, clientMessageId);
 
         json response;
         response["code"] = 200;
         response["message"] = "Private message sent successfully";
-        response["messageId"] = messageId.str();
+        response["messageId"] = sent.messageId.str();
+        response["sentAt"] = std::chrono::system_clock::to_time_t(sent.sentAt);
         return response;
     }
 };
@@ -224,12 +228,13 @@ public:
         if (groupIdStr.size() != 36)
             throw std::runtime_error("Invalid group ID");
 
-        const auto messageId = messageService->sendGroupMessage(userUUID, groupUuid, content);
+        const auto sent = messageService->sendGroupMessage(userUUID, groupUuid, content);
 
         json response;
         response["code"] = 200;
         response["message"] = "Message sent successfully";
-        response["messageId"] = messageId.str();
+        response["messageId"] = sent.messageId.str();
+        response["sentAt"] = std::chrono::system_clock::to_time_t(sent.sentAt);
         return response;
     }
 };
@@ -56,8 +56,12 @@ public:
                     const auto userId = JwtService::getUuidFromToken(token);
                     if (userId.has_value()) {
                         authenticatedUserId = userId;
-                        connectionManager->registerConnection(authenticatedUserId.value(), clientSocket);
-                        notificationService->sendPendingNotifications(authenticatedUserId.value());
+                        // Klient z kilkoma połączeniami oznacza dodatkowe "notifications": false -
+                        // powiadomienia zostają na połączeniu, które ostatnio je zamówiło
+                        if (request.value("notifications", true)) {
+                            connectionManager->registerConnection(authenticatedUserId.value(), clientSocket);
+                            notificationService->sendPendingNotifications(authenticatedUserId.value());
+                        }
                     }
                     else throw unauthorized_error();
                 }
@@ -18,6 +18,8 @@ struct Message {
     std::string content;
     std::chrono::system_clock::time_point sentAt;
     std::chrono::system_clock::time_point deliveredAt;
+    // Klucz idempotencji nadany przez klienta (pusty, gdy klient go nie podał)
+    std::string clientMessageId{};
 
      std::string getConversationId() const {
          if (type == MessageType::GROUP)
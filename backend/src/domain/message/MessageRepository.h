@@ -1,6 +1,7 @@
 #pragma once
 
 #include <chrono>
+#include <optional>
 
 #include "Message.h"
 #include "uuid_v4.h"
@@ -10,6 +11,11 @@ public:
     virtual ~MessageRepository() = default;
     virtual bool save(const Message& message) = 0;
 
+    virtual std::optional<Message> findByClientMessageId(
+        const UUIDv4::UUID& senderId,
+        const std::string& clientMessageId
+    ) = 0;
+
     virtual std::vector<Message> findMessagesByReceiverId(
         const UUIDv4::UUID& receiverId,
         const std::chrono::system_clock::time_point& since,
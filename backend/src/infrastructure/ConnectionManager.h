@@ -35,9 +35,14 @@ public:
         Logger::log(std::format("Registered connection for user {}", userId.str()), Logger::Level::INFO, Logger::Importance::LOW);
     }
 
-    void unregisterConnection(const UUIDv4::UUID& userId) {
+    void unregisterConnection(const UUIDv4::UUID& userId, const int socket) {
         std::lock_guard lock(connectionsMutex);
-        connections.erase(userId.str());
+        // Po ponownym połączeniu klienta stare gniazdo zamyka się później niż rejestruje nowe -
+        // nie wolno wtedy usunąć rejestracji nowego połączenia
+        const auto it = connections.find(userId.str());
+        if(it == connections.end() || it->second->socket != socket)
+            return;
+        connections.erase(it);
         Logger::log(std::format("Unregistered connection for user {}", userId.str()), Logger::Level::INFO, Logger::Importance::LOW);
     }
 
@@ -24,7 +24,7 @@ class FileMessageRepository final : public MessageRepository {
     static constexpr std::string DB_FILE = "messages.json";
 
     static nlohmann::json messageToJson(const Message& message) {
-        return {
+        nlohmann::json json = {
                 {"messageId", message.messageId.str()},
                 {"senderId", message.senderId.str()},
                 {"receiverId", message.receiverId.str()},
@@ -34,6 +34,9 @@ class FileMessageRepository final : public MessageRepository {
                 {"sentAt", std::chrono::system_clock::to_time_t(message.sentAt)},
                 {"deliveredAt", std::chrono::system_clock::to_time_t(message.deliveredAt)}
         };
+        if(!message.clientMessageId.empty())
+            json["clientMessageId"] = message.clientMessageId;
+        return json;
     }
 
     static std::optional<Message> jsonToMessage(const nlohmann::json& json) {
@@ -61,7 +64,8 @@ class FileMessageRepository final : public MessageRepository {
                 json.value("senderName", ""),
                 json.value("content", ""),
                 std::chrono::system_clock::from_time_t(json.value("sentAt", static_cast<std::time_t>(0))),
-                std::chrono::system_clock::from_time_t(json.value("deliveredAt", static_cast<std::time_t>(0)))
+                std::chrono::system_clock::from_time_t(json.value("deliveredAt", static_cast<std::time_t>(0))),
+                json.value("clientMessageId", "")
             };
         } catch (...) {
             return std::nullopt;
@@ -112,6 +116,19 @@ public:
         return true;
     }
 
+    std::optional<Message> findByClientMessageId(const UUIDv4::UUID &senderId,
+        const std::string &clientMessageId) override {
+        const auto data = loadData();
+        const auto senderIdStr = senderId.str();
+
+        for(const auto& item : data) {
+            if(item.value("clientMessageId", "") == clientMessageId && item.value("senderId", "") == senderIdStr)
+                return jsonToMessage(item);
+        }
+
+        return std::nullopt;
+    }
+
     std::vector<Message> findMessagesByReceiverId(const UUIDv4::UUID &receiverId,
         const std::chrono::system_clock::time_point &since, size_t limit, size_t offset) override {
         auto data = loadData();
@@ -0,0 +1,71 @@
+#pragma once
+
+#include <cstddef>
+#include <optional>
+#include <string>
+
+// Dzieli strumień bajtów z gniazda na kolejne obiekty JSON. Jedno recv() może zawierać
+// fragment żądania albo kilka żądań naraz (klient wysyła je potokowo, zakończone '\n'),
+// więc nie można zakładać, że jeden odczyt to jedno żądanie.
+class RequestFramer {
+    std::string buffer;
+    size_t maxFrameSize;
+
+public:
+    explicit RequestFramer(const size_t maxFrameSize = 1024 * 1024) : maxFrameSize(maxFrameSize) {}
+
+    void append(const char* data, const size_t size) {
+        buffer.append(data, size);
+    }
+
+    bool overflowed() const {
+        return buffer.size() > maxFrameSize;
+    }
+
+    // Zwraca kolejną kompletną ramkę albo nullopt, jeśli trzeba doczytać dane
+    std::optional<std::string> next() {
+        const size_t start = buffer.find_first_not_of(" \t\r\n");
+        if(start == std::string::npos) {
+            buffer.clear();
+            return std::nullopt;
+        }
+
+        if(buffer[start] != '{') {
+            // Śmieci przed żądaniem - oddajemy je do końca linii, żeby parser zgłosił błąd
+            const size_t end = buffer.find('\n', start);
+            if(end == std::string::npos)
+                return std::nullopt;
+            std::string frame = buffer.substr(start, end - start);
+            buffer.erase(0, end + 1);
+            return frame;
+        }
+
+        int depth = 0;
+        bool inString = false;
+        bool escaped = false;
+        for(size_t i = start; i < buffer.size(); ++i) {
+            const char c = buffer[i];
+            if(inString) {
+                if(escaped)
+                    escaped = false;
+                else if(c == '\\')
+                    escaped = true;
+                else if(c == '"')
+                    inString = false;
+                continue;
+            }
+
+            if(c == '"')
+                inString = true;
+            else if(c == '{')
+                ++depth;
+            else if(c == '}' && --depth == 0) {
+                std::string frame = buffer.substr(start, i + 1 - start);
+                buffer.erase(0, i + 1);
+                return frame;
+            }
+        }
+
+        return std::nullopt;
+    }
+};
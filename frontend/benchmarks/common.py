@@ -0,0 +1,51 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Optional
+
+
+def peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak // 1024
+    return peak
+
+
+def measure(name: str, size: int, fn: Callable[[], Optional[dict]]) -> dict:
+    start = time.perf_counter()
+    extra = fn() or {}
+    wall = time.perf_counter() - start
+
+    record = {
+        "case": name,
+        "size": size,
+        "wall_s": round(wall, 6),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    record.update(extra)
+    return record
+
+
+def run_isolated(module: str, case: str, size: int, extra_args: Optional[list[str]] = None) -> dict:
+    # Każdy przypadek w osobnym procesie, żeby szczytowe RSS nie sumowało się między pomiarami
+    cmd = [sys.executable, "-m", module, "--case", case, "--size", str(size)] + (extra_args or [])
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"case": case, "size": size, "error": result.stderr.strip().splitlines()[-1:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def write_results(records: list[dict], output: Optional[str]):
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    for record in records:
+        record.setdefault("timestamp", stamp)
+        print(json.dumps(record))
+
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
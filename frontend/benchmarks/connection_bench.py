@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import measure, run_isolated, write_results
+from tools.dialer import ResolverCache
+from tools.metrics import Metrics
+from tools.tcp_client import TCPClient, Priority, SendQueueFull
+
+DEFAULT_CASES = {
+    "flap_server_close": [2000],
+    "flap_forced_reconnect": [2000],
+    "send_failing_callback": [10000],
+    "reconnect_fast_retry": [20],
+    "reconnect_backoff": [20],
+    "connect_blackholed_first": [10],
+    "connect_blackholed_sequential": [10],
+    "recv_small_frames": [200000],
+    "recv_large_frames": [50],
+}
+
+WARMUP_FLAPS = 50
+# Dopuszczalny przyrost pamięci po rozgrzewce (metryki, bufory logowania)
+MEMORY_SLACK_KB = 256
+# Serwer, generator ruchu, nadzorca połączenia oraz wątki odbioru i wysyłania
+BENCH_THREADS = 5
+# Powiadomienie o nowej wiadomości i odpowiedź z historią rozmowy
+SMALL_FRAME_BYTES = 200
+LARGE_FRAME_BYTES = 1024 * 1024
+
+
+class FlappingServer:
+    # Serwer, który zamyka każde połączenie od razu po przyjęciu (close_immediately)
+    # albo trzyma otwarte tylko ostatnie z nich
+    def __init__(self, close_immediately: bool):
+        self.close_immediately = close_immediately
+        self.accepted = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(128)
+        self.port = self._sock.getsockname()[1]
+        self._last = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            self.accepted += 1
+            if self._last is not None:
+                self._last.close()
+            if self.close_immediately:
+                conn.close()
+            else:
+                self._last = conn
+
+    def reset(self):
+        if self._last is not None:
+            self._last.close()
+            self._last = None
+
+    def close(self):
+        self._sock.shutdown(socket.SHUT_RDWR)
+        self._sock.close()
+        self._thread.join()
+        if self._last is not None:
+            self._last.close()
+
+
+class Traffic:
+    # Ciągłe wysyłanie w tle w trakcie zrywania połączeń
+    def __init__(self, client: TCPClient):
+        self.client = client
+        self.sent = 0
+        self.rejected = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        payload = b"x" * 256
+        while self._running:
+            try:
+                self.client.send(payload, priority=Priority.BACKGROUND)
+                self.sent += 1
+            except SendQueueFull:
+                self.rejected += 1
+            time.sleep(0.0005)
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+
+def flap(size: int, close_immediately: bool) -> dict:
+    logging.disable(logging.CRITICAL)
+    baseline_threads = threading.active_count()
+
+    server = FlappingServer(close_immediately)
+    client = TCPClient("127.0.0.1", server.port, reconnect_delay=0.001, heartbeat_interval=0, metrics=Metrics())
+    client.connect()
+    traffic = Traffic(client)
+
+    def wait_for_generation(target: int, deadline: float):
+        while client.generation < target and time.monotonic() < deadline:
+            if not close_immediately and client.is_connected:
+                client.reconnect()
+            time.sleep(0.0005)
+
+    tracemalloc.start()
+    wait_for_generation(WARMUP_FLAPS, time.monotonic() + 30)
+    threads_after_warmup = threading.active_count()
+    memory_after_warmup = tracemalloc.get_traced_memory()[0]
+
+    max_threads = threads_after_warmup
+    deadline = time.monotonic() + 300
+    target = WARMUP_FLAPS + size
+    while client.generation < target and time.monotonic() < deadline:
+        wait_for_generation(min(client.generation + 10, target), deadline)
+        max_threads = max(max_threads, threading.active_count())
+
+    threads_at_end = threading.active_count()
+    memory_at_end = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    flaps = client.generation - WARMUP_FLAPS
+    traffic.stop()
+    client.disconnect()
+    server.close()
+    threads_after_close = threading.active_count()
+
+    memory_growth_kb = round((memory_at_end - memory_after_warmup) / 1024, 1)
+    snapshot = client.metrics.snapshot()
+    return {
+        "flaps": flaps,
+        "threads_after_warmup": threads_after_warmup,
+        "threads_max": max_threads,
+        "threads_at_end": threads_at_end,
+        "threads_leaked": threads_after_close - baseline_threads,
+        "workers_leaked": snapshot["counters"].get("tcp.workers_leaked", 0),
+        "memory_growth_kb": memory_growth_kb,
+        "frames_sent": traffic.sent,
+        "frames_rejected": traffic.rejected,
+        "ok": (
+            flaps >= size
+            and max_threads <= baseline_threads + BENCH_THREADS
+            and threads_after_close == baseline_threads
+            and memory_growth_kb < MEMORY_SLACK_KB
+        ),
+    }
+
+
+class CountingServer:
+    # Przyjmuje jedno połączenie i liczy odebrane bajty
+    def __init__(self):
+        self.received = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(1)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            conn, _ = self._sock.accept()
+        except OSError:
+            return
+        with conn:
+            while chunk := conn.recv(65536):
+                self.received += len(chunk)
+
+    def close(self):
+        self._sock.close()
+
+
+FAILING_CALLBACK_EVERY = 10
+
+
+def send_failing_callback(size: int) -> dict:
+    # Callbacki wysłanych ramek rzucają wyjątkiem (co FAILING_CALLBACK_EVERY ramka i pierwsze
+    # on_frame_sent) - wątek wysyłania ma działać dalej, a wszystkie ramki dojść do serwera
+    logging.disable(logging.CRITICAL)
+    server = CountingServer()
+    client = TCPClient("127.0.0.1", server.port, heartbeat_interval=0, auto_reconnect=False, metrics=Metrics())
+    client.connect()
+    generation = client.generation
+    failed = []
+
+    def on_frame_sent(frame):
+        if not failed:
+            failed.append(frame)
+            raise ValueError("on_frame_sent")
+
+    def failing_callback():
+        raise ValueError("on_sent")
+
+    client.on_frame_sent = on_frame_sent
+    payload = b"x" * 256
+    # Martwy wątek wysyłania zostawia pełną kolejkę - limit czasu zamiast czekania bez końca
+    deadline = time.monotonic() + 60
+    for i in range(size):
+        while time.monotonic() < deadline:
+            try:
+                client.send(payload, on_sent=failing_callback if i % FAILING_CALLBACK_EVERY == 0 else None)
+                break
+            except SendQueueFull:
+                time.sleep(0.001)
+
+    while server.received < size * len(payload) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    workers_alive = sum(thread.name.startswith("tcp-send") and thread.is_alive() for thread in threading.enumerate())
+    connected = client.is_connected and client.generation == generation
+    client.disconnect()
+    server.close()
+    return {
+        "frames": size,
+        "bytes_received": server.received,
+        "send_workers_alive": workers_alive,
+        "ok": server.received == size * len(payload) and connected and workers_alive == 1,
+    }
+
+
+class BlackholeServer:
+    # Gniazdo nasłuchujące z zapełnioną kolejką połączeń - kolejne SYN-y są gubione,
+    # więc connect() wisi do timeoutu jak przy niedostępnym adresie
+    def __init__(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(0)
+        self.port = self._sock.getsockname()[1]
+        self._fillers = []
+        for _ in range(3):
+            filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            filler.setblocking(False)
+            filler.connect_ex(("127.0.0.1", self.port))
+            self._fillers.append(filler)
+        time.sleep(0.1)
+
+    def close(self):
+        for filler in self._fillers:
+            filler.close()
+        self._sock.close()
+
+
+def percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+        "p90_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.9))] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def reconnect_after_reset(size: int, fast_retry: bool) -> dict:
+    # Czas od zerwania działającego połączenia przez serwer do ponownego CONNECTED
+    logging.disable(logging.CRITICAL)
+    server = FlappingServer(close_immediately=False)
+    client = TCPClient(
+        "127.0.0.1", server.port, reconnect_delay=0.2, max_reconnect_delay=2.0,
+        heartbeat_interval=0, metrics=Metrics(), fast_retry=fast_retry
+    )
+    client.connect()
+
+    samples = []
+    for _ in range(size):
+        # Połączenie musi chwilę działać, żeby jego utrata liczyła się jako chwilowy reset
+        time.sleep(client.reconnect_delay + 0.05)
+        generation = client.generation
+        started_at = time.monotonic()
+        server.reset()
+        while client.generation == generation or not client.is_connected:
+            time.sleep(0.0005)
+        samples.append(time.monotonic() - started_at)
+
+    client.disconnect()
+    server.close()
+    return dict(percentiles(samples), fast_retries=client.metrics.snapshot()["counters"].get("tcp.reconnect.fast_retries", 0))
+
+
+def connect_blackholed_first(size: int, stagger: float) -> dict:
+    # Pierwszy adres z DNS nie odpowiada; drugi działa
+    logging.disable(logging.CRITICAL)
+    blackhole = BlackholeServer()
+    server = FlappingServer(close_immediately=False)
+    resolver = ResolverCache()
+    addresses = [
+        (socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("127.0.0.1", blackhole.port)),
+        (socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("127.0.0.1", server.port)),
+    ]
+
+    samples = []
+    for _ in range(size):
+        resolver.put("bench.invalid", server.port, addresses)
+        client = TCPClient(
+            "bench.invalid", server.port, heartbeat_interval=0, connection_timeout=3.0,
+            auto_reconnect=False, resolver=resolver, connect_stagger=stagger
+        )
+        started_at = time.monotonic()
+        connected = client.connect()
+        samples.append(time.monotonic() - started_at)
+        client.disconnect()
+        if not connected:
+            break
+
+    server.close()
+    blackhole.close()
+    return dict(percentiles(samples), connected=len(samples) == size)
+
+
+class StreamingServer:
+    # Serwer, który po przyjęciu połączenia wysyła gotowy strumień ramek i czeka na zamknięcie
+    def __init__(self, payload: bytes):
+        self.payload = payload
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(1)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        conn, _ = self._sock.accept()
+        try:
+            conn.sendall(self.payload)
+            conn.recv(1)
+        except OSError:
+            pass
+        conn.close()
+
+    def close(self):
+        self._sock.close()
+
+
+def stream_frames(count: int, frame_bytes: int) -> dict:
+    frame = b'{"type":"NEW_PRIVATE_MESSAGE","content":"' + b"x" * max(0, frame_bytes - 44) + b'"}\n'
+    server = StreamingServer(frame * count)
+    client = TCPClient("127.0.0.1", server.port, heartbeat_interval=0, auto_reconnect=False, metrics=Metrics())
+    received = [0, 0]
+    done = threading.Event()
+
+    def on_message(data: memoryview):
+        received[0] += 1
+        received[1] += len(data) + 1
+        if received[0] == count:
+            done.set()
+
+    client.on_message = on_message
+    started_at = time.perf_counter()
+    client.connect()
+    done.wait(300)
+    elapsed = time.perf_counter() - started_at
+    client.disconnect()
+    server.close()
+
+    counters = client.metrics.snapshot()["counters"]
+    return {
+        "frames": received[0],
+        "elapsed_s": elapsed,
+        "mb_per_s": round(received[1] / elapsed / (1024 * 1024), 1),
+        "recv_calls_per_frame": round(counters.get("tcp.recv_calls", 0) / max(1, received[0]), 3),
+        "buffer_allocs_per_frame": round(counters.get("tcp.recv_buffer.resizes", 0) / max(1, received[0]), 4),
+        "ok": received[0] == count and received[1] == len(frame) * count,
+    }
+
+
+def recv_throughput(size: int, frame_bytes: int) -> dict:
+    # Przepustowość mierzona bez tracemalloc; przydział pamięci w osobnym, krótszym przebiegu,
+    # bo śledzenie alokacji spowalnia odbiór kilkukrotnie
+    logging.disable(logging.CRITICAL)
+    result = stream_frames(size, frame_bytes)
+
+    traced = max(1, size // 10)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    stream_frames(traced, frame_bytes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # Strumień ramek serwera jest alokowany w tym samym procesie - nie wliczamy go
+    result["peak_alloc_kb"] = round((peak - baseline - traced * (frame_bytes + 1)) / 1024, 1)
+    result.pop("elapsed_s")
+    return result
+
+
+def bench_flap_server_close(size: int) -> dict:
+    return measure("flap_server_close", size, lambda: flap(size, close_immediately=True))
+
+
+def bench_flap_forced_reconnect(size: int) -> dict:
+    return measure("flap_forced_reconnect", size, lambda: flap(size, close_immediately=False))
+
+
+def bench_send_failing_callback(size: int) -> dict:
+    return measure("send_failing_callback", size, lambda: send_failing_callback(size))
+
+
+def bench_reconnect_fast_retry(size: int) -> dict:
+    return measure("reconnect_fast_retry", size, lambda: reconnect_after_reset(size, fast_retry=True))
+
+
+def bench_reconnect_backoff(size: int) -> dict:
+    return measure("reconnect_backoff", size, lambda: reconnect_after_reset(size, fast_retry=False))
+
+
+def bench_connect_blackholed_first(size: int) -> dict:
+    return measure("connect_blackholed_first", size, lambda: connect_blackholed_first(size, stagger=0.25))
+
+
+def bench_connect_blackholed_sequential(size: int) -> dict:
+    # Kolejny adres dopiero po 2 s bez odpowiedzi poprzedniego - jak łączenie po kolei
+    return measure("connect_blackholed_sequential", size, lambda: connect_blackholed_first(size, stagger=2.0))
+
+
+def bench_recv_small_frames(size: int) -> dict:
+    return measure("recv_small_frames", size, lambda: recv_throughput(size, SMALL_FRAME_BYTES))
+
+
+def bench_recv_large_frames(size: int) -> dict:
+    return measure("recv_large_frames", size, lambda: recv_throughput(size, LARGE_FRAME_BYTES))
+
+
+CASES = {
+    "flap_server_close": bench_flap_server_close,
+    "flap_forced_reconnect": bench_flap_forced_reconnect,
+    "send_failing_callback": bench_send_failing_callback,
+    "reconnect_fast_retry": bench_reconnect_fast_retry,
+    "reconnect_backoff": bench_reconnect_backoff,
+    "connect_blackholed_first": bench_connect_blackholed_first,
+    "connect_blackholed_sequential": bench_connect_blackholed_sequential,
+    "recv_small_frames": bench_recv_small_frames,
+    "recv_large_frames": bench_recv_large_frames,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reComm :: benchmarki połączenia TCP")
+    parser.add_argument("--case", choices=sorted(CASES), help="Uruchom pojedynczy przypadek w bieżącym procesie")
+    parser.add_argument("--size", type=int, help="Rozmiar dla --case")
+    parser.add_argument("--sizes", type=str, help="Nadpisz rozmiary dla wszystkich przypadków, np. 1000,5000")
+    parser.add_argument("--only", type=str, help="Lista przypadków oddzielona przecinkami")
+    parser.add_argument("--output", type=str, help="Dopisz wyniki (JSONL) do pliku")
+    args = parser.parse_args()
+
+    if args.case:
+        record = CASES[args.case](args.size or DEFAULT_CASES[args.case][0])
+        write_results([record], None)
+        return
+
+    selected = args.only.split(",") if args.only else list(DEFAULT_CASES)
+    records = []
+    for case in selected:
+        sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else DEFAULT_CASES[case]
+        for size in sizes:
+            records.append(run_isolated("benchmarks.connection_bench", case, size))
+
+    write_results(records, args.output)
+    sys.exit(0 if all(record.get("ok", True) and "error" not in record for record in records) else 1)
+
+
+if __name__ == "__main__":
+    main()
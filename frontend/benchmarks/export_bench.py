@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import argparse
+import heapq
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import measure, run_isolated, write_results
+from tools.bot import Bot
+from tools.history_export import HistoryExporter
+
+DEFAULT_CASES = {
+    "export_sequential": [50000],
+    "export_parallel": [50000],
+    "export_memory": [50000],
+}
+
+CONVERSATIONS = 50
+PARALLEL = 8
+# Czas obiegu do serwera - eksport jest ograniczony opóźnieniem, a nie przepustowością
+LATENCY = 0.005
+
+
+class LatencyServer:
+    # Serwer historii, który odpowiada po stałym opóźnieniu, ale nie czeka z przyjęciem
+    # kolejnego żądania na poprzednią odpowiedź - jak backend za łączem o danym RTT
+    def __init__(self, conversations: dict[str, list[dict]], latency: float):
+        self.conversations = conversations
+        self.latency = latency
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(8)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        responses: list = []
+        ready = threading.Condition()
+        sequence = [0]
+
+        def send_loop():
+            while True:
+                with ready:
+                    while not responses or responses[0][0] > time.monotonic():
+                        ready.wait(responses[0][0] - time.monotonic() if responses else None)
+                    _, _, payload = heapq.heappop(responses)
+                if payload is None:
+                    return
+                try:
+                    conn.sendall(payload)
+                except OSError:
+                    return
+
+        threading.Thread(target=send_loop, daemon=True).start()
+        buffer = b""
+        while True:
+            try:
+                data = conn.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                with ready:
+                    heapq.heappush(responses, (time.monotonic(), sequence[0], None))
+                    ready.notify()
+                conn.close()
+                return
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                payload = (json.dumps(self.handle(json.loads(line))) + "\n").encode("utf-8")
+                with ready:
+                    sequence[0] += 1
+                    heapq.heappush(responses, (time.monotonic() + self.latency, sequence[0], payload))
+                    ready.notify()
+
+    def handle(self, request: dict) -> dict:
+        body = request.get("body", {})
+        if request["method"] == "AUTH":
+            return {"code": 200, "token": "bench"}
+        if request["method"] == "GET_PRIVATE_MESSAGES":
+            messages = self.conversations[body["otherUsername"]]
+            return {"code": 200, "messages": messages[body["offset"]:body["offset"] + body["limit"]]}
+        return {"code": 404, "message": "Not found"}
+
+    def close(self):
+        self._sock.close()
+
+
+def generate(size: int) -> dict[str, list[dict]]:
+    per_conversation = size // CONVERSATIONS
+    conversations = {}
+    for conversation in range(CONVERSATIONS):
+        target = f"user{conversation}"
+        conversations[target] = [
+            {
+                "type": "PRIVATE",
+                "messageId": f"{target}-{i}",
+                "senderName": target if i % 2 else "bench",
+                "content": f"wiadomość {i} w rozmowie {conversation}",
+                "sentAt": 1700000000 + (per_conversation - i) * 60,
+            }
+            for i in range(per_conversation)
+        ]
+    return conversations
+
+
+def export(size: int, parallel: int, trace_memory: bool = False) -> dict:
+    logging.disable(logging.CRITICAL)
+    conversations = generate(size)
+    server = LatencyServer(conversations, LATENCY)
+    directory = tempfile.mkdtemp(prefix="recomm-export-")
+    bot = Bot("127.0.0.1", server.port).start("bench", "bench")
+    exporter = HistoryExporter(bot.api_service, directory, parallel=parallel, compress=True)
+    if trace_memory:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+    started_at = time.perf_counter()
+    results = list(exporter.export(("user", target) for target in conversations))
+    elapsed = time.perf_counter() - started_at
+    result = {
+        "messages_per_s": round(size / elapsed),
+        "ok": sum(r["messages"] for r in results) == size and all(r["done"] for r in results),
+    }
+    if trace_memory:
+        result["peak_alloc_kb"] = round((tracemalloc.get_traced_memory()[1] - baseline) / 1024, 1)
+        tracemalloc.stop()
+    bot.close()
+    server.close()
+    return result
+
+
+def bench_export_sequential(size: int) -> dict:
+    return measure("export_sequential", size, lambda: export(size, 1))
+
+
+def bench_export_parallel(size: int) -> dict:
+    return measure("export_parallel", size, lambda: export(size, PARALLEL))
+
+
+def bench_export_memory(size: int) -> dict:
+    # Szczyt alokacji nie powinien rosnąć z rozmiarem eksportu (porównaj --sizes 10000,100000)
+    return measure("export_memory", size, lambda: export(size, PARALLEL, trace_memory=True))
+
+
+CASES = {
+    "export_sequential": bench_export_sequential,
+    "export_parallel": bench_export_parallel,
+    "export_memory": bench_export_memory,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reComm :: benchmarki eksportu historii")
+    parser.add_argument("--case", choices=sorted(CASES), help="Uruchom pojedynczy przypadek w bieżącym procesie")
+    parser.add_argument("--size", type=int, help="Rozmiar dla --case")
+    parser.add_argument("--sizes", type=str, help="Nadpisz rozmiary dla wszystkich przypadków, np. 10000,100000")
+    parser.add_argument("--only", type=str, help="Lista przypadków oddzielona przecinkami")
+    parser.add_argument("--output", type=str, help="Dopisz wyniki (JSONL) do pliku")
+    args = parser.parse_args()
+
+    if args.case:
+        record = CASES[args.case](args.size or DEFAULT_CASES[args.case][0])
+        write_results([record], None)
+        return
+
+    selected = args.only.split(",") if args.only else list(DEFAULT_CASES)
+    records = []
+    for case in selected:
+        sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else DEFAULT_CASES[case]
+        for size in sizes:
+            records.append(run_isolated("benchmarks.export_bench", case, size))
+
+    write_results(records, args.output)
+    sys.exit(0 if all(record.get("ok", True) and "error" not in record for record in records) else 1)
+
+
+if __name__ == "__main__":
+    main()
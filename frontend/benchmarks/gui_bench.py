@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+from queue import Queue
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("RECOMM_DATA_DIR", tempfile.mkdtemp(prefix="recomm_bench_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QEvent
+from PyQt6.QtWidgets import QApplication
+
+from benchmarks.common import measure, peak_rss_kb, run_isolated, write_results
+from tools.api_service import ConnectionStatus
+from tools.change_feed import ChangeFeed
+from tools.message_archive import MessageArchive
+from tools.metrics import Metrics
+from tools.outbox import Outbox
+from tools.tcp_client import ConnectionState
+from tools.tracing import Tracer
+
+DEFAULT_CASES = {
+    "chat_add_message": [1000, 10000, 100000],
+    "chat_merge_messages": [1000, 10000],
+    "load_friends": [1000, 5000],
+    "load_groups": [1000, 5000],
+    "switch_conversation": [50],
+    "notification_burst": [1000, 10000],
+    "chat_long_session": [20000, 100000],
+    "group_settings_open": [1000, 20000, 100000],
+    "group_members_filter": [100000],
+}
+
+HISTORY_SIZE = 100
+
+
+class BenchTcpClient:
+    is_connected = True
+
+    def disconnect(self):
+        pass
+
+
+class BenchApiService:
+    def __init__(self, friends: int = 10, groups: int = 10, pending: int = 0, history: int = HISTORY_SIZE):
+        self.metrics = Metrics()
+        self.tracer = Tracer()
+        self.tcp_client = BenchTcpClient()
+        self.notification_queue: Queue = Queue()
+        self.token = "bench"
+        self.backpressure = False
+        self.on_backpressure = None
+        self.on_connection_status = None
+        self.change_feed = ChangeFeed(lambda since: {"code": 400}, lambda: ([], [], []), self.metrics)
+        self.friends = [f"friend{i}" for i in range(friends)]
+        self.pending = [{"from": f"requester{i}"} for i in range(pending)]
+        self.groups = [{"id": f"group-{i:08d}", "name": f"Grupa {i}"} for i in range(groups)]
+        self.history = history
+        self.group_members: list[str] = []
+        self.message_archive = None
+
+    def disconnect(self):
+        self.tcp_client.disconnect()
+        if self.message_archive:
+            self.message_archive.close()
+
+    def subscribe_changes(self):
+        return False
+
+    def connection_status(self):
+        return ConnectionStatus(ConnectionState.CONNECTED, None, 0, None, 0)
+
+    def background(self):
+        return contextlib.nullcontext()
+
+    def watch_conversation(self, kind, target, last_seen=0):
+        pass
+
+    def unwatch_conversation(self, kind, target):
+        pass
+
+    def open_outbox(self, path, on_change=None):
+        self.outbox = Outbox(path)
+        self.outbox.on_change = on_change
+        return self.outbox
+
+    def open_message_archive(self, path):
+        self.message_archive = MessageArchive(path)
+        return self.message_archive
+
+    def get_all_friends(self):
+        return list(self.friends)
+
+    def get_pending_friend_requests(self):
+        return list(self.pending)
+
+    def get_all_users_groups(self):
+        return list(self.groups)
+
+    def _messages(self, correspondent: str) -> list:
+        return [
+            {
+                "messageId": f"{correspondent}-{i}",
+                "senderName": correspondent if i % 2 else "bench",
+                "content": f"Wiadomość {i}",
+                "sentAt": 1700000000 + i,
+            }
+            for i in range(self.history)
+        ]
+
+    def get_private_messages(self, correspondent_username: str, *args, **kwargs):
+        return self._messages(correspondent_username)
+
+    def get_group_messages(self, group_id: str, *args, **kwargs):
+        return self._messages(group_id)
+
+    def get_group_members(self, group_id: str, limit=None, offset=0):
+        members = self.group_members if limit is None else self.group_members[offset:offset + limit]
+        return [{"uuid": name, "username": name} for name in members]
+
+
+def widget_count() -> int:
+    return len(QApplication.allWidgets())
+
+
+def drain_events(app: QApplication):
+    app.processEvents()
+    # deleteLater() nie jest realizowane przez processEvents() poza pętlą zdarzeń
+    app.sendPostedEvents(None, QEvent.Type.DeferredDelete.value)
+    app.processEvents()
+
+
+def make_window(api: BenchApiService):
+    from gui.main_window import MainWindow
+
+    window = MainWindow(api, {"username": "bench"})
+    window.friends_timer.stop()
+    window.groups_timer.stop()
+    window.resize(1024, 768)
+    window.show()
+    return window
+
+
+def close_window(window):
+    window.notification_worker.stop()
+    window.notification_thread.join(timeout=2.0)
+
+
+def bench_chat_add_message(app: QApplication, size: int) -> dict:
+    from gui.widget.chat import ChatWidget
+
+    chat = ChatWidget("friend", "bench")
+    chat.resize(600, 800)
+    chat.show()
+    drain_events(app)
+
+    def run():
+        for i in range(size):
+            chat.add_message("friend" if i % 2 else "bench", f"Wiadomość {i}", i % 2 == 0)
+        drain_events(app)
+        return {"widgets": widget_count()}
+
+    return measure("chat_add_message", size, run)
+
+
+def bench_chat_merge_messages(app: QApplication, size: int) -> dict:
+    # Strony historii w odwrotnej kolejności przeplatane z powiadomieniami, z których
+    # co dziesiąte powtarza wiadomość z historii
+    from gui.widget.chat import ChatWidget
+
+    chat = ChatWidget("friend", "bench")
+    chat.resize(600, 800)
+    chat.show()
+    drain_events(app)
+
+    rng = random.Random(size)
+    messages = [(f"id-{i}", i // 3) for i in range(size)]
+    pages = [messages[i:i + HISTORY_SIZE] for i in range(0, size, HISTORY_SIZE)]
+    notifications = rng.sample(messages, size // 10)
+
+    def run():
+        for page in reversed(pages):
+            for message_id, sent_at in page:
+                chat.add_message("friend", message_id, False, message_id=message_id, sent_at=sent_at)
+            for _ in range(len(page) // 10):
+                message_id, sent_at = notifications.pop()
+                chat.add_message("friend", message_id, False, message_id=message_id, sent_at=sent_at)
+        drain_events(app)
+
+        layout = chat.messages_layout
+        shown = [layout.itemAt(i).widget().sent_at for i in range(layout.count())]
+        return {"widgets": widget_count(), "shown": layout.count(), "ordered": shown == sorted(shown)}
+
+    return measure("chat_merge_messages", size, run)
+
+
+def bench_load_friends(app: QApplication, size: int) -> dict:
+    api = BenchApiService(friends=0)
+    window = make_window(api)
+    drain_events(app)
+
+    api.friends = [f"friend{i}" for i in range(size)]
+    api.pending = [{"from": f"requester{i}"} for i in range(max(1, size // 100))]
+
+    def run():
+        window.load_friends()
+        drain_events(app)
+        poll_start = time.perf_counter()
+        window.load_friends()
+        return {"widgets": widget_count(), "poll_unchanged_s": round(time.perf_counter() - poll_start, 6)}
+
+    record = measure("load_friends", size, run)
+    close_window(window)
+    return record
+
+
+def bench_load_groups(app: QApplication, size: int) -> dict:
+    api = BenchApiService(groups=0)
+    window = make_window(api)
+    drain_events(app)
+
+    api.groups = [{"id": f"group-{i:08d}", "name": f"Grupa {i}"} for i in range(size)]
+
+    def run():
+        window.load_groups()
+        drain_events(app)
+        poll_start = time.perf_counter()
+        window.load_groups()
+        return {"widgets": widget_count(), "poll_unchanged_s": round(time.perf_counter() - poll_start, 6)}
+
+    record = measure("load_groups", size, run)
+    close_window(window)
+    return record
+
+
+def bench_switch_conversation(app: QApplication, size: int) -> dict:
+    api = BenchApiService(friends=20)
+    window = make_window(api)
+    drain_events(app)
+
+    def run():
+        for i in range(size):
+            item = window.friends_list.item(i % window.friends_list.count())
+            window.on_friend_clicked(item)
+            drain_events(app)
+        return {"widgets": widget_count(), "history": api.history}
+
+    record = measure("switch_conversation", size, run)
+    close_window(window)
+    return record
+
+
+def bench_notification_burst(app: QApplication, size: int) -> dict:
+    api = BenchApiService(friends=1, history=0)
+    window = make_window(api)
+    window.on_friend_clicked(window.friends_list.item(0))
+    drain_events(app)
+    layout = window.chat_widget.messages_layout
+
+    def run():
+        for i in range(size):
+            api.notification_queue.put({
+                "type": "NEW_PRIVATE_MESSAGE",
+                "messageId": f"burst-{i}",
+                "senderName": "friend0",
+                "content": f"Powiadomienie {i}",
+                "sentAt": 1700000000 + i,
+            })
+        # Okno czatu trzyma tylko ograniczoną liczbę wiadomości - starsze są w archiwum
+        chat = window.chat_widget
+        last = f"burst-{size - 1}"
+        deadline = time.perf_counter() + 600
+        while last not in chat.store and time.perf_counter() < deadline:
+            # Usuwanie wypchniętych widgetów, jak w pętli zdarzeń aplikacji
+            drain_events(app)
+            time.sleep(0)
+        drain_events(app)
+        archived = window.message_archive.count("user", "friend0")
+        return {"widgets": widget_count(), "delivered": layout.count() + archived, "resident": layout.count()}
+
+    record = measure("notification_burst", size, run)
+    close_window(window)
+    return record
+
+
+def bench_chat_long_session(app: QApplication, size: int) -> dict:
+    # Wiadomości przychodzące w otwartej rozmowie przez długą sesję: RSS po drugiej połowie
+    # nie powinien rosnąć, a przewinięcie do góry wczytuje wypchnięte strony z archiwum
+    from gui.widget.chat import ChatWidget
+
+    archive = MessageArchive(os.path.join(os.environ["RECOMM_DATA_DIR"], "bench_messages.sqlite3"))
+    chat = ChatWidget("friend", "bench", archive=archive, conversation=("user", "friend"))
+    chat.resize(600, 800)
+    chat.show()
+    drain_events(app)
+
+    def run():
+        rss_half = 0
+        for i in range(size):
+            chat.add_message(
+                "friend" if i % 2 else "bench", f"Wiadomość {i}", i % 2 == 0,
+                message_id=f"long-{i}", sent_at=1700000000 + i
+            )
+            if i % 500 == 499:
+                drain_events(app)
+            if i == size // 2:
+                rss_half = peak_rss_kb()
+        drain_events(app)
+        rss_growth_kb = peak_rss_kb() - rss_half
+
+        page_start = time.perf_counter()
+        chat.load_older()
+        drain_events(app)
+        page_load_s = time.perf_counter() - page_start
+        return {
+            "widgets": widget_count(),
+            "resident": len(chat.store),
+            "archived": archive.count("user", "friend"),
+            "rss_growth_kb": rss_growth_kb,
+            "page_load_s": round(page_load_s, 6),
+        }
+
+    record = measure("chat_long_session", size, run)
+    archive.close()
+    return record
+
+
+def open_group_settings(app: QApplication, size: int):
+    from gui.dialog.group_settings import GroupSettingsDialog
+
+    api = BenchApiService()
+    api.group_members = ["bench"] + [f"członek{i:06d}" for i in range(size - 1)]
+    started_at = time.perf_counter()
+    dialog = GroupSettingsDialog("group-bench", "Grupa", "bench", "bench", api)
+    dialog.show()
+    app.processEvents()
+    open_s = time.perf_counter() - started_at
+    while dialog.loading:
+        app.processEvents()
+        time.sleep(0.001)
+    return dialog, open_s, time.perf_counter() - started_at
+
+
+def bench_group_settings_open(app: QApplication, size: int) -> dict:
+    # open_s - do pierwszego narysowania okna, loaded_s - do wczytania wszystkich stron członków
+    def run():
+        dialog, open_s, loaded_s = open_group_settings(app, size)
+        result = {
+            "open_s": round(open_s, 6),
+            "loaded_s": round(loaded_s, 6),
+            "members": len(dialog.members),
+            "widgets": widget_count(),
+        }
+        dialog.reject()
+        return result
+
+    return measure("group_settings_open", size, run)
+
+
+def bench_group_members_filter(app: QApplication, size: int) -> dict:
+    # Czas od zmiany tekstu filtra do narysowania listy - kolejne znaki jak przy pisaniu
+    dialog, _, _ = open_group_settings(app, size)
+
+    def run():
+        timings = []
+        for _ in range(10):
+            for text in ("c", "cz", "człon", "członek0", "członek01", "członek012", "członek0123", "x", ""):
+                started_at = time.perf_counter()
+                dialog.filter_input.setText(text)
+                app.processEvents()
+                timings.append(time.perf_counter() - started_at)
+        timings.sort()
+        return {
+            "filter_p50_ms": round(timings[len(timings) // 2] * 1000, 3),
+            "filter_max_ms": round(timings[-1] * 1000, 3),
+        }
+
+    record = measure("group_members_filter", size, run)
+    dialog.reject()
+    return record
+
+
+CASES = {
+    "chat_add_message": bench_chat_add_message,
+    "chat_merge_messages": bench_chat_merge_messages,
+    "load_friends": bench_load_friends,
+    "load_groups": bench_load_groups,
+    "switch_conversation": bench_switch_conversation,
+    "notification_burst": bench_notification_burst,
+    "chat_long_session": bench_chat_long_session,
+    "group_settings_open": bench_group_settings_open,
+    "group_members_filter": bench_group_members_filter,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reComm :: benchmarki GUI (offscreen)")
+    parser.add_argument("--case", choices=sorted(CASES), help="Uruchom pojedynczy przypadek w bieżącym procesie")
+    parser.add_argument("--size", type=int, help="Rozmiar dla --case")
+    parser.add_argument("--sizes", type=str, help="Nadpisz rozmiary dla wszystkich przypadków, np. 1000,10000")
+    parser.add_argument("--only", type=str, help="Lista przypadków oddzielona przecinkami")
+    parser.add_argument("--output", type=str, help="Dopisz wyniki (JSONL) do pliku")
+    args = parser.parse_args()
+
+    if args.case:
+        app = QApplication.instance() or QApplication(sys.argv[:1])
+        record = CASES[args.case](app, args.size or DEFAULT_CASES[args.case][0])
+        write_results([record], None)
+        return
+
+    selected = args.only.split(",") if args.only else list(DEFAULT_CASES)
+    records = []
+    for case in selected:
+        sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else DEFAULT_CASES[case]
+        for size in sizes:
+            records.append(run_isolated("benchmarks.gui_bench", case, size))
+
+    write_results(records, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import measure, run_isolated, write_results
+from tools.conversation_index import ConversationIndex, ConversationSearch, KEYSTROKE_BUDGET
+from tools.message_archive import MessageArchive
+
+DEFAULT_CASES = {
+    "search_index_build": [100000],
+    "search_query": [100000],
+    "switcher_index_build": [100000],
+    "switcher_query": [100000],
+}
+
+CONVERSATIONS = 100
+# Historia przychodzi stronami po tyle wiadomości (GET_PRIVATE_MESSAGES / GET_GROUP_MESSAGES)
+PAGE_SIZE = 100
+VOCABULARY = 20000
+QUERY_REPEATS = 200
+# Cel dla okna przełączania: p99 jednego znaku poniżej milisekundy przy 100k rozmów
+KEYSTROKE_TARGET_MS = 1.0
+LETTERS = "abcdefghijklmnoprstuwyzżółćęąś"
+# Częste słowa na początku słownika - rozkład Zipfa jak w zwykłych rozmowach
+COMMON_WORDS = ["spotkanie", "wiadomość", "jutro", "projekt", "serwer", "klient", "poprawka", "wydanie"]
+FIRST_NAMES = ["Jan", "Anna", "Łukasz", "Piotr", "Katarzyna", "Marek", "Zofia", "Tomasz", "Ewa", "Krzysztof"]
+LAST_NAMES = ["Kowalski", "Nowak", "Wiśniewski", "Wójcik", "Kamiński", "Lewandowski", "Zieliński", "Szymański"]
+# Kolejne znaki wpisywane w oknie przełączania - prefiks, dalsze słowo, dopasowanie rozmyte, brak wyników
+SWITCHER_TYPING = [
+    "j", "ja", "jan", "jan_k", "jan_kow", "k", "ko", "kow", "j", "jk", "jkw", "jkwl", "g", "gn", "gnw", "gnw1", "q", "qz",
+]
+
+
+def generate_pages(size: int):
+    rnd = random.Random(1)
+    vocabulary = COMMON_WORDS + [
+        "".join(rnd.choices(LETTERS, k=rnd.randint(2, 11))) for _ in range(VOCABULARY - len(COMMON_WORDS))
+    ]
+    cum_weights = list(itertools.accumulate(1 / (i + 1) for i in range(len(vocabulary))))
+    per_conversation = size // CONVERSATIONS
+    for start in range(0, per_conversation, PAGE_SIZE):
+        for conversation in range(CONVERSATIONS):
+            target = f"user{conversation}"
+            yield target, [
+                {
+                    "messageId": f"{target}-{i}",
+                    "senderName": target if i % 2 else "bench",
+                    "content": " ".join(rnd.choices(vocabulary, cum_weights=cum_weights, k=rnd.randint(3, 15))),
+                    "sentAt": 1700000000 + i * 60,
+                }
+                for i in range(start, min(start + PAGE_SIZE, per_conversation))
+            ]
+
+
+def build_archive(size: int) -> tuple[MessageArchive, float]:
+    directory = tempfile.mkdtemp(prefix="recomm-search-")
+    archive = MessageArchive(os.path.join(directory, "messages.sqlite3"))
+    pages = list(generate_pages(size))
+    started_at = time.perf_counter()
+    for target, messages in pages:
+        archive.record("user", target, messages)
+    archive.flush()
+    return archive, time.perf_counter() - started_at
+
+
+def index_build(size: int) -> dict:
+    archive, elapsed = build_archive(size)
+    db_kb = sum(
+        os.path.getsize(archive.path + suffix) for suffix in ("", "-wal") if os.path.exists(archive.path + suffix)
+    ) // 1024
+    archive.close()
+    return {"messages_per_s": round(size / elapsed), "db_kb": db_kb}
+
+
+def percentiles(archive: MessageArchive, text: str, **filters) -> tuple[float, float, int]:
+    timings = []
+    hits = []
+    for _ in range(QUERY_REPEATS):
+        started_at = time.perf_counter()
+        hits = archive.search(text, **filters)
+        timings.append(time.perf_counter() - started_at)
+    timings.sort()
+    return (
+        round(timings[len(timings) // 2] * 1000, 3),
+        round(timings[len(timings) * 9 // 10] * 1000, 3),
+        len(hits),
+    )
+
+
+def query_latency(size: int) -> dict:
+    # Czas zapytania z pierwszą stroną wyników (50) - tyle pokazuje okno wyszukiwania
+    archive, _ = build_archive(size)
+    queries = {
+        "prefix": ("spot", {}),
+        "two_words": ("spotk jutro", {}),
+        "long_word": ("wiadomości", {}),
+        "conversation": ("spot", {"conversation": ("user", "user7")}),
+        "author": ("spot", {"author": "user7"}),
+        "since": ("spot", {"since": 1700000000 + (size // CONVERSATIONS) * 30}),
+        "no_match": ("qqqq", {}),
+    }
+    result = {}
+    for name, (text, filters) in queries.items():
+        p50, p90, hits = percentiles(archive, text, **filters)
+        result[f"{name}_p50_ms"] = p50
+        result[f"{name}_p90_ms"] = p90
+        result[f"{name}_hits"] = hits
+    archive.close()
+    return result
+
+
+def generate_directory(size: int) -> tuple[list[str], list[tuple[str, str]]]:
+    rnd = random.Random(1)
+    friends = [f"{rnd.choice(FIRST_NAMES)}_{rnd.choice(LAST_NAMES)}{i}" for i in range(size // 2)]
+    groups = [(f"group-{i:08d}", f"Grupa {rnd.choice(LAST_NAMES)} {i}") for i in range(size - size // 2)]
+    return friends, groups
+
+
+def switcher_index_build(size: int) -> dict:
+    friends, groups = generate_directory(size)
+    index = ConversationIndex()
+    started_at = time.perf_counter()
+    index.set_friends(friends)
+    index.set_groups(groups)
+    build_s = time.perf_counter() - started_at
+
+    # Odświeżenie listy z jedną zmianą - nakładane różnicowo
+    groups[0] = (groups[0][0], "Zmieniona nazwa")
+    started_at = time.perf_counter()
+    index.set_friends(friends[1:] + ["nowy_znajomy"])
+    index.set_groups(groups)
+    return {"build_s": round(build_s, 6), "diff_s": round(time.perf_counter() - started_at, 6)}
+
+
+def switcher_query(size: int) -> dict:
+    # Czas jednego znaku przy pisaniu w oknie przełączania (pierwsza strona wyników - 50): prefiksy
+    # i porcja dopasowania rozmytego w KEYSTROKE_BUDGET, jak w QuickSwitcherDialog.search(). Osobno
+    # czas do kompletu wyników rozmytych, który okno dolicza w kolejnych przebiegach pętli zdarzeń
+    friends, groups = generate_directory(size)
+    index = ConversationIndex()
+    index.set_friends(friends)
+    index.set_groups(groups)
+    timings = []
+    complete = []
+    for _ in range(QUERY_REPEATS // 10):
+        for text in SWITCHER_TYPING:
+            started_at = time.perf_counter()
+            search = ConversationSearch(index, text)
+            search.advance(KEYSTROKE_BUDGET)
+            timings.append(time.perf_counter() - started_at)
+            search.advance()
+            search.results()
+            complete.append(time.perf_counter() - started_at)
+    timings.sort()
+    complete.sort()
+    p99_ms = timings[len(timings) * 99 // 100] * 1000
+    return {
+        "keystroke_p50_ms": round(timings[len(timings) // 2] * 1000, 3),
+        "keystroke_p99_ms": round(p99_ms, 3),
+        "keystroke_max_ms": round(timings[-1] * 1000, 3),
+        "complete_p99_ms": round(complete[len(complete) * 99 // 100] * 1000, 3),
+        "complete_max_ms": round(complete[-1] * 1000, 3),
+        "ok": p99_ms <= KEYSTROKE_TARGET_MS,
+    }
+
+
+def bench_search_index_build(size: int) -> dict:
+    return measure("search_index_build", size, lambda: index_build(size))
+
+
+def bench_search_query(size: int) -> dict:
+    return measure("search_query", size, lambda: query_latency(size))
+
+
+def bench_switcher_index_build(size: int) -> dict:
+    return measure("switcher_index_build", size, lambda: switcher_index_build(size))
+
+
+def bench_switcher_query(size: int) -> dict:
+    return measure("switcher_query", size, lambda: switcher_query(size))
+
+
+CASES = {
+    "search_index_build": bench_search_index_build,
+    "search_query": bench_search_query,
+    "switcher_index_build": bench_switcher_index_build,
+    "switcher_query": bench_switcher_query,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reComm :: benchmarki wyszukiwania wiadomości")
+    parser.add_argument("--case", choices=sorted(CASES), help="Uruchom pojedynczy przypadek w bieżącym procesie")
+    parser.add_argument("--size", type=int, help="Rozmiar dla --case")
+    parser.add_argument("--sizes", type=str, help="Nadpisz rozmiary dla wszystkich przypadków, np. 10000,100000")
+    parser.add_argument("--only", type=str, help="Lista przypadków oddzielona przecinkami")
+    parser.add_argument("--output", type=str, help="Dopisz wyniki (JSONL) do pliku")
+    args = parser.parse_args()
+
+    if args.case:
+        record = CASES[args.case](args.size or DEFAULT_CASES[args.case][0])
+        write_results([record], None)
+        return
+
+    selected = args.only.split(",") if args.only else list(DEFAULT_CASES)
+    records = []
+    for case in selected:
+        sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else DEFAULT_CASES[case]
+        for size in sizes:
+            records.append(run_isolated("benchmarks.search_bench", case, size))
+
+    write_results(records, args.output)
+    sys.exit(0 if all(record.get("ok", True) and "error" not in record for record in records) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,77 @@
+import logging
+import re
+import threading
+from typing import Callable, Iterator
+
+from PyQt6.QtCore import Qt, pyqtSignal
 from PyQt6.QtWidgets import (
-    QDialog, QVBoxLayout, QHBoxLayout, QPushButton,
-    QLineEdit, QListWidget, QListWidgetItem, QGroupBox, QMessageBox
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QAbstractItemView,
+    QLineEdit, QListView, QLabel, QGroupBox, QMessageBox, QProgressBar
+)
+
+from gui.widget.member_list import MemberListModel
+
+from tools.api_service import (
+    MEMBER_ADDED, MEMBER_REMOVED, ALREADY_MEMBER, NOT_MEMBER, NOT_FRIEND, USER_NOT_FOUND, UNSUPPORTED,
+    NO_RESPONSE, FAILED
 )
 
+logger = logging.getLogger(__name__)
+
+# Członkowie są wczytywani w tle stronami po tyle osób - okno otwiera się od razu
+MEMBER_PAGE = 500
+# Kolejna strona zaczyna się tyle pozycji wcześniej: członek usunięty w trakcie wczytywania
+# przesuwa następnych o jedną pozycję wstecz i bez zakładki jeden z nich by przepadł
+PAGE_OVERLAP = 16
+
+STATUS_LABELS = {
+    MEMBER_ADDED: "dodani",
+    MEMBER_REMOVED: "usunięci",
+    ALREADY_MEMBER: "już byli w grupie",
+    NOT_MEMBER: "nie byli w grupie",
+    NOT_FRIEND: "nie są Twoimi znajomymi",
+    USER_NOT_FOUND: "nie istnieją",
+    UNSUPPORTED: "serwer nie obsługuje tej operacji",
+    NO_RESPONSE: "brak odpowiedzi serwera",
+    FAILED: "inne błędy",
+}
+
 
 class GroupSettingsDialog(QDialog):
+    members_page = pyqtSignal(object, bool)
+    members_failed = pyqtSignal(str)
+    member_result = pyqtSignal(object)
+    bulk_finished = pyqtSignal(str)
 
-    def __init__(self, group_id: str, group_name: str, members: list,
+    def __init__(self, group_id: str, group_name: str,
                  current_username: str, owner_username: str, api_service, parent=None):
         super().__init__(parent)
         self.group_id = group_id
         self.group_name = group_name
-        self.members = members or []
         self.current_username = current_username
         self.owner_username = owner_username
         self.api_service = api_service
         self.is_owner = (current_username == owner_username)
+        self.members = MemberListModel(owner_username, self)
+        self.remove_members_button = None
+        # Wczytywanie członków i zbiorcze dodawanie / usuwanie idą w osobnych wątkach,
+        # wyniki wracają sygnałami; zamknięcie okna przerywa oba
+        self.closing = threading.Event()
+        self.loading = False
+        # Usunięci w trakcie wczytywania - późniejsza strona nie może ich przywrócić
+        self.removed_while_loading: set[str] = set()
+        self.bulk_adding = True
+        self.bulk_results: list[dict] = []
+        self.members_page.connect(self.on_members_page)
+        self.members_failed.connect(self.on_members_failed)
+        self.member_result.connect(self.on_member_result)
+        self.bulk_finished.connect(self.on_bulk_finished)
 
         self.setWindowTitle(f"Ustawienia grupy: {group_name}")
         self.setMinimumWidth(400)
         self.setMinimumHeight(450)
         self.init_ui()
+        self.load_members()
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -42,20 +93,46 @@ class GroupSettingsDialog(QDialog):
         members_group = QGroupBox("Członkowie grupy")
         members_layout = QVBoxLayout()
 
-        self.members_list = QListWidget()
-        self.load_members()
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Szukaj członka")
+        self.filter_input.textChanged.connect(self.on_filter_changed)
+        members_layout.addWidget(self.filter_input)
+
+        # Widok pyta model tylko o widoczne wiersze, a układ liczy partiami w tle - przy
+        # układzie statycznym każda zmiana filtra przeliczała pozycje wszystkich wierszy
+        self.members_list = QListView()
+        self.members_list.setUniformItemSizes(True)
+        self.members_list.setLayoutMode(QListView.LayoutMode.Batched)
+        self.members_list.setBatchSize(MEMBER_PAGE)
+        self.members_list.setModel(self.members)
         members_layout.addWidget(self.members_list)
 
+        self.members_label = QLabel()
+        self.members_label.setStyleSheet("color: gray;")
+        members_layout.addWidget(self.members_label)
+
+        if self.is_owner:
+            self.members_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+            self.remove_members_button = QPushButton("Usuń zaznaczonych")
+            self.remove_members_button.clicked.connect(self.on_remove_members)
+            members_layout.addWidget(self.remove_members_button)
+
         add_member_layout = QHBoxLayout()
         self.new_member_input = QLineEdit()
-        self.new_member_input.setPlaceholderText("Nazwa użytkownika")
+        self.new_member_input.setPlaceholderText("Nazwy użytkowników (oddzielone przecinkami)")
+        self.new_member_input.returnPressed.connect(self.on_add_member)
         add_member_layout.addWidget(self.new_member_input)
 
-        self.add_member_button = QPushButton("Dodaj członka")
+        self.add_member_button = QPushButton("Dodaj")
         self.add_member_button.clicked.connect(self.on_add_member)
         add_member_layout.addWidget(self.add_member_button)
 
         members_layout.addLayout(add_member_layout)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("%v / %m")
+        self.progress_bar.hide()
+        members_layout.addWidget(self.progress_bar)
         members_group.setLayout(members_layout)
         layout.addWidget(members_group)
 
@@ -106,20 +183,81 @@ class GroupSettingsDialog(QDialog):
 
         layout.addLayout(actions_layout)
 
+    @staticmethod
+    def member_name(member) -> str:
+        if isinstance(member, dict):
+            return member.get('username', str(member))
+        return str(member)
+
     def load_members(self):
-        self.members_list.clear()
-        for member in self.members:
-            if isinstance(member, dict):
-                username = member.get('username', str(member))
-            else:
-                username = str(member)
+        self.loading = True
+        self.update_members_label()
+        threading.Thread(target=self.run_load_members, daemon=True).start()
 
-            if username == self.owner_username:
-                item = QListWidgetItem(f"👑 {username} (właściciel)")
-            else:
-                item = QListWidgetItem(f"👤 {username}")
+    def run_load_members(self):
+        # Wątek roboczy - z widgetami rozmawia tylko przez sygnały
+        seen: set[str] = set()
+        offset = 0
+        try:
+            while not self.closing.is_set():
+                members = self.api_service.get_group_members(self.group_id, MEMBER_PAGE, offset)
+                if members is None:
+                    self.members_failed.emit("Nie udało się wczytać członków grupy.")
+                    return
+                names = [self.member_name(member) for member in members]
+                fresh = [name for name in names if name not in seen]
+                seen.update(fresh)
+                # Serwer bez stronicowania od razu zwraca wszystkich (więcej niż MEMBER_PAGE albo
+                # tę samą listę co poprzednio)
+                finished = len(names) != MEMBER_PAGE or (offset > 0 and not fresh)
+                self.members_page.emit(fresh, finished)
+                if finished:
+                    return
+                offset += MEMBER_PAGE - PAGE_OVERLAP
+        except Exception as e:
+            logger.error("Błąd wczytywania członków grupy %s: %s", self.group_id, e)
+            self.members_failed.emit(f"Wystąpił błąd: {e}")
+
+    def on_members_page(self, usernames: list[str], finished: bool):
+        self.members.add_members(name for name in usernames if name not in self.removed_while_loading)
+        if finished:
+            self.loading = False
+            self.removed_while_loading.clear()
+        self.update_members_label()
+
+    def on_members_failed(self, error: str):
+        self.loading = False
+        self.removed_while_loading.clear()
+        self.members_label.setText(error)
+
+    def on_filter_changed(self, text: str):
+        self.members.set_filter(text.strip())
+        self.update_members_label()
+
+    def update_members_label(self):
+        text = f"Członkowie: {len(self.members)}"
+        if self.members.filter_text:
+            text = f"Pasujący: {self.members.rowCount()} z {len(self.members)}"
+        if self.loading:
+            text += " (wczytywanie…)"
+        self.members_label.setText(text)
+
+    def add_members(self, usernames: list[str]):
+        self.removed_while_loading.difference_update(usernames)
+        if self.members.add_members(usernames):
+            self.update_members_label()
+
+    def remove_members(self, usernames: list[str]):
+        if self.loading:
+            self.removed_while_loading.update(usernames)
+        if self.members.remove_members(usernames):
+            self.update_members_label()
 
-            self.members_list.addItem(item)
+    def apply_member_change(self, username: str, joined: bool):
+        if joined:
+            self.add_members([username])
+        else:
+            self.remove_members([username])
 
     def on_change_name(self):
         new_name = self.name_input.text().strip()
@@ -142,22 +280,113 @@ class GroupSettingsDialog(QDialog):
             QMessageBox.critical(self, "Błąd", f"Wystąpił błąd: {str(e)}")
 
     def on_add_member(self):
-        username = self.new_member_input.text().strip()
-        if not username:
+        usernames = [name for name in re.split(r"[\s,;]+", self.new_member_input.text()) if name]
+        if not usernames:
             QMessageBox.warning(self, "Błąd", "Wprowadź nazwę użytkownika.")
             return
 
+        self.start_bulk(self.api_service.add_members_to_group, usernames, adding=True)
+
+    def on_remove_members(self):
+        usernames = [
+            index.data(Qt.ItemDataRole.UserRole) for index in self.members_list.selectionModel().selectedIndexes()
+            if index.data(Qt.ItemDataRole.UserRole) not in (self.owner_username, self.current_username)
+        ]
+        if not usernames:
+            QMessageBox.warning(self, "Błąd", "Zaznacz członków do usunięcia (poza sobą).")
+            return
+
+        reply = QMessageBox.question(
+            self,
+            "Potwierdź usunięcie",
+            f"Czy na pewno chcesz usunąć z grupy {len(usernames)} członków?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            self.start_bulk(self.api_service.remove_members_from_group, usernames, adding=False)
+
+    def start_bulk(self, operation: Callable[[str, list[str]], Iterator[dict]], usernames: list[str], adding: bool):
+        usernames = list(dict.fromkeys(usernames))
+        self.bulk_adding = adding
+        self.bulk_results = []
+        self.set_bulk_running(True, len(usernames))
+        threading.Thread(target=self.run_bulk, args=(operation, usernames), daemon=True).start()
+
+    def run_bulk(self, operation: Callable[[str, list[str]], Iterator[dict]], usernames: list[str]):
+        # Wątek roboczy - z widgetami rozmawia tylko przez sygnały
+        error = ""
         try:
-            success = self.api_service.add_member_to_group(self.group_id, username)
-            if success:
-                self.new_member_input.clear()
-                self.members = self.api_service.get_group_members(self.group_id) or []
-                self.load_members()
-                QMessageBox.information(self, "Sukces", f"Dodano {username} do grupy.")
-            else:
-                QMessageBox.warning(self, "Błąd", f"Nie udało się dodać {username} do grupy.")
+            for result in operation(self.group_id, usernames):
+                self.member_result.emit(result)
+                if self.closing.is_set():
+                    break
         except Exception as e:
-            QMessageBox.critical(self, "Błąd", f"Wystąpił błąd: {str(e)}")
+            logger.error("Błąd zbiorczej zmiany członków grupy %s: %s", self.group_id, e)
+            error = str(e)
+        self.bulk_finished.emit(error)
+
+    def set_bulk_running(self, running: bool, total: int = 0):
+        self.add_member_button.setEnabled(not running)
+        self.new_member_input.setEnabled(not running)
+        if self.remove_members_button is not None:
+            self.remove_members_button.setEnabled(not running)
+        if running:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(0)
+            self.progress_bar.show()
+        else:
+            self.progress_bar.hide()
+
+    def on_member_result(self, result: dict):
+        self.bulk_results.append(result)
+        self.progress_bar.setValue(len(self.bulk_results))
+
+    def on_bulk_finished(self, error: str):
+        self.set_bulk_running(False)
+        if self.closing.is_set():
+            return
+
+        # Lista członków zmienia się raz, o wynik całej operacji - bez ponownego pobierania grupy
+        counts: dict[str, int] = {}
+        failed = []
+        for result in self.bulk_results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            if result["status"] not in (MEMBER_ADDED, MEMBER_REMOVED, ALREADY_MEMBER, NOT_MEMBER):
+                failed.append(result)
+        if self.bulk_adding:
+            self.add_members([
+                result["username"] for result in self.bulk_results if result["status"] in (MEMBER_ADDED, ALREADY_MEMBER)
+            ])
+            done = counts.get(MEMBER_ADDED, 0)
+            summary = f"Dodano {done} z {len(self.bulk_results)} użytkowników."
+        else:
+            self.remove_members([
+                result["username"] for result in self.bulk_results if result["status"] in (MEMBER_REMOVED, NOT_MEMBER)
+            ])
+            done = counts.get(MEMBER_REMOVED, 0)
+            summary = f"Usunięto {done} z {len(self.bulk_results)} członków."
+
+        details = [f"{STATUS_LABELS[status]}: {count}" for status, count in counts.items()]
+        if error:
+            details.append(f"Wystąpił błąd: {error}")
+        message_box = QMessageBox(self)
+        message_box.setWindowTitle("Sukces" if not failed and not error else "Wynik operacji")
+        message_box.setIcon(QMessageBox.Icon.Information if not failed and not error else QMessageBox.Icon.Warning)
+        message_box.setText(summary + "\n\n" + "\n".join(details))
+        if failed:
+            message_box.setDetailedText("\n".join(
+                f"{r['username']}: {STATUS_LABELS[r['status']]} ({r['message']})" for r in failed
+            ))
+        # Nieudanych można poprawić i dodać ponownie
+        if self.bulk_adding:
+            self.new_member_input.setText(", ".join(r["username"] for r in failed))
+        message_box.exec()
+
+    def done(self, result: int):
+        # Zamknięcie okna przerywa wczytywanie i trwającą operację po bieżącej odpowiedzi
+        self.closing.set()
+        super().done(result)
 
     def on_leave_group(self):
         reply = QMessageBox.question(
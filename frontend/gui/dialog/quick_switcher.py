@@ -0,0 +1,123 @@
+import time
+
+from PyQt6.QtCore import Qt, QEvent, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QListWidget, QListWidgetItem
+
+from tools.conversation_index import ConversationIndex, ConversationSearch, GROUP, KEYSTROKE_BUDGET
+
+# Klawisze przekazywane z pola wyszukiwania do listy - wybór wyniku bez odrywania rąk od klawiatury
+NAVIGATION_KEYS = {
+    Qt.Key.Key_Up, Qt.Key.Key_Down, Qt.Key.Key_PageUp, Qt.Key.Key_PageDown,
+}
+
+
+class QuickSwitcherDialog(QDialog):
+    conversation_selected = pyqtSignal(str, str)
+
+    def __init__(self, index: ConversationIndex, parent=None):
+        super().__init__(parent)
+        self.query_input = None
+        self.results_list = None
+        self.status_label = None
+        self.index = index
+        # Wyszukiwanie, którego dopasowanie rozmyte jeszcze się liczy, i czas spędzony na nim do tej pory
+        self.pending_search = None
+        self.pending_elapsed = 0.0
+        # Kolejna porcja dopasowania rozmytego w następnym przebiegu pętli zdarzeń - po obsłużeniu
+        # czekających znaków, więc pisanie nie czeka na wyniki poprzedniego zapytania
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(0)
+        self.search_timer.timeout.connect(self.continue_search)
+        self.setWindowTitle("Przejdź do rozmowy")
+        self.setMinimumSize(400, 350)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.query_input = QLineEdit()
+        self.query_input.setPlaceholderText("Nazwa przyjaciela lub grupy")
+        # Prefiksy to wyszukiwanie binarne i są gotowe od razu; dopasowanie rozmyte dostaje
+        # KEYSTROKE_BUDGET na znak, a jeśli nie skończy, liczy się dalej w kolejnych przebiegach
+        # pętli zdarzeń i jego wyniki dochodzą do listy, gdy są kompletne
+        self.query_input.textChanged.connect(self.search)
+        self.query_input.returnPressed.connect(self.select_current)
+        self.query_input.installEventFilter(self)
+        layout.addWidget(self.query_input)
+
+        self.results_list = QListWidget()
+        self.results_list.itemClicked.connect(self.on_result_activated)
+        layout.addWidget(self.results_list)
+
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet("color: gray;")
+        layout.addWidget(self.status_label)
+
+    def popup(self):
+        self.query_input.clear()
+        self.search("")
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        self.query_input.setFocus()
+
+    def eventFilter(self, obj, event):
+        if obj is self.query_input and event.type() == QEvent.Type.KeyPress and event.key() in NAVIGATION_KEYS:
+            self.results_list.keyPressEvent(event)
+            return True
+        return super().eventFilter(obj, event)
+
+    def search(self, text: str):
+        started = time.perf_counter()
+        self.pending_search = ConversationSearch(self.index, text)
+        self.pending_search.advance(KEYSTROKE_BUDGET)
+        self.pending_elapsed = time.perf_counter() - started
+        self.show_results(keep_selection=False)
+
+    def continue_search(self):
+        if self.pending_search is None:
+            return
+        started = time.perf_counter()
+        done = self.pending_search.advance(KEYSTROKE_BUDGET)
+        self.pending_elapsed += time.perf_counter() - started
+        if done:
+            # Dopasowania rozmyte dochodzą pod prefiksami - wybrany już wynik zostaje zaznaczony
+            self.show_results(keep_selection=True)
+        else:
+            self.search_timer.start()
+
+    def show_results(self, keep_selection: bool):
+        search = self.pending_search
+        conversations = search.results()
+        selected = self.results_list.currentItem() if keep_selection else None
+        selected = selected.data(Qt.ItemDataRole.UserRole) if selected is not None else None
+
+        self.results_list.clear()
+        for kind, target in conversations:
+            title = self.index.title(kind, target) or target
+            item = QListWidgetItem(f"👥 {title}" if kind == GROUP else f"👤 {title}")
+            item.setData(Qt.ItemDataRole.UserRole, (kind, target))
+            self.results_list.addItem(item)
+        if conversations:
+            self.results_list.setCurrentRow(conversations.index(selected) if selected in conversations else 0)
+
+        status = f"Wyniki: {len(conversations)} z {len(self.index)} ({self.pending_elapsed * 1000:.2f} ms)"
+        if search.done:
+            self.pending_search = None
+        else:
+            status += ", szukanie dalej…"
+            self.search_timer.start()
+        self.status_label.setText(status)
+
+    def select_current(self):
+        item = self.results_list.currentItem()
+        if item is not None:
+            self.on_result_activated(item)
+
+    def on_result_activated(self, item: QListWidgetItem):
+        conversation = item.data(Qt.ItemDataRole.UserRole)
+        if conversation is None:
+            return
+        self.accept()
+        self.conversation_selected.emit(*conversation)
@@ -0,0 +1,127 @@
+import time
+from typing import Callable, Optional
+
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox, QListWidget, QListWidgetItem
+)
+
+from tools.message_archive import MessageArchive, SearchHit
+
+# Zapytanie idzie po krótkiej przerwie w pisaniu, a nie po każdym znaku
+SEARCH_DELAY_MS = 150
+RESULT_LIMIT = 100
+
+TIME_RANGES = [
+    ("Dowolny czas", None),
+    ("Ostatnie 24 godziny", 24 * 3600),
+    ("Ostatni tydzień", 7 * 24 * 3600),
+    ("Ostatnie 30 dni", 30 * 24 * 3600),
+]
+
+
+class SearchMessagesDialog(QDialog):
+    message_selected = pyqtSignal(object)
+
+    def __init__(
+        self,
+        archive: MessageArchive,
+        conversation_title: Callable[[str, str], str],
+        current_conversation: Callable[[], Optional[tuple[str, str]]],
+        parent=None
+    ):
+        super().__init__(parent)
+        self.query_input = None
+        self.scope_combo = None
+        self.author_input = None
+        self.time_combo = None
+        self.results_list = None
+        self.status_label = None
+        self.archive = archive
+        self.conversation_title = conversation_title
+        self.current_conversation = current_conversation
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.search)
+        self.setWindowTitle("Szukaj w wiadomościach")
+        self.setMinimumSize(500, 400)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.query_input = QLineEdit()
+        self.query_input.setPlaceholderText("Wpisz szukane słowa")
+        self.query_input.textChanged.connect(self.schedule_search)
+        self.query_input.returnPressed.connect(self.search)
+        layout.addWidget(self.query_input)
+
+        filters_layout = QHBoxLayout()
+
+        self.scope_combo = QComboBox()
+        self.scope_combo.addItem("Wszystkie rozmowy")
+        self.scope_combo.addItem("Bieżąca rozmowa")
+        self.scope_combo.currentIndexChanged.connect(self.schedule_search)
+        filters_layout.addWidget(self.scope_combo)
+
+        self.author_input = QLineEdit()
+        self.author_input.setPlaceholderText("Autor")
+        self.author_input.textChanged.connect(self.schedule_search)
+        filters_layout.addWidget(self.author_input)
+
+        self.time_combo = QComboBox()
+        for label, _ in TIME_RANGES:
+            self.time_combo.addItem(label)
+        self.time_combo.currentIndexChanged.connect(self.schedule_search)
+        filters_layout.addWidget(self.time_combo)
+
+        layout.addLayout(filters_layout)
+
+        self.results_list = QListWidget()
+        self.results_list.itemClicked.connect(self.on_result_clicked)
+        layout.addWidget(self.results_list)
+
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet("color: gray;")
+        layout.addWidget(self.status_label)
+
+    def schedule_search(self, *args):
+        self.search_timer.start()
+
+    def search(self):
+        self.search_timer.stop()
+        self.results_list.clear()
+        text = self.query_input.text().strip()
+        if not text:
+            self.status_label.clear()
+            return
+
+        # Bieżąca rozmowa zmienia się, gdy wynik otwiera inny czat - ustalana przy każdym zapytaniu
+        conversation = self.current_conversation() if self.scope_combo.currentIndex() == 1 else None
+        period = TIME_RANGES[self.time_combo.currentIndex()][1]
+        since = int(time.time()) - period if period is not None else None
+        started = time.perf_counter()
+        hits = self.archive.search(
+            text, conversation, self.author_input.text().strip() or None, since, limit=RESULT_LIMIT
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        for hit in hits:
+            item = QListWidgetItem(self.format_hit(hit))
+            item.setData(Qt.ItemDataRole.UserRole, hit)
+            self.results_list.addItem(item)
+        if len(hits) >= RESULT_LIMIT:
+            self.status_label.setText(f"Pierwsze {len(hits)} wyników ({elapsed_ms:.1f} ms)")
+        else:
+            self.status_label.setText(f"Wyniki: {len(hits)} ({elapsed_ms:.1f} ms)")
+
+    def format_hit(self, hit: SearchHit) -> str:
+        title = self.conversation_title(hit.kind, hit.target)
+        when = time.strftime("%d.%m.%Y %H:%M", time.localtime(hit.sent_at)) if hit.sent_at else ""
+        return f"{title} · {hit.author} · {when}\n{hit.snippet}"
+
+    def on_result_clicked(self, item: QListWidgetItem):
+        hit = item.data(Qt.ItemDataRole.UserRole)
+        if hit is not None:
+            self.message_selected.emit(hit)
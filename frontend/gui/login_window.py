@@ -1,14 +1,26 @@
+import functools
+import os
 import sys
+from PyQt6.QtCore import pyqtSignal
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QLineEdit, QPushButton, QGroupBox, QMessageBox
+    QLabel, QLineEdit, QPushButton, QGroupBox, QMessageBox, QProgressBar
 )
 
 from tools.api_service import ApiService
+from tools.bootstrap import Bootstrap, BootstrapResult, AuthenticationFailed
+from tools.connection_pool import PRIMARY, INTERACTIVE, BULK
+from tools.log import setup_logging
+from tools.tcp_client import BackpressurePolicy
 from gui.main_window import MainWindow
 
 
 class LoginWindow(QWidget):
+
+    bootstrap_progress = pyqtSignal(object, str, int, int)
+    bootstrap_finished = pyqtSignal(object, object)
+    bootstrap_failed = pyqtSignal(object, object)
+
     def __init__(self, ):
         super().__init__()
         self.user = None
@@ -20,9 +32,16 @@ class LoginWindow(QWidget):
         self.connect_button = None
         self.port_input = None
         self.ip_input = None
+        self.progress_bar = None
+        self.progress_label = None
+        self.cancel_button = None
         self.api_service = None
+        self.bootstrap = None
         self.main_window = None
         self.init_ui()
+        self.bootstrap_progress.connect(self.on_bootstrap_progress)
+        self.bootstrap_finished.connect(self.on_bootstrap_finished)
+        self.bootstrap_failed.connect(self.on_bootstrap_failed)
 
     def init_ui(self):
         self.setWindowTitle("reComm")
@@ -91,109 +110,191 @@ class LoginWindow(QWidget):
         buttons_layout = QHBoxLayout()
         self.login_button = QPushButton("Zaloguj")
         self.login_button.clicked.connect(self.on_login)
-        self.login_button.setEnabled(False)
 
         self.register_button = QPushButton("Zarejestruj")
         self.register_button.clicked.connect(self.on_register)
-        self.register_button.setEnabled(False)
 
         buttons_layout.addWidget(self.login_button)
         buttons_layout.addWidget(self.register_button)
         main_layout.addLayout(buttons_layout)
 
+        progress_layout = QHBoxLayout()
+        self.progress_label = QLabel()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(False)
+        self.progress_bar.setFixedHeight(8)
+        self.cancel_button = QPushButton("Anuluj")
+        self.cancel_button.clicked.connect(self.on_cancel)
+        progress_layout.addWidget(self.progress_label)
+        progress_layout.addWidget(self.progress_bar, 1)
+        progress_layout.addWidget(self.cancel_button)
+        main_layout.addLayout(progress_layout)
+        self.set_busy(False)
+
         self.setLayout(main_layout)
 
-    def on_connect(self):
+    def read_address(self):
         ip = self.ip_input.text().strip()
         port_text = self.port_input.text().strip()
 
         if not ip:
             QMessageBox.warning(self, "Błąd", "Wprowadź adres IP serwera.")
-            return
+            return None
 
         if not port_text:
             QMessageBox.warning(self, "Błąd", "Wprowadź numer portu.")
-            return
+            return None
 
         try:
             port = int(port_text)
         except ValueError:
             QMessageBox.warning(self, "Błąd", "Port musi być liczbą.")
-            return
+            return None
 
-        try:
-            self.api_service = ApiService(host=ip, port=port)
-            self.connection_status_label.setText("Status: Połączono")
-            self.connection_status_label.setStyleSheet("color: green; font-weight: bold;")
-            self.connect_button.setEnabled(False)
-            self.ip_input.setEnabled(False)
-            self.port_input.setEnabled(False)
-            self.login_button.setEnabled(True)
-            self.register_button.setEnabled(True)
-        except Exception as e:
-            QMessageBox.critical(self, "Błąd połączenia", f"Nie udało się połączyć z serwerem:\n{str(e)}")
-            self.connection_status_label.setText("Status: Błąd połączenia")
-            self.connection_status_label.setStyleSheet("color: red; font-weight: bold;")
+        return ip, port
 
-    def on_login(self):
+    def read_credentials(self):
         username = self.username_input.text().strip()
         password = self.password_input.text()
 
         if not username:
             QMessageBox.warning(self, "Błąd", "Wprowadź nazwę użytkownika.")
-            return
+            return None
 
         if not password:
             QMessageBox.warning(self, "Błąd", "Wprowadź hasło.")
-            return
+            return None
 
-        try:
-            success = self.api_service.login(username, password)
-            if success:
-                self.user = {
-                    "username": username
-                }
-                self.open_main_window()
-            else:
-                QMessageBox.warning(self, "Błąd logowania", "Nieprawidłowa nazwa użytkownika lub hasło.")
-        except Exception as e:
-            QMessageBox.critical(self, "Błąd", f"Wystąpił błąd podczas logowania:\n{str(e)}")
+        return username, password
 
-    def on_register(self):
-        username = self.username_input.text().strip()
-        password = self.password_input.text()
+    def on_connect(self):
+        address = self.read_address()
+        if address:
+            self.start_bootstrap(address)
 
-        if not username:
-            QMessageBox.warning(self, "Błąd", "Wprowadź nazwę użytkownika.")
-            return
+    def on_login(self):
+        self.start_login(register=False)
 
-        if not password:
-            QMessageBox.warning(self, "Błąd", "Wprowadź hasło.")
+    def on_register(self):
+        self.start_login(register=True)
+
+    def start_login(self, register: bool):
+        # Bez wcześniejszego "Połącz" łączenie jest pierwszym krokiem tego samego potoku
+        address = None
+        if self.api_service is None:
+            address = self.read_address()
+            if not address:
+                return
+
+        credentials = self.read_credentials()
+        if credentials:
+            self.start_bootstrap(address, credentials, register)
+
+    def start_bootstrap(self, address, credentials=None, register=False):
+        lanes = (PRIMARY, INTERACTIVE, BULK) if os.environ.get("RECOMM_POOL") == "1" else (PRIMARY,)
+        policy = BackpressurePolicy(os.environ.get("RECOMM_BACKPRESSURE", BackpressurePolicy.DROP_BACKGROUND.value))
+        create_service = None
+        if address:
+            ip, port = address
+            create_service = functools.partial(
+                ApiService, host=ip, port=port, lanes=lanes, backpressure_policy=policy, connect=False
+            )
+
+        bootstrap = Bootstrap(create_service, self.api_service, credentials, register)
+        bootstrap.on_progress = functools.partial(self.bootstrap_progress.emit, bootstrap)
+        bootstrap.on_finished = functools.partial(self.bootstrap_finished.emit, bootstrap)
+        bootstrap.on_failed = functools.partial(self.bootstrap_failed.emit, bootstrap)
+        self.bootstrap = bootstrap
+        self.set_busy(True)
+        bootstrap.start()
+
+    def set_busy(self, busy: bool):
+        connected = self.api_service is not None
+        self.connect_button.setEnabled(not busy and not connected)
+        self.ip_input.setEnabled(not busy and not connected)
+        self.port_input.setEnabled(not busy and not connected)
+        self.username_input.setEnabled(not busy)
+        self.password_input.setEnabled(not busy)
+        self.login_button.setEnabled(not busy)
+        self.register_button.setEnabled(not busy)
+        self.progress_label.setVisible(busy)
+        self.progress_bar.setVisible(busy)
+        self.cancel_button.setVisible(busy)
+        if busy:
+            self.progress_label.setText("")
+            self.progress_bar.setRange(0, 0)
+
+    def set_status(self, text: str, color: str):
+        self.connection_status_label.setText(f"Status: {text}")
+        self.connection_status_label.setStyleSheet(f"color: {color}; font-weight: bold;")
+
+    def on_bootstrap_progress(self, bootstrap: Bootstrap, label: str, step: int, steps: int):
+        if bootstrap is not self.bootstrap:
             return
+        self.progress_label.setText(label)
+        self.progress_bar.setRange(0, steps)
+        self.progress_bar.setValue(step)
 
-        try:
-            success = self.api_service.register(username, password)
-            if success:
-                self.user = {
-                    "username": username
-                }
-                self.open_main_window()
-            else:
-                QMessageBox.warning(self, "Błąd rejestracji", "Nie udało się zarejestrować. Użytkownik może już istnieć.")
-        except Exception as e:
-            QMessageBox.critical(self, "Błąd", f"Wystąpił błąd podczas rejestracji:\n{str(e)}")
-
-    def open_main_window(self):
-        self.main_window = MainWindow(self.api_service, self.user)
+    def on_bootstrap_finished(self, bootstrap: Bootstrap, result: BootstrapResult):
+        if bootstrap is not self.bootstrap:
+            return
+        self.bootstrap = None
+        self.api_service = result.api_service
+        self.set_status("Połączono", "green")
+        self.set_busy(False)
+        if result.username:
+            self.user = {
+                "username": result.username
+            }
+            self.open_main_window(result)
+
+    def on_bootstrap_failed(self, bootstrap: Bootstrap, error: Exception):
+        if bootstrap is not self.bootstrap:
+            return
+        self.bootstrap = None
+        if isinstance(error, AuthenticationFailed) and self.api_service is None:
+            self.api_service = bootstrap.api_service
+            self.set_status("Połączono", "green")
+        self.set_busy(False)
+
+        if isinstance(error, AuthenticationFailed):
+            title = "Błąd rejestracji" if bootstrap.register else "Błąd logowania"
+            QMessageBox.warning(self, title, str(error))
+        elif self.api_service is None:
+            self.set_status("Błąd połączenia", "red")
+            QMessageBox.critical(self, "Błąd połączenia", f"Nie udało się połączyć z serwerem:\n{str(error)}")
+        else:
+            QMessageBox.critical(self, "Błąd", f"Wystąpił błąd podczas logowania:\n{str(error)}")
+
+    def on_cancel(self):
+        bootstrap = self.bootstrap
+        if bootstrap is None:
+            return
+        self.bootstrap = None
+        bootstrap.cancel()
+        if self.api_service is None:
+            self.set_status("Niepołączony", "red")
+        self.set_busy(False)
+
+    def open_main_window(self, prefetched: BootstrapResult = None):
+        self.main_window = MainWindow(self.api_service, self.user, prefetched)
         self.main_window.show()
         self.close()
 
+    def closeEvent(self, event):
+        if self.bootstrap is not None:
+            self.on_cancel()
+        super().closeEvent(event)
+
 
 def main():
+    log_listener = setup_logging()
     app = QApplication(sys.argv)
     window = LoginWindow()
     window.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    log_listener.stop()
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
@@ -1,35 +1,63 @@
+import functools
 import logging
+import os
 import threading
+import time
+from typing import Optional
 
 from PyQt6.QtCore import Qt, QTimer, QSize, pyqtSignal, QObject
+from PyQt6.QtGui import QAction, QKeySequence
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QListWidget, QListWidgetItem, QGroupBox, QSplitter, QFrame,
-    QPushButton, QDialog, QMessageBox
+    QPushButton, QDialog, QMessageBox, QDockWidget
 )
 
 from gui.dialog.add_friend import AddFriendDialog
 from gui.dialog.create_group import CreateGroupDialog
 from gui.dialog.friend_request import FriendRequestWidget
 from gui.dialog.group_settings import GroupSettingsDialog
+from gui.dialog.quick_switcher import QuickSwitcherDialog
+from gui.dialog.search_messages import SearchMessagesDialog
 from gui.widget.chat import ChatWidget
 from gui.widget.connection_indicator import ConnectionIndicator
 from gui.widget.group_item import GroupItemWidget
-from tools.api_service import ApiService
+from gui.widget.metrics_panel import MetricsPanel
+from tools.api_service import ApiService, ConnectionStatus
+from tools.bootstrap import BootstrapResult
+from tools.change_feed import FRIENDS, GROUPS, MEMBERS, GROUP_RENAMED, MEMBER_JOINED
+from tools.conversation_index import ConversationIndex, GROUP
+from tools.message_store import MAX_RESIDENT_MESSAGES, MAX_RESIDENT_BYTES
+from tools.metrics import MetricsDumper
+from tools.profiler import Profiler
+from tools.tracing import ChromeTraceExporter
+from tools.watchdog import StallWatchdog
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+def traced_slot(name: str):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            with self.api_service.tracer.interaction(name):
+                return method(self, *args)
+        return wrapper
+    return decorator
+
+
 class NotificationWorker(QObject):
 
     new_message_received = pyqtSignal(dict)
     friend_request_received = pyqtSignal(dict)
     group_message_received = pyqtSignal(dict)
+    conversation_resync = pyqtSignal(dict)
 
-    def __init__(self, notification_queue):
+    def __init__(self, notification_queue, metrics=None, tracer=None):
         super().__init__()
         self.notification_queue = notification_queue
+        self.metrics = metrics
+        self.tracer = tracer
         self.running = True
 
     def run(self):
@@ -37,12 +65,19 @@ class NotificationWorker(QObject):
             try:
                 notification = self.notification_queue.get(timeout=1.0)
 
+                if self.metrics is not None and '_receivedAt' in notification:
+                    self.metrics.observe("gui.notification_queue.wait", time.monotonic() - notification['_receivedAt'])
+                if self.tracer is not None:
+                    self.tracer.mark_id(notification.get('_spanId'), "dispatch")
+
                 if notification.get('type') == 'NEW_PRIVATE_MESSAGE':
                     self.new_message_received.emit(notification)
                 elif notification.get('type') == 'FRIEND_REQUEST':
                     self.friend_request_received.emit(notification)
                 elif notification.get('type') == 'NEW_GROUP_MESSAGE':
                     self.group_message_received.emit(notification)
+                elif notification.get('type') == 'RESYNC_CONVERSATION':
+                    self.conversation_resync.emit(notification)
 
             except Exception:
                 pass
@@ -52,11 +87,20 @@ class NotificationWorker(QObject):
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, api_service: ApiService, user: dict[str, str]):
+
+    backpressure_changed = pyqtSignal(bool)
+    outbox_changed = pyqtSignal(object)
+    connection_status_changed = pyqtSignal(object)
+    directory_changed = pyqtSignal(str, object)
+    subscription_finished = pyqtSignal(bool)
+
+    def __init__(self, api_service: ApiService, user: dict[str, str], prefetched: Optional[BootstrapResult] = None):
         super().__init__()
         self.placeholder_label = None
         self.create_group_button = None
         self.add_friend_button = None
+        self.search_button = None
+        self.switch_button = None
         self.groups_list = None
         self.friends_list = None
         self.connection_indicator = None
@@ -68,30 +112,78 @@ class MainWindow(QMainWindow):
         self.current_chat_friend = None
         self.current_chat_group_id = None
         self.current_chat_group_name = None
+        self.watched_conversation = None
+        self.group_settings_dialog = None
+        self.search_dialog = None
+        self.quick_switcher = None
+        self.subscribed = False
+        self.lists_prefetched = False
+        self.message_archive = None
         self.cached_friends = []
         self.cached_pending_requests = []
         self.cached_groups = []
+        # Znajomi i grupy do szybkiego przełączania (Ctrl+K), aktualizowane razem z listami
+        self.conversation_index = ConversationIndex()
+        self.metrics_dock = None
+        self.metrics_dumper = None
+        self.trace_exporter = None
+        self.trace_path = os.environ.get("RECOMM_TRACE_FILE", "recomm_trace.json")
+        self.stall_watchdog = None
+        self.stall_timer = None
+        self.profiler = Profiler(os.environ.get("RECOMM_PROFILE_DIR", "."))
         self.api_service = api_service
         self.username = user['username']
         self.init_ui()
-        self.load_data()
-
-        self.connection_timer = QTimer()
-        self.connection_timer.timeout.connect(self.check_connection)
-        self.connection_timer.start(5000)
+        self.init_debug_tools()
+        self.backpressure_changed.connect(self.on_backpressure_changed)
+        self.api_service.on_backpressure = self.backpressure_changed.emit
+        self.outbox_changed.connect(self.on_outbox_changed)
+        # Stan połączenia przychodzi z wątków sieciowych jako sygnał kolejkowany do wątku GUI
+        self.connection_status_changed.connect(self.on_connection_status)
+        self.api_service.on_connection_status = self.connection_status_changed.emit
+        data_dir = os.environ.get("RECOMM_DATA_DIR", os.path.join(os.path.expanduser("~"), ".recomm"))
+        self.api_service.open_outbox(
+            os.path.join(data_dir, f"outbox_{self.username}.jsonl"), self.outbox_changed.emit
+        )
+        # Lokalne archiwum wiadomości: przeszukiwana kopia wszystkiego, co przyszło z serwera,
+        # i miejsce, do którego okno czatu wypycha starsze wiadomości otwartej rozmowy
+        self.message_archive = self.api_service.open_message_archive(
+            os.path.join(data_dir, f"messages_{self.username}.sqlite3")
+        )
+        self.chat_max_messages = int(os.environ.get("RECOMM_CHAT_MAX_MESSAGES", MAX_RESIDENT_MESSAGES))
+        self.chat_max_bytes = int(os.environ.get("RECOMM_CHAT_MAX_BYTES", MAX_RESIDENT_BYTES))
+        # Z subskrypcją zmian listy aktualizują zdarzenia z serwera; bez niej są odpytywane co sekundę
+        self.directory_changed.connect(self.on_directory_changed)
+        self.api_service.change_feed.on_change = self.directory_changed.emit
+        if prefetched is not None and prefetched.friends is not None:
+            # Listy pobrane już w trakcie logowania - okno otwiera się wypełnione
+            self.show_friends(prefetched.pending_requests, prefetched.friends)
+            self.show_groups(prefetched.groups)
+            self.lists_prefetched = True
+
+        self.on_connection_status(self.api_service.connection_status())
 
         self.friends_timer = QTimer()
-        self.friends_timer.timeout.connect(self.load_friends)
-        self.friends_timer.start(1000)
+        self.friends_timer.timeout.connect(self.poll_friends)
 
         self.groups_timer = QTimer()
-        self.groups_timer.timeout.connect(self.load_groups)
-        self.groups_timer.start(1000)
-
-        self.notification_worker = NotificationWorker(self.api_service.notification_queue)
+        self.groups_timer.timeout.connect(self.poll_groups)
+
+        # Włączenie subskrypcji to zapytanie do serwera - rozstrzygnięte już przy logowaniu
+        # albo w wątku roboczym, nigdy w wątku GUI
+        self.subscription_finished.connect(self.on_subscription_finished)
+        if prefetched is not None and prefetched.subscribed is not None:
+            self.on_subscription_finished(prefetched.subscribed)
+        else:
+            threading.Thread(target=self.run_subscribe_changes, daemon=True).start()
+
+        self.notification_worker = NotificationWorker(
+            self.api_service.notification_queue, self.api_service.metrics, self.api_service.tracer
+        )
         self.notification_worker.new_message_received.connect(self.on_new_message_received)
         self.notification_worker.friend_request_received.connect(self.on_friend_request_received)
         self.notification_worker.group_message_received.connect(self.on_group_message_received)
+        self.notification_worker.conversation_resync.connect(self.on_conversation_resync)
         self.notification_thread = threading.Thread(target=self.notification_worker.run, daemon=True)
         self.notification_thread.start()
 
@@ -114,13 +206,32 @@ class MainWindow(QMainWindow):
         top_bar_layout.addWidget(self.username_label)
 
         self.connection_indicator = ConnectionIndicator()
-        self.connection_indicator.set_connected(True)
         top_bar_layout.addWidget(self.connection_indicator)
 
         top_bar_layout.addStretch()
 
+        self.switch_button = QPushButton("Przejdź do…")
+        self.switch_button.setToolTip("Przejdź do rozmowy (Ctrl+K)")
+        self.switch_button.clicked.connect(self.show_quick_switcher)
+        top_bar_layout.addWidget(self.switch_button)
+
+        self.search_button = QPushButton("Szukaj")
+        self.search_button.setToolTip("Szukaj w wiadomościach (Ctrl+F)")
+        self.search_button.clicked.connect(self.show_search_dialog)
+        top_bar_layout.addWidget(self.search_button)
+
         main_layout.addWidget(top_bar)
 
+        search_action = QAction("Szukaj w wiadomościach", self)
+        search_action.setShortcut(QKeySequence("Ctrl+F"))
+        search_action.triggered.connect(self.show_search_dialog)
+        self.addAction(search_action)
+
+        switch_action = QAction("Przejdź do rozmowy", self)
+        switch_action.setShortcut(QKeySequence("Ctrl+K"))
+        switch_action.triggered.connect(self.show_quick_switcher)
+        self.addAction(switch_action)
+
         splitter = QSplitter(Qt.Orientation.Horizontal)
 
         left_panel = QWidget()
@@ -175,96 +286,241 @@ class MainWindow(QMainWindow):
 
         main_layout.addWidget(splitter)
 
+    def init_debug_tools(self):
+        metrics_path = os.environ.get("RECOMM_METRICS_FILE")
+        if metrics_path:
+            interval = float(os.environ.get("RECOMM_METRICS_INTERVAL", "10"))
+            self.metrics_dumper = MetricsDumper(self.api_service.metrics, metrics_path, interval)
+            self.metrics_dumper.start()
+
+        self.metrics_dock = QDockWidget("Metryki klienta", self)
+        self.metrics_dock.setWidget(MetricsPanel(self.api_service.metrics))
+        self.metrics_dock.hide()
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.metrics_dock)
+
+        metrics_action = QAction("Panel metryk", self)
+        metrics_action.setShortcut(QKeySequence("Ctrl+Shift+M"))
+        metrics_action.triggered.connect(self.toggle_metrics_panel)
+        self.addAction(metrics_action)
+
+        trace_action = QAction("Nagrywanie śladu (Chrome trace)", self)
+        trace_action.setShortcut(QKeySequence("Ctrl+Shift+T"))
+        trace_action.triggered.connect(self.toggle_tracing)
+        self.addAction(trace_action)
+
+        if os.environ.get("RECOMM_TRACE_FILE"):
+            self.toggle_tracing()
+
+        cpu_profile_action = QAction("Profilowanie CPU (cProfile)", self)
+        cpu_profile_action.triggered.connect(lambda: self.toggle_profiler("cpu"))
+        memory_profile_action = QAction("Profilowanie pamięci (tracemalloc)", self)
+        memory_profile_action.triggered.connect(lambda: self.toggle_profiler("memory"))
+
+        profile_mode = os.environ.get("RECOMM_PROFILE")
+        if profile_mode:
+            self.profiler.start(profile_mode)
+
+        debug = os.environ.get("RECOMM_DEBUG") == "1"
+        stall_ms = int(os.environ.get("RECOMM_STALL_MS", "50" if debug else "0"))
+        if stall_ms > 0:
+            self.stall_watchdog = StallWatchdog(stall_ms / 1000, self.api_service.metrics)
+            self.stall_watchdog.start()
+            self.stall_timer = QTimer()
+            self.stall_timer.timeout.connect(self.stall_watchdog.beat)
+            self.stall_timer.start(max(stall_ms // 4, 5))
+
+        if debug:
+            debug_menu = self.menuBar().addMenu("Debug")
+            debug_menu.addAction(metrics_action)
+            debug_menu.addAction(trace_action)
+            debug_menu.addSeparator()
+            debug_menu.addAction(cpu_profile_action)
+            debug_menu.addAction(memory_profile_action)
+
+    def toggle_metrics_panel(self):
+        self.metrics_dock.setVisible(not self.metrics_dock.isVisible())
+
+    def toggle_tracing(self):
+        if self.trace_exporter is None:
+            self.trace_exporter = ChromeTraceExporter()
+            self.api_service.tracer.add_hook(self.trace_exporter)
+            logger.info("Nagrywanie śladu włączone, zapis do %s", self.trace_path)
+            return
+
+        self.api_service.tracer.remove_hook(self.trace_exporter)
+        try:
+            count = self.trace_exporter.export(self.trace_path)
+            logger.info("Zapisano %d zakresów śladu do %s", count, self.trace_path)
+        except OSError as e:
+            logger.warning("Nie udało się zapisać śladu: %s", e)
+        self.trace_exporter = None
+
+    def toggle_profiler(self, mode: str):
+        try:
+            result = self.profiler.toggle(mode)
+            if result:
+                QMessageBox.information(self, "Profilowanie", f"Zapisano wyniki profilowania:\n{result}.*")
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Profilowanie", f"Błąd profilowania: {e}")
+
+    def record_notification_render(self, notification: dict):
+        received_at = notification.get('_receivedAt')
+        if received_at is not None:
+            self.api_service.metrics.observe("gui.notification_to_render", time.monotonic() - received_at)
+
     def load_data(self):
         self.load_friends()
         self.load_groups()
 
+    @traced_slot("load_friends")
     def load_friends(self):
+        # W trybie subskrypcji listę aktualizują zdarzenia z serwera
+        if self.subscribed:
+            return
         try:
             pending_requests = self.api_service.get_pending_friend_requests() or []
             friends = self.api_service.get_all_friends() or []
+            self.show_friends(pending_requests, friends)
+        except Exception as e:
+            logger.warning("Błąd podczas pobierania przyjaciół: %s", e)
+
+    def show_friends(self, pending_requests: list, friends: list):
+        new_pending = []
+        for request in pending_requests:
+            if isinstance(request, dict):
+                requester = request.get('from', request.get('requester', 'null'))
+                if (not requester) and self.username == request:
+                    requester = request.get('addressee', 'null')
+            else:
+                requester = str(request)
+            if requester:
+                new_pending.append(requester)
 
-            new_pending = []
-            for request in pending_requests:
-                if isinstance(request, dict):
-                    requester = request.get('from', request.get('requester', 'null'))
-                    if (not requester) and self.username == request:
-                        requester = request.get('addressee', 'null')
-                else:
-                    requester = str(request)
-                if requester:
-                    new_pending.append(requester)
-
-            new_friends = [str(friend) for friend in friends]
-
-            if new_pending == self.cached_pending_requests and new_friends == self.cached_friends:
-                return
+        new_friends = [str(friend) for friend in friends]
 
-            self.cached_pending_requests = new_pending
-            self.cached_friends = new_friends
+        if new_pending == self.cached_pending_requests and new_friends == self.cached_friends:
+            return
 
-            logger.info(f"Refreshing friend list - changes detected")
-            self.friends_list.clear()
+        self.cached_pending_requests = new_pending
+        self.cached_friends = new_friends
+        self.conversation_index.set_friends(new_friends)
 
-            for requester in new_pending:
-                item = QListWidgetItem()
-                item.setSizeHint(QSize(0, 30))
-                self.friends_list.addItem(item)
+        logger.info("Refreshing friend list - changes detected")
+        self.friends_list.clear()
 
-                request_widget = FriendRequestWidget(requester)
-                request_widget.accepted.connect(self.on_accept_friend_request)
-                request_widget.rejected.connect(self.on_reject_friend_request)
-                self.friends_list.setItemWidget(item, request_widget)
+        for requester in new_pending:
+            item = QListWidgetItem()
+            item.setSizeHint(QSize(0, 30))
+            self.friends_list.addItem(item)
 
-            for friend_name in new_friends:
-                item = QListWidgetItem(friend_name)
-                self.friends_list.addItem(item)
+            request_widget = FriendRequestWidget(requester)
+            request_widget.accepted.connect(self.on_accept_friend_request)
+            request_widget.rejected.connect(self.on_reject_friend_request)
+            self.friends_list.setItemWidget(item, request_widget)
 
-        except Exception as e:
-            logger.warning(f"Błąd podczas pobierania przyjaciół: {e}")
+        for friend_name in new_friends:
+            item = QListWidgetItem(friend_name)
+            self.friends_list.addItem(item)
 
+    @traced_slot("load_groups")
     def load_groups(self):
+        if self.subscribed:
+            return
         try:
             groups = self.api_service.get_all_users_groups() or []
+            self.show_groups(groups)
+        except Exception as e:
+            logger.warning("Błąd podczas pobierania grup: %s", e)
+
+    def show_groups(self, groups: list):
+        new_groups = []
+        for group in groups:
+            if isinstance(group, dict):
+                group_id = group.get('id', group.get('groupId', ''))
+                group_name = group.get('name', group.get('groupName', str(group)))
+            else:
+                group_id = str(group)
+                group_name = str(group)
+            new_groups.append((group_id, group_name))
 
-            new_groups = []
-            for group in groups:
-                if isinstance(group, dict):
-                    group_id = group.get('id', group.get('groupId', ''))
-                    group_name = group.get('name', group.get('groupName', str(group)))
-                else:
-                    group_id = str(group)
-                    group_name = str(group)
-                new_groups.append((group_id, group_name))
+        if new_groups == self.cached_groups:
+            return
 
-            if new_groups == self.cached_groups:
-                return
+        self.cached_groups = new_groups
+        self.conversation_index.set_groups(new_groups)
 
-            self.cached_groups = new_groups
+        logger.info("Refreshing groups list - changes detected")
+        self.groups_list.clear()
 
-            logger.info(f"Refreshing groups list - changes detected")
-            self.groups_list.clear()
+        for group_id, group_name in new_groups:
+            item = QListWidgetItem()
+            item.setSizeHint(QSize(0, 30))
+            self.groups_list.addItem(item)
 
-            for group_id, group_name in new_groups:
-                item = QListWidgetItem()
-                item.setSizeHint(QSize(0, 30))
-                self.groups_list.addItem(item)
-
-                group_widget = GroupItemWidget(group_id, group_name)
-                group_widget.settings_clicked.connect(self.on_group_settings)
-                self.groups_list.setItemWidget(item, group_widget)
+            group_widget = GroupItemWidget(group_id, group_name)
+            group_widget.settings_clicked.connect(self.on_group_settings)
+            self.groups_list.setItemWidget(item, group_widget)
 
+    def run_subscribe_changes(self):
+        # Wątek roboczy - wynik wraca sygnałem
+        try:
+            subscribed = self.api_service.subscribe_changes()
         except Exception as e:
-            logger.warning(f"Błąd podczas pobierania grup: {e}")
+            logger.warning("Nie udało się włączyć subskrypcji zmian: %s", e)
+            subscribed = False
+        self.subscription_finished.emit(subscribed)
+
+    def on_subscription_finished(self, subscribed: bool):
+        self.subscribed = subscribed
+        if subscribed:
+            self.show_directory()
+            return
+        # Bez subskrypcji listy są odpytywane co sekundę
+        if not self.lists_prefetched:
+            self.load_data()
+        self.friends_timer.start(1000)
+        self.groups_timer.start(1000)
 
-    def check_connection(self):
-        try:
-            is_connected = self.api_service.tcp_client.is_connected
-            self.connection_indicator.set_connected(is_connected)
-            logger.debug(f"Connected: {is_connected}")
-        except Exception:
-            logger.warning("Connection error")
-            self.connection_indicator.set_connected(False)
+    def show_directory(self):
+        pending_requests, friends, groups = self.api_service.change_feed.snapshot()
+        self.show_friends(pending_requests, friends)
+        self.show_groups(groups)
+
+    def on_directory_changed(self, scope: str, event: dict):
+        if scope == FRIENDS:
+            pending_requests, friends, _ = self.api_service.change_feed.snapshot()
+            self.show_friends(pending_requests, friends)
+        elif scope == GROUPS:
+            self.show_groups(self.api_service.change_feed.snapshot()[2])
+            if event.get('type') == GROUP_RENAMED and event.get('groupId') == self.current_chat_group_id:
+                self.current_chat_group_name = event['name']
+                if self.chat_widget:
+                    self.chat_widget.set_title(event['name'])
+        elif scope == MEMBERS:
+            dialog = self.group_settings_dialog
+            if dialog is not None and dialog.group_id == event.get('groupId'):
+                dialog.apply_member_change(event['username'], event['type'] == MEMBER_JOINED)
+        else:
+            self.show_directory()
+
+    def poll_friends(self):
+        # Przy przepełnionej kolejce wysyłania odpytywanie w tle tylko by ją wydłużało
+        if self.api_service.backpressure:
+            return
+        with self.api_service.background():
+            self.load_friends()
+
+    def poll_groups(self):
+        if self.api_service.backpressure:
+            return
+        with self.api_service.background():
+            self.load_groups()
+
+    def on_backpressure_changed(self, active: bool):
+        self.connection_indicator.set_congested(active)
+
+    def on_connection_status(self, status: ConnectionStatus):
+        self.connection_indicator.set_status(status)
 
     def show_add_friend_dialog(self):
         dialog = AddFriendDialog(self)
@@ -302,7 +558,6 @@ class MainWindow(QMainWindow):
     def on_group_settings(self, group_id: str, group_name: str):
         try:
             group_details = self.api_service.get_group_details(group_id)
-            members = self.api_service.get_group_members(group_id) or []
 
             owner_username = ""
             if group_details and isinstance(group_details, dict):
@@ -311,21 +566,27 @@ class MainWindow(QMainWindow):
             dialog = GroupSettingsDialog(
                 group_id=group_id,
                 group_name=group_name,
-                members=members,
                 current_username=self.username,
                 owner_username=owner_username,
                 api_service=self.api_service,
                 parent=self
             )
-            dialog.exec()
+            self.group_settings_dialog = dialog
+            try:
+                dialog.exec()
+            finally:
+                self.group_settings_dialog = None
 
             self.load_groups()
 
         except Exception as e:
             QMessageBox.critical(self, "Błąd", f"Nie udało się otworzyć ustawień grupy: {str(e)}")
 
+    @traced_slot("on_friend_clicked")
     def on_friend_clicked(self, item: QListWidgetItem):
-        friend_name = item.text()
+        self.open_private_chat(item.text())
+
+    def open_private_chat(self, friend_name: str):
         self.current_chat_friend = friend_name
         self.current_chat_group_id = None
         self.current_chat_group_name = None
@@ -335,61 +596,109 @@ class MainWindow(QMainWindow):
             if child.widget():
                 child.widget().deleteLater()
 
-        self.chat_widget = ChatWidget(friend_name, self.username, is_group=False)
+        self.chat_widget = self.create_chat_widget(friend_name, "user", friend_name)
         self.chat_widget.message_sent.connect(self.on_send_message)
+        self.chat_widget.retry_requested.connect(self.on_retry_message)
+        self.chat_widget.discard_requested.connect(self.on_discard_message)
         self.main_content_layout.addWidget(self.chat_widget)
 
         self.load_chat_messages(friend_name)
+        self.show_pending_messages("user", friend_name)
+
+    def create_chat_widget(self, title: str, kind: str, target: str) -> ChatWidget:
+        return ChatWidget(
+            title, self.username, is_group=kind == "group",
+            archive=self.message_archive, conversation=(kind, target),
+            max_messages=self.chat_max_messages, max_bytes=self.chat_max_bytes
+        )
 
     def load_chat_messages(self, friend_name: str):
         try:
             messages = self.api_service.get_private_messages(friend_name)
+            self.watch_conversation("user", friend_name, messages or [])
             if messages and self.chat_widget:
-                sorted_messages = sorted(messages, key=lambda m: m.get('sentAt', 0) if isinstance(m, dict) else 0)
-
-                for msg in sorted_messages:
+                for msg in messages:
                     if isinstance(msg, dict):
                         author = msg.get('senderName', 'null')
                         content = msg.get('content', 'null')
                     else:
                         author = ''
                         content = str(msg)
+                        msg = {}
 
                     is_own = (author == self.username)
-                    self.chat_widget.add_message(author, content, is_own)
+                    self.chat_widget.add_message(
+                        author, content, is_own, message_id=msg.get('messageId'), sent_at=msg.get('sentAt')
+                    )
         except Exception as e:
-            logger.warning(f"Błąd podczas ładowania wiadomości: {e}")
+            logger.warning("Błąd podczas ładowania wiadomości: %s", e)
 
+    @traced_slot("on_send_message")
     def on_send_message(self, message: str):
+        # Wiadomość trafia najpierw do dziennika na dysku; wysyła ją wątek skrzynki nadawczej,
+        # także po ponownym połączeniu lub restarcie aplikacji
         if self.current_chat_friend and message:
             try:
-                message_id = self.api_service.send_message_to_user(self.current_chat_friend, message)
-                if message_id:
-                    if self.chat_widget:
-                        self.chat_widget.add_message(self.username, message, True)
-                else:
-                    QMessageBox.warning(self, "Błąd", "Nie udało się wysłać wiadomości.")
+                entry = self.api_service.queue_message_to_user(self.current_chat_friend, message)
+                if self.chat_widget:
+                    self.chat_widget.add_message(self.username, message, True, entry.key, entry.state)
             except Exception as e:
                 QMessageBox.critical(self, "Błąd", f"Wystąpił błąd: {str(e)}")
         elif self.current_chat_group_id and message:
             try:
-                message_id = self.api_service.send_message_to_group(self.current_chat_group_id, message)
-                if message_id:
-                    if self.chat_widget:
-                        self.chat_widget.add_message(self.username, message, True)
-                else:
-                    QMessageBox.warning(self, "Błąd", "Nie udało się wysłać wiadomości do grupy.")
+                entry = self.api_service.queue_message_to_group(self.current_chat_group_id, message)
+                if self.chat_widget:
+                    self.chat_widget.add_message(self.username, message, True, entry.key, entry.state)
             except Exception as e:
                 QMessageBox.critical(self, "Błąd", f"Wystąpił błąd: {str(e)}")
 
+    def watch_conversation(self, kind: str, target: str, messages: list):
+        # Po ponownym połączeniu ApiService dociąga do otwartej rozmowy tylko brakujące wiadomości
+        if self.watched_conversation:
+            self.api_service.unwatch_conversation(*self.watched_conversation)
+        last_seen = max((m.get('sentAt', 0) for m in messages if isinstance(m, dict)), default=0)
+        self.api_service.watch_conversation(kind, target, last_seen)
+        self.watched_conversation = (kind, target)
+
+    def on_conversation_resync(self, notification: dict):
+        if (notification.get('kind'), notification.get('target')) != self.watched_conversation or not self.chat_widget:
+            return
+
+        # Przeładowana strona historii scala się z tym, co już widać - duplikaty odpadają po messageId
+        if notification.get('kind') == "group":
+            self.load_group_chat_messages(notification['target'])
+        else:
+            self.load_chat_messages(notification['target'])
+        self.show_pending_messages(notification['kind'], notification['target'])
+
+    def show_pending_messages(self, kind: str, target: str):
+        if not self.chat_widget:
+            return
+        # Razem z oczekującymi wracają wiadomości odrzucone przez serwer, także z poprzednich sesji
+        for entry in self.api_service.outbox.unsent((kind, target)):
+            self.chat_widget.add_message(self.username, entry.content, True, entry.key, entry.state)
+            if entry.error:
+                self.chat_widget.set_message_state(entry.key, entry.state, entry.error)
+
+    def on_outbox_changed(self, entry):
+        if self.chat_widget:
+            self.chat_widget.set_message_state(entry.key, entry.state, entry.error, entry.message_id, entry.sent_at)
+
+    def on_retry_message(self, key: str):
+        self.api_service.retry_outbox_entry(key)
+
+    def on_discard_message(self, key: str):
+        self.api_service.discard_outbox_entry(key)
+
+    @traced_slot("on_group_clicked")
     def on_group_clicked(self, item: QListWidgetItem):
         widget = self.groups_list.itemWidget(item)
         if not isinstance(widget, GroupItemWidget):
             return
 
-        group_id = widget.group_id
-        group_name = widget.group_name
+        self.open_group_chat(widget.group_id, widget.group_name)
 
+    def open_group_chat(self, group_id: str, group_name: str):
         self.current_chat_group_id = group_id
         self.current_chat_group_name = group_name
         self.current_chat_friend = None
@@ -399,61 +708,85 @@ class MainWindow(QMainWindow):
             if child.widget():
                 child.widget().deleteLater()
 
-        self.chat_widget = ChatWidget(group_name, self.username, is_group=True)
+        self.chat_widget = self.create_chat_widget(group_name, "group", group_id)
         self.chat_widget.message_sent.connect(self.on_send_message)
+        self.chat_widget.retry_requested.connect(self.on_retry_message)
+        self.chat_widget.discard_requested.connect(self.on_discard_message)
         self.main_content_layout.addWidget(self.chat_widget)
 
         self.load_group_chat_messages(group_id)
+        self.show_pending_messages("group", group_id)
 
     def load_group_chat_messages(self, group_id: str):
         try:
             messages = self.api_service.get_group_messages(group_id)
+            self.watch_conversation("group", group_id, messages or [])
             if messages and self.chat_widget:
-                sorted_messages = sorted(messages, key=lambda m: m.get('sentAt', 0) if isinstance(m, dict) else 0)
-
-                for msg in sorted_messages:
+                for msg in messages:
                     if isinstance(msg, dict):
                         author = msg.get('senderName', msg.get('sender', ''))
                         content = msg.get('content', msg.get('message', ''))
                     else:
                         author = ''
                         content = str(msg)
+                        msg = {}
 
                     is_own = (author == self.username)
-                    self.chat_widget.add_message(author, content, is_own)
+                    self.chat_widget.add_message(
+                        author, content, is_own, message_id=msg.get('messageId'), sent_at=msg.get('sentAt')
+                    )
         except Exception as e:
-            logger.warning(f"Błąd podczas ładowania wiadomości grupowych: {e}")
+            logger.warning("Błąd podczas ładowania wiadomości grupowych: %s", e)
 
     def on_new_message_received(self, notification: dict):
+        self.api_service.tracer.mark_id(notification.get('_spanId'), "render")
         try:
             sender = notification.get('senderName', notification.get('sender', ''))
             content = notification.get('content', notification.get('message', ''))
+            # Własna wiadomość wysłana z innej sesji (uzupełnienie po ponownym połączeniu) należy do rozmowy z odbiorcą
+            is_own = (sender == self.username)
+            correspondent = notification.get('receiverName', sender) if is_own else sender
 
-            if self.current_chat_friend and sender == self.current_chat_friend:
+            if self.current_chat_friend and correspondent == self.current_chat_friend:
                 if self.chat_widget:
-                    is_own = (sender == self.username)
-                    self.chat_widget.add_message(sender, content, is_own)
+                    self.chat_widget.add_message(
+                        sender, content, is_own,
+                        message_id=notification.get('messageId'), sent_at=notification.get('sentAt')
+                    )
+                    self.record_notification_render(notification)
 
-            logger.debug(f"Otrzymano nową wiadomość od {sender}: {content}")
+            logger.debug("Otrzymano nową wiadomość od %s", sender)
         except Exception as e:
-            logger.warning(f"Błąd podczas obsługi nowej wiadomości: {e}")
+            logger.warning("Błąd podczas obsługi nowej wiadomości: %s", e)
+        finally:
+            self.api_service.tracer.end_id(notification.get('_spanId'))
 
     def on_group_message_received(self, notification: dict):
+        self.api_service.tracer.mark_id(notification.get('_spanId'), "render")
         try:
             sender = notification.get('senderName', notification.get('sender', ''))
             content = notification.get('content', notification.get('message', ''))
             group_id = notification.get('groupId', notification.get('group_id', ''))
 
             if self.current_chat_group_id and str(group_id) == str(self.current_chat_group_id):
-                if self.chat_widget and sender != self.username:
+                # Własne wiadomości przychodzą tu tylko z uzupełnienia luki (wysłane z innej sesji) -
+                # te wysłane z tej sesji odrzuca messageId
+                if self.chat_widget:
                     is_own = (sender == self.username)
-                    self.chat_widget.add_message(sender, content, is_own)
+                    self.chat_widget.add_message(
+                        sender, content, is_own,
+                        message_id=notification.get('messageId'), sent_at=notification.get('sentAt')
+                    )
+                    self.record_notification_render(notification)
 
-            logger.debug(f"Otrzymano nową wiadomość grupową od {sender} w grupie {group_id}: {content}")
+            logger.debug("Otrzymano nową wiadomość grupową od %s w grupie %s", sender, group_id)
         except Exception as e:
-            logger.warning(f"Błąd podczas obsługi nowej wiadomości grupowej: {e}")
+            logger.warning("Błąd podczas obsługi nowej wiadomości grupowej: %s", e)
+        finally:
+            self.api_service.tracer.end_id(notification.get('_spanId'))
 
     def on_friend_request_received(self, notification: dict):
+        self.api_service.tracer.mark_id(notification.get('_spanId'), "render")
         try:
             requester = notification.get('from')
 
@@ -473,15 +806,63 @@ class MainWindow(QMainWindow):
                 request_widget.rejected.connect(self.on_reject_friend_request)
                 self.friends_list.setItemWidget(item, request_widget)
 
-                logger.info(f"Otrzymano zaproszenie do znajomych od {requester}")
+                logger.info("Otrzymano zaproszenie do znajomych od %s", requester)
         except Exception as e:
-            logger.warning(f"Błąd podczas obsługi zaproszenia do znajomych: {e}")
+            logger.warning("Błąd podczas obsługi zaproszenia do znajomych: %s", e)
+        finally:
+            self.api_service.tracer.end_id(notification.get('_spanId'))
+
+    def show_search_dialog(self):
+        # Okno niemodalne - wyniki można przeglądać, skacząc po rozmowach
+        if self.search_dialog is None:
+            self.search_dialog = SearchMessagesDialog(
+                self.message_archive, self.conversation_title, self.current_conversation, self
+            )
+            self.search_dialog.message_selected.connect(self.on_search_result)
+            self.search_dialog.finished.connect(self.on_search_dialog_closed)
+        self.search_dialog.show()
+        self.search_dialog.raise_()
+        self.search_dialog.activateWindow()
+
+    def on_search_dialog_closed(self):
+        self.search_dialog.deleteLater()
+        self.search_dialog = None
+
+    def current_conversation(self) -> Optional[tuple[str, str]]:
+        return self.watched_conversation if self.chat_widget else None
+
+    def group_name(self, group_id: str) -> str:
+        return self.conversation_index.title(GROUP, group_id) or group_id
+
+    def conversation_title(self, kind: str, target: str) -> str:
+        return f"Grupa: {self.group_name(target)}" if kind == "group" else target
+
+    def show_quick_switcher(self):
+        if self.quick_switcher is None:
+            self.quick_switcher = QuickSwitcherDialog(self.conversation_index, self)
+            self.quick_switcher.conversation_selected.connect(self.open_conversation)
+        self.quick_switcher.popup()
+
+    def open_conversation(self, kind: str, target: str):
+        # Tak jak kliknięcie na liście; już otwarta rozmowa nie jest przeładowywana
+        if (kind, target) == self.watched_conversation and self.chat_widget:
+            return
+        if kind == GROUP:
+            self.open_group_chat(target, self.group_name(target))
+        else:
+            self.open_private_chat(target)
+
+    def on_search_result(self, hit):
+        # Wynik z innej rozmowy otwiera ją tak jak kliknięcie na liście
+        self.open_conversation(hit.kind, hit.target)
+        if self.chat_widget:
+            self.chat_widget.jump_to(hit.message_id, hit.order)
 
     def on_accept_friend_request(self, requester_username: str):
         try:
             success = self.api_service.accept_friend_request(requester_username)
             if success:
-                logger.info(f"Zaakceptowano zaproszenie od {requester_username}")
+                logger.info("Zaakceptowano zaproszenie od %s", requester_username)
                 self.load_friends()
             else:
                 QMessageBox.warning(self, "Błąd", f"Nie udało się zaakceptować zaproszenia od {requester_username}.")
@@ -492,7 +873,7 @@ class MainWindow(QMainWindow):
         try:
             success = self.api_service.reject_friend_request(requester_username)
             if success:
-                logger.info(f"Odrzucono zaproszenie od {requester_username}")
+                logger.info("Odrzucono zaproszenie od %s", requester_username)
                 self.load_friends()
             else:
                 QMessageBox.warning(self, "Błąd", f"Nie udało się odrzucić zaproszenia od {requester_username}.")
@@ -500,15 +881,30 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Błąd", f"Wystąpił błąd: {str(e)}")
 
     def closeEvent(self, event):
-        self.connection_timer.stop()
+        self.api_service.on_connection_status = None
         self.friends_timer.stop()
         self.groups_timer.stop()
 
         if hasattr(self, 'notification_worker'):
             self.notification_worker.stop()
 
+        if self.metrics_dumper:
+            self.metrics_dumper.stop()
+
+        if self.trace_exporter:
+            self.toggle_tracing()
+
+        if self.stall_watchdog:
+            self.stall_timer.stop()
+            self.stall_watchdog.stop()
+
+        if self.profiler.running:
+            self.profiler.stop()
+
+        self.api_service.on_backpressure = None
+        self.api_service.outbox.on_change = None
         try:
-            self.api_service.tcp_client.disconnect()
+            self.api_service.disconnect()
         except Exception:
             pass
         event.accept()
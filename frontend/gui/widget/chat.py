@@ -1,13 +1,33 @@
+import functools
+from typing import Optional
+
 from PyQt6.QtCore import pyqtSignal, Qt, QTimer
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QFrame, QHBoxLayout, QLabel, QScrollArea, QLineEdit, QPushButton
 
 from gui.widget.message import MessageWidget
+from tools.message_archive import MessageArchive
+from tools.message_store import ConversationStore, StoredMessage, MAX_RESIDENT_MESSAGES, MAX_RESIDENT_BYTES
+
+# Tyle wiadomości wczytuje się z archiwum po przewinięciu do krawędzi okna
+ARCHIVE_PAGE = 100
 
 
 class ChatWidget(QWidget):
     message_sent = pyqtSignal(str)
+    retry_requested = pyqtSignal(str)
+    discard_requested = pyqtSignal(str)
 
-    def __init__(self, correspondent_name: str, current_username: str, is_group: bool = False, parent=None):
+    def __init__(
+        self,
+        correspondent_name: str,
+        current_username: str,
+        is_group: bool = False,
+        parent=None,
+        archive: Optional[MessageArchive] = None,
+        conversation: Optional[tuple[str, str]] = None,
+        max_messages: int = MAX_RESIDENT_MESSAGES,
+        max_bytes: int = MAX_RESIDENT_BYTES
+    ):
         super().__init__(parent)
         self.send_button = None
         self.message_input = None
@@ -18,8 +38,22 @@ class ChatWidget(QWidget):
         self.correspondent_name = correspondent_name
         self.current_username = current_username
         self.is_group = is_group
+        self.tracked_messages: dict[str, MessageWidget] = {}
+        self.archive = archive
+        self.conversation = conversation
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.store = self.create_store()
+        # Widok przewinięty na koniec rozmowy - nowe wiadomości wypychają wtedy najstarsze
+        self.following = True
+        self._loading = False
+        self._anchor: Optional[tuple[QWidget, int]] = None
         self.init_ui()
 
+    def create_store(self) -> ConversationStore:
+        # Bez archiwum wiadomości nie są wypychane z pamięci
+        return ConversationStore(self.archive, self.conversation, self.max_messages, self.max_bytes)
+
     def init_ui(self):
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
@@ -51,6 +85,9 @@ class ChatWidget(QWidget):
         self.scroll_area.setWidget(self.messages_container)
         layout.addWidget(self.scroll_area)
 
+        scrollbar = self.scroll_area.verticalScrollBar()
+        scrollbar.valueChanged.connect(self.on_scrolled)
+
         input_container = QWidget()
         input_layout = QHBoxLayout(input_container)
         input_layout.setContentsMargins(5, 5, 5, 5)
@@ -67,17 +104,184 @@ class ChatWidget(QWidget):
 
         layout.addWidget(input_container)
 
-    def add_message(self, author: str, content: str, is_own: bool):
-        message_widget = MessageWidget(author, content, is_own)
-        self.messages_layout.addWidget(message_widget)
+    def add_message(
+        self,
+        author: str,
+        content: str,
+        is_own: bool,
+        key: Optional[str] = None,
+        state: Optional[str] = None,
+        message_id: Optional[str] = None,
+        sent_at: Optional[int] = None
+    ) -> Optional[MessageWidget]:
+        # Pozycja w układzie odpowiada pozycji w store - wiadomość, która przyszła
+        # z opóźnieniem, trafia na swoje miejsce, a powtórzona jest pomijana
+        if key is not None:
+            index = self.store.add_local(key, author, content)
+        else:
+            index = self.store.insert(message_id, author, content, sent_at)
+        if index is None:
+            return None
+
+        message_widget = self.create_message_widget(author, content, is_own, state, message_id, sent_at)
+        self.messages_layout.insertWidget(index, message_widget)
+        if key is not None:
+            self.tracked_messages[key] = message_widget
+            message_widget.retry_requested.connect(functools.partial(self.retry_requested.emit, key))
+            message_widget.discard_requested.connect(functools.partial(self.discard_requested.emit, key))
+
+        at_end = index == len(self.store) - 1
+        # Przy śledzeniu bieżącej rozmowy z pamięci wypadają najstarsze wiadomości,
+        # przy czytaniu starszych - najnowsze
+        self.remove_widgets(self.store.trim(from_front=self.following))
+        if at_end:
+            QTimer.singleShot(100, self.scroll_to_bottom)
+        return message_widget
+
+    @staticmethod
+    def create_message_widget(
+        author: str,
+        content: str,
+        is_own: bool,
+        state: Optional[str],
+        message_id: Optional[str],
+        sent_at: Optional[int]
+    ) -> MessageWidget:
+        message_widget = MessageWidget(author, content, is_own, state)
+        message_widget.message_id = message_id
+        message_widget.sent_at = sent_at
+        return message_widget
+
+    def insert_widgets(self, messages: list[StoredMessage]):
+        # Pozycje liczone po wstawieniu całej strony do store; wstawianie rosnąco sprawia,
+        # że wszystkie wcześniejsze widgety są już na swoich miejscach
+        for index, message in sorted((self.store.index(message), message) for message in messages):
+            message_widget = self.create_message_widget(
+                message.author, message.content, message.author == self.current_username,
+                None, message.message_id, message.sent_at
+            )
+            self.messages_layout.insertWidget(index, message_widget)
+
+    def remove_widgets(self, indexes: list[int]):
+        for index in indexes:
+            item = self.messages_layout.takeAt(index)
+            if item is not None and item.widget():
+                item.widget().deleteLater()
+
+    def on_scrolled(self, value: int):
+        scrollbar = self.scroll_area.verticalScrollBar()
+        self.following = value >= scrollbar.maximum() and not self.store.has_newer
+        if self._loading:
+            return
+        # Przed ułożeniem widgetów zakres bywa chwilowo zerowy - to nie jest przewinięcie do góry
+        if value == scrollbar.minimum() and scrollbar.maximum() > 0 and self.store.has_older is not False:
+            self.load_older()
+        elif value == scrollbar.maximum() and self.store.has_newer:
+            self.load_newer()
 
-        QTimer.singleShot(100, self.scroll_to_bottom)
+    def load_older(self):
+        self._load_page(self.store.load_older, trim_front=False)
+
+    def load_newer(self):
+        self._load_page(self.store.load_newer, trim_front=True)
+
+    def _load_page(self, load, trim_front: bool):
+        # Widok ma zostać w miejscu: zapamiętana wiadomość po przeciwnej stronie niż
+        # wczytywana strona wraca po przeliczeniu układu na tę samą wysokość
+        count = self.messages_layout.count()
+        self._anchor = None
+        if count:
+            anchor = self.messages_layout.itemAt(count - 1 if trim_front else 0).widget()
+            self._anchor = (anchor, anchor.y() - self.scroll_area.verticalScrollBar().value())
+
+        messages = load(ARCHIVE_PAGE)
+        if not messages:
+            return
+        self._loading = True
+        self.insert_widgets(messages)
+        self.remove_widgets(self.store.trim(from_front=trim_front))
+        QTimer.singleShot(0, self._restore_anchor)
+
+    def _restore_anchor(self):
+        if self._anchor is not None:
+            anchor, offset = self._anchor
+            self._anchor = None
+            self.scroll_area.verticalScrollBar().setValue(anchor.y() - offset)
+        self._loading = False
+
+    def jump_to(self, message_id: Optional[str], order: tuple[int, int]):
+        # Wiadomość spoza okna (np. wynik wyszukiwania) wczytuje się z archiwum razem
+        # z otoczeniem, zamiast przewijać całą historię
+        message = self.store.get(message_id) if message_id is not None else None
+        if message is None:
+            self._loading = True
+            evicted, messages = self.store.load_around(order, ARCHIVE_PAGE)
+            self.remove_widgets(evicted)
+            self.insert_widgets(messages)
+            message = self.store.get(message_id) if message_id is not None else None
+        if message is None:
+            self._loading = False
+            return
+        self.following = False
+        message_widget = self.messages_layout.itemAt(self.store.index(message)).widget()
+        QTimer.singleShot(0, functools.partial(self._show_widget, message_widget))
+
+    def _show_widget(self, message_widget: QWidget):
+        viewport_height = self.scroll_area.viewport().height()
+        self.scroll_area.ensureWidgetVisible(message_widget, 0, viewport_height // 2)
+        self._loading = False
+
+    def set_message_state(
+        self,
+        key: str,
+        state: str,
+        error: Optional[str] = None,
+        message_id: Optional[str] = None,
+        sent_at: Optional[int] = None
+    ):
+        message_widget = self.tracked_messages.get(key)
+        if message_widget is None:
+            return
+        if state == "discarded":
+            del self.tracked_messages[key]
+            index = self.store.discard_local(key)
+            if index is not None:
+                self.messages_layout.takeAt(index)
+            message_widget.deleteLater()
+            return
+        if message_id is not None:
+            message_widget.message_id = message_id
+        message_widget.set_state(state, error, sent_at)
+        # Niewysłane zostają śledzone, żeby ponowienie mogło zmienić ich stan
+        if state != "sent":
+            return
+
+        del self.tracked_messages[key]
+        old_index, new_index = self.store.confirm(key, message_id, sent_at)
+        if old_index is None or new_index == old_index:
+            return
+        self.messages_layout.takeAt(old_index)
+        if new_index is None:
+            # Ta sama wiadomość przyszła już z historią przed potwierdzeniem albo leży poza
+            # oknem i trafiła do archiwum
+            message_widget.deleteLater()
+        else:
+            self.messages_layout.insertWidget(new_index, message_widget)
+
+    def set_title(self, correspondent_name: str):
+        self.correspondent_name = correspondent_name
+        if self.is_group:
+            self.chat_title.setText(f"Grupa: {correspondent_name}")
+        else:
+            self.chat_title.setText(f"Czat z: {correspondent_name}")
 
     def scroll_to_bottom(self):
         scrollbar = self.scroll_area.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
 
     def clear_messages(self):
+        self.tracked_messages.clear()
+        self.store = self.create_store()
         while self.messages_layout.count():
             item = self.messages_layout.takeAt(0)
             if item.widget():
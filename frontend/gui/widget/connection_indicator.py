@@ -1,25 +1,71 @@
+from typing import Optional
+
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QPainter, QColor, QBrush
 from PyQt6.QtWidgets import QWidget
 
+from tools.api_service import ConnectionStatus
+from tools.tcp_client import ConnectionState
+
+STATE_LABELS = {
+    ConnectionState.CONNECTED: "Połączono",
+    ConnectionState.CONNECTING: "Łączenie...",
+    ConnectionState.RECONNECTING: "Ponowne łączenie",
+    ConnectionState.DISCONNECTED: "Rozłączono",
+}
+
 
 class ConnectionIndicator(QWidget):
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.connected = False
+        self.status: Optional[ConnectionStatus] = None
+        self.congested = False
         self.setFixedSize(16, 16)
 
-    def set_connected(self, connected: bool):
-        self.connected = connected
+    @property
+    def connected(self) -> bool:
+        return self.status is not None and self.status.state == ConnectionState.CONNECTED
+
+    def set_status(self, status: ConnectionStatus):
+        self.status = status
+        self.update_tooltip()
         self.update()
 
+    def set_congested(self, congested: bool):
+        self.congested = congested
+        self.update_tooltip()
+        self.update()
+
+    def update_tooltip(self):
+        lines = []
+        status = self.status
+        if status is not None:
+            line = STATE_LABELS.get(status.state, status.state.value)
+            if status.state == ConnectionState.CONNECTED and status.rtt is not None:
+                line += f" - RTT {status.rtt * 1000:.0f} ms"
+            elif status.state == ConnectionState.RECONNECTING and status.reconnect_attempt:
+                line += f" - próba {status.reconnect_attempt}"
+                if status.retry_delay:
+                    line += f" za {status.retry_delay:.1f} s"
+            lines.append(line)
+            if status.outbox_pending:
+                lines.append(f"Wiadomości czekające na wysłanie: {status.outbox_pending}")
+        if self.congested:
+            lines.append("Kolejka wysyłania jest przepełniona - wiadomości czekają na wysłanie")
+        self.setToolTip("\n".join(lines))
+
     def paintEvent(self, event):
         painter = QPainter(self)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
-        if self.connected:
+        state = self.status.state if self.status is not None else ConnectionState.DISCONNECTED
+        if state == ConnectionState.CONNECTED and self.congested:
+            color = QColor(230, 160, 0)
+        elif state == ConnectionState.CONNECTED:
             color = QColor(0, 200, 0)
+        elif state in (ConnectionState.CONNECTING, ConnectionState.RECONNECTING):
+            color = QColor(230, 210, 0)
         else:
             color = QColor(200, 0, 0)
 
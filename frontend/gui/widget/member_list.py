@@ -0,0 +1,116 @@
+from typing import Callable, Iterable
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+from tools.prefix_index import PrefixIndex, normalize
+
+# Większe zmiany idą jedną zmianą układu zamiast sygnału na każdy wiersz
+ROW_SIGNAL_LIMIT = 64
+
+
+class MemberListModel(QAbstractListModel):
+    # Członkowie grupy posortowani po nazwie w PrefixIndex. Widok dostaje tylko zakres
+    # pasujący do filtra (start, end), więc filtr to dwa wyszukiwania binarne, a dodanie
+    # lub usunięcie członka - wstawienie / usunięcie jednego wiersza zamiast przebudowy listy
+    def __init__(self, owner_username: str, parent=None):
+        super().__init__(parent)
+        self.owner_username = owner_username
+        self.members: PrefixIndex[str] = PrefixIndex()
+        self.filter_text = ""
+        self._filter_key = ""
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, username: str) -> bool:
+        return self.members.find(username, username)[1]
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._end - self._start
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self._end - self._start:
+            return None
+        username = self.members[self._start + index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            if username == self.owner_username:
+                return f"👑 {username} (właściciel)"
+            return f"👤 {username}"
+        if role == Qt.ItemDataRole.UserRole:
+            return username
+        return None
+
+    def set_filter(self, text: str):
+        self.beginResetModel()
+        self.filter_text = text
+        self._filter_key = normalize(text)
+        self._start, self._end = self.members.range(text)
+        self.endResetModel()
+
+    def add_members(self, usernames: Iterable[str]) -> int:
+        usernames = [username for username in dict.fromkeys(usernames) if username not in self]
+        if len(usernames) > ROW_SIGNAL_LIMIT:
+            return self._relayout(lambda: self.members.update((username, username) for username in usernames))
+        added = 0
+        for username in usernames:
+            position, present = self.members.find(username, username)
+            if present:
+                continue
+            key = normalize(username)
+            if self._start <= position <= self._end and key.startswith(self._filter_key):
+                row = position - self._start
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.members.add(username, username)
+                self._end += 1
+                self.endInsertRows()
+            else:
+                self.members.add(username, username)
+                # Wpis przed zakresem filtra przesuwa go o jedną pozycję
+                if key < self._filter_key:
+                    self._start += 1
+                    self._end += 1
+            added += 1
+        return added
+
+    def remove_members(self, usernames: Iterable[str]) -> int:
+        usernames = [username for username in dict.fromkeys(usernames) if username in self]
+        if len(usernames) > ROW_SIGNAL_LIMIT:
+            return self._relayout(lambda: self.members.discard((username, username) for username in usernames))
+        removed = 0
+        for username in usernames:
+            position, present = self.members.find(username, username)
+            if not present:
+                continue
+            if self._start <= position < self._end:
+                row = position - self._start
+                self.beginRemoveRows(QModelIndex(), row, row)
+                self.members.remove(username, username)
+                self._end -= 1
+                self.endRemoveRows()
+            else:
+                self.members.remove(username, username)
+                if position < self._start:
+                    self._start -= 1
+                    self._end -= 1
+            removed += 1
+        return removed
+
+    def _relayout(self, change: Callable[[], int]) -> int:
+        # Zaznaczenie i bieżący wiersz (trwałe indeksy widoku) przechodzą na nowe pozycje po nazwie
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        usernames = [index.data(Qt.ItemDataRole.UserRole) for index in persistent]
+        count = change()
+        self._start, self._end = self.members.range(self.filter_text)
+        moved = []
+        for username in usernames:
+            position, present = self.members.find(username, username) if username else (0, False)
+            if present and self._start <= position < self._end:
+                moved.append(self.index(position - self._start))
+            else:
+                moved.append(QModelIndex())
+        self.changePersistentIndexList(persistent, moved)
+        self.layoutChanged.emit()
+        return count
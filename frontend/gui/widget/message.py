@@ -1,13 +1,29 @@
-from PyQt6.QtCore import Qt
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QSizePolicy
+import time
+from typing import Optional
+
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QSizePolicy, QMenu
+
+STATE_LABELS = {
+    "pending": "oczekuje na wysłanie",
+    "sent": "wysłano",
+    "failed": "nie wysłano - kliknij, aby ponowić, prawy przycisk - odrzuć",
+}
 
 
 class MessageWidget(QWidget):
-    def __init__(self, author: str, content: str, is_own: bool, parent=None):
+    retry_requested = pyqtSignal()
+    discard_requested = pyqtSignal()
+
+    def __init__(self, author: str, content: str, is_own: bool, state: Optional[str] = None, parent=None):
         super().__init__(parent)
         self.author = author
         self.content = content
         self.is_own = is_own
+        self.state = state
+        self.message_id: Optional[str] = None
+        self.sent_at: Optional[int] = None
+        self.state_label = None
         self.init_ui()
 
     def init_ui(self):
@@ -30,6 +46,12 @@ class MessageWidget(QWidget):
         content_label.setStyleSheet("font-size: 13px;")
         message_layout.addWidget(content_label)
 
+        if self.state is not None:
+            self.state_label = QLabel()
+            self.state_label.setAlignment(Qt.AlignmentFlag.AlignRight)
+            message_layout.addWidget(self.state_label)
+            self.set_state(self.state)
+
         if self.is_own:
             message_container.setStyleSheet("""
                 QWidget {
@@ -50,3 +72,41 @@ class MessageWidget(QWidget):
             layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
 
         layout.addWidget(message_container)
+
+    def set_state(self, state: str, error: Optional[str] = None, sent_at: Optional[int] = None):
+        self.state = state
+        if sent_at is not None:
+            self.sent_at = sent_at
+        if self.state_label is None:
+            return
+
+        color = "#B00020" if state == "failed" else "#6B6B6B"
+        self.state_label.setStyleSheet(f"font-size: 9px; color: {color};")
+        text = STATE_LABELS.get(state, state)
+        if state == "sent" and self.sent_at is not None:
+            text = f"{text} {time.strftime('%H:%M', time.localtime(self.sent_at))}"
+        self.state_label.setText(text)
+        self.state_label.setToolTip(error or "")
+        if state == "failed":
+            self.setCursor(Qt.CursorShape.PointingHandCursor)
+        else:
+            self.unsetCursor()
+
+    def mousePressEvent(self, event):
+        if self.state == "failed" and event.button() == Qt.MouseButton.LeftButton:
+            self.retry_requested.emit()
+            return
+        super().mousePressEvent(event)
+
+    def contextMenuEvent(self, event):
+        if self.state != "failed":
+            super().contextMenuEvent(event)
+            return
+        menu = QMenu(self)
+        retry_action = menu.addAction("Ponów wysłanie")
+        discard_action = menu.addAction("Odrzuć")
+        chosen = menu.exec(event.globalPos())
+        if chosen is retry_action:
+            self.retry_requested.emit()
+        elif chosen is discard_action:
+            self.discard_requested.emit()
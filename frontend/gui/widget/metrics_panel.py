@@ -0,0 +1,56 @@
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QFontDatabase
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QPlainTextEdit
+
+from tools.metrics import Metrics
+
+
+class MetricsPanel(QWidget):
+
+    def __init__(self, metrics: Metrics, refresh_interval: int = 1000, parent=None):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.text_view = None
+        self.init_ui()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_interval = refresh_interval
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.text_view = QPlainTextEdit()
+        self.text_view.setReadOnly(True)
+        self.text_view.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(self.text_view)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start(self.refresh_interval)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        snapshot = self.metrics.snapshot()
+        lines = [f"uptime: {snapshot['uptime_s']:.0f}s", "", "[liczniki]"]
+
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name:<40} {value:>12}")
+
+        lines += ["", "[kolejki]"]
+        for name, gauge in sorted(snapshot["gauges"].items()):
+            lines.append(f"{name:<40} {gauge['value']:>8.0f} (max {gauge['max']:.0f})")
+
+        lines += ["", f"[histogramy, ms]{'n':>30}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"]
+        for name, h in sorted(snapshot["histograms"].items()):
+            lines.append(
+                f"{name:<40}{h['count']:>6}{h['p50'] * 1000:>9.2f}{h['p90'] * 1000:>9.2f}"
+                f"{h['p99'] * 1000:>9.2f}{h['max'] * 1000:>9.2f}"
+            )
+
+        self.text_view.setPlainText("\n".join(lines))
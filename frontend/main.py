@@ -1,16 +1,31 @@
 #!/usr/bin/env python3
+import logging
+import os
 import sys
 
 from PyQt6.QtWidgets import QApplication
 
 from gui.login_window import LoginWindow
+from tools.log import setup_logging
 
 
 def main():
+    level_name = os.environ.get("RECOMM_LOG_LEVEL", "INFO").upper()
+    level = logging.getLevelNamesMapping().get(level_name)
+    log_listener = setup_logging(
+        level=logging.INFO if level is None else level,
+        log_file=os.environ.get("RECOMM_LOG_FILE")
+    )
+    if level is None:
+        logging.getLogger(__name__).warning("Nieznany poziom logowania RECOMM_LOG_LEVEL=%s - używam INFO", level_name)
+
     app = QApplication(sys.argv)
     window = LoginWindow()
     window.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+
+    log_listener.stop()
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
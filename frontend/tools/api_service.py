@@ -1,308 +1,755 @@
 import json
-from typing import Optional
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional, Union
 from queue import Queue
 
-from tools.tcp_client import TCPClient
+from tools.change_feed import CHANGE_EVENTS, ChangeFeed
+from tools.connection_pool import ConnectionPool, Lane, PRIMARY
+from tools.message_archive import MessageArchive
+from tools.metrics import Metrics
+from tools.outbox import SENT, Outbox, OutboxEntry, OutboxFlusher
+from tools.tcp_client import BackpressurePolicy, ConnectionState, OutgoingFrame, Priority, SendQueueFull
+from tools.tracing import Span, Tracer
+
+logger = logging.getLogger(__name__)
+
+# Akcje wywoływane bezpośrednio przez użytkownika wyprzedzają w kolejce wysyłania pozostały ruch
+INTERACTIVE_METHODS = {
+    "REGISTER",
+    "AUTH",
+    "SEND_PRIVATE_MESSAGE",
+    "SEND_GROUP_MESSAGE",
+    "SEND_FRIEND_REQUEST",
+    "ACCEPT_FRIEND_REQUEST",
+    "REJECT_FRIEND_REQUEST",
+}
+
+# Po ponownym połączeniu dla każdej otwartej rozmowy pobieramy najwyżej tyle wiadomości;
+# przy dłuższej przerwie GUI przeładowuje rozmowę zamiast doklejać brakujący fragment
+RESUME_LIMIT = 100
+SEEN_MESSAGE_IDS = 10000
+# Domyślna liczba żądań wysłanych potokowo, które jednocześnie czekają na odpowiedź
+PIPELINE_WINDOW = 32
+# Sama zmiana RTT jest publikowana najwyżej raz na tyle sekund; zmiany stanu od razu
+STATUS_INTERVAL = 1.0
+RTT_SMOOTHING = 0.2
+
+# Wynik zbiorczego dodawania / usuwania członków grupy dla pojedynczego użytkownika
+MEMBER_ADDED = "added"
+MEMBER_REMOVED = "removed"
+ALREADY_MEMBER = "already_member"
+NOT_MEMBER = "not_member"
+NOT_FRIEND = "not_friend"
+USER_NOT_FOUND = "not_found"
+UNSUPPORTED = "unsupported"
+NO_RESPONSE = "no_response"
+FAILED = "failed"
+
+# Komunikaty błędów zmian członków grupy: backend w C++ (wyjątki) i tools.dev_server
+MEMBER_ERRORS = {
+    "User is already a member of this group": ALREADY_MEMBER,
+    "User already in group": ALREADY_MEMBER,
+    "Cannot add user to group - user is not a friend": NOT_FRIEND,
+    "Cannot add non-friend to group": NOT_FRIEND,
+    "User not found": USER_NOT_FOUND,
+    "User not in group": NOT_MEMBER,
+}
+
+
+class ConnectionStatus:
+    __slots__ = ("state", "rtt", "reconnect_attempt", "retry_delay", "outbox_pending")
+
+    def __init__(
+        self,
+        state: ConnectionState,
+        rtt: Optional[float],
+        reconnect_attempt: int,
+        retry_delay: Optional[float],
+        outbox_pending: int
+    ):
+        self.state = state
+        self.rtt = rtt
+        self.reconnect_attempt = reconnect_attempt
+        self.retry_delay = retry_delay
+        self.outbox_pending = outbox_pending
+
+
+class PendingRequest:
+    __slots__ = ("method", "lane", "frame", "span", "started_at")
+
+    def __init__(self, method: str, lane: Lane, frame: OutgoingFrame, span: Optional[Span], started_at: float):
+        self.method = method
+        self.lane = lane
+        self.frame = frame
+        self.span = span
+        self.started_at = started_at
+
 
 class ApiService:
-    def __init__(self, host: str, port: int):
-        self.tcp_client = TCPClient(host=host, port=port)
-        self.response_queue: Queue = Queue()
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        lanes: tuple[str, ...] = (PRIMARY,),
+        routes: Optional[dict[str, str]] = None,
+        request_timeout: float = 15.0,
+        backpressure_policy: BackpressurePolicy = BackpressurePolicy.DROP_BACKGROUND,
+        connect: bool = True
+    ):
+        self.metrics = Metrics()
+        self.tracer = Tracer()
         self.notification_queue: Queue = Queue()
-        self.tcp_client.on_message = self._handle_receive
-        self.tcp_client.connect()
+        self.request_timeout = request_timeout
         self.token: Optional[str] = None
+        self._credentials: Optional[tuple[str, str]] = None
+        self._local = threading.local()
+        self.on_backpressure: Optional[Callable[[bool], None]] = None
+        self.on_connection_status: Optional[Callable[[ConnectionStatus], None]] = None
+        self.outbox: Optional[Outbox] = None
+        self.message_archive: Optional[MessageArchive] = None
+        self._on_outbox_change: Optional[Callable[[OutboxEntry], None]] = None
+        self._rtt: Optional[float] = None
+        self._reconnect_attempt = 0
+        self._retry_delay: Optional[float] = None
+        self._status_published_at = 0.0
+        self._outbox_flusher: Optional[OutboxFlusher] = None
+        self._watched: dict[tuple[str, str], int] = {}
+        self._seen_message_ids: OrderedDict[str, None] = OrderedDict()
+        self._seen_lock = threading.Lock()
+        self._resume_lock = threading.Lock()
+        self._resume_requested = False
+        self._resume_running = False
+        self.pool = ConnectionPool(
+            host, port, self.metrics, self._handle_notification, lanes, routes,
+            backpressure_policy=backpressure_policy
+        )
+        self.pool.probe = self._probe
+        self.pool.on_backpressure = self._handle_backpressure
+        self.pool.on_connected = self._handle_connected
+        self.pool.primary.on_state = self._handle_state
+        self.tcp_client = self.pool.primary.tcp_client
+        self.tcp_client.on_reconnect_scheduled = self._handle_reconnect_scheduled
+        self.change_feed = ChangeFeed(self._subscribe_changes_request, self.prefetch, self.metrics)
+        if connect:
+            self.pool.connect()
+
+    def connect(self) -> bool:
+        self.pool.connect()
+        return self.tcp_client.is_connected
+
+    def disconnect(self):
+        if self._outbox_flusher:
+            self._outbox_flusher.stop()
+        if self.outbox:
+            self.outbox.close()
+        self.pool.disconnect()
+        if self.message_archive:
+            self.message_archive.close()
+
+    def _handle_connected(self, lane: Lane):
+        # Wywoływane z wątku ponownego łączenia - żądania wysyła osobny wątek
+        if lane is self.pool.primary and self._credentials:
+            with self._resume_lock:
+                self._resume_requested = True
+                if self._resume_running:
+                    return
+                self._resume_running = True
+            threading.Thread(target=self._resume_session, daemon=True).start()
+        elif self._outbox_flusher:
+            self._outbox_flusher.wake()
+
+    def _handle_state(self, state: ConnectionState):
+        if state == ConnectionState.CONNECTED:
+            self._reconnect_attempt = 0
+            self._retry_delay = None
+        self._publish_status()
+
+    def _handle_reconnect_scheduled(self, attempt: int, delay: float):
+        self._reconnect_attempt = attempt
+        self._retry_delay = delay
+        self._publish_status()
+
+    def connection_status(self) -> ConnectionStatus:
+        return ConnectionStatus(
+            self.tcp_client.state,
+            self._rtt,
+            self._reconnect_attempt,
+            self._retry_delay,
+            self.outbox.pending_count() if self.outbox else 0
+        )
+
+    def _publish_status(self):
+        # Wywoływane z wątków sieciowych - GUI przekazuje tu emit sygnału Qt, więc odbiorca
+        # dostaje migawkę w swoim wątku i niczego tu nie blokuje
+        self._status_published_at = time.monotonic()
+        if self.on_connection_status:
+            try:
+                self.on_connection_status(self.connection_status())
+            except Exception as e:
+                logger.error("Błąd w callbacku on_connection_status: %s", e)
+
+    def _resume_session(self):
+        while True:
+            with self._resume_lock:
+                if not self._resume_requested:
+                    self._resume_running = False
+                    break
+                self._resume_requested = False
+
+            started_at = time.monotonic()
+            try:
+                # Nowe gniazdo musi ponownie przedstawić się serwerowi, żeby to ono dostawało
+                # powiadomienia; pozostałe żądania idą głównym połączeniem z tego samego powodu
+                username, password = self._credentials
+                response = self._request("AUTH", {
+                    "username": username,
+                    "password": password
+                }, authenticated=False, lane=self.pool.primary)
+                if response["code"] != 200:
+                    logger.warning("Ponowne uwierzytelnienie nieudane: %s", response.get("message"))
+                    self.metrics.incr("api.resume.failures")
+                    continue
+                self.token = response["token"]
+                recovered = self._fill_gaps()
+                if self.change_feed.active:
+                    # Subskrypcja była związana z zerwanym połączeniem - wznawiamy od ostatniej wersji
+                    self.change_feed.sync()
+            except (ConnectionError, TimeoutError, SendQueueFull) as e:
+                logger.warning("Nie udało się wznowić sesji: %s", e)
+                self.metrics.incr("api.resume.failures")
+                continue
+
+            duration = time.monotonic() - started_at
+            self.metrics.observe("api.resume.duration", duration)
+            self.metrics.incr("api.resume.recovered", recovered)
+            logger.info("Sesja wznowiona po %.0f ms, odzyskano %d wiadomości", duration * 1000, recovered)
+
+        if self._outbox_flusher:
+            self._outbox_flusher.wake()
+
+    def _fill_gaps(self) -> int:
+        # Własne wiadomości też - mogły zostać wysłane z innej sesji w trakcie przerwy. Te
+        # potwierdzone w tej sesji przez skrzynkę nadawczą są już w _seen_message_ids
+        username = self._credentials[0]
+        recovered = 0
+        for (kind, target), last_seen in list(self._watched.items()):
+            if kind == "group":
+                response = self._request("GET_GROUP_MESSAGES", {
+                    "groupId": target,
+                    "since": last_seen,
+                    "limit": RESUME_LIMIT,
+                    "offset": 0
+                }, lane=self.pool.primary)
+                notification_type = "NEW_GROUP_MESSAGE"
+            else:
+                response = self._request("GET_PRIVATE_MESSAGES", {
+                    "otherUsername": target,
+                    "since": last_seen,
+                    "limit": RESUME_LIMIT,
+                    "offset": 0
+                }, lane=self.pool.primary)
+                notification_type = "NEW_PRIVATE_MESSAGE"
+
+            if response["code"] != 200:
+                continue
+
+            messages = response["messages"]
+            if len(messages) >= RESUME_LIMIT:
+                logger.info("Zbyt wiele zaległych wiadomości w rozmowie %s - przeładowanie", target)
+                self._handle_notification({"type": "RESYNC_CONVERSATION", "kind": kind, "target": target})
+                continue
+
+            for message in sorted(messages, key=lambda m: m.get("sentAt", 0)):
+                notification = dict(message, type=notification_type)
+                if kind == "group":
+                    notification["groupId"] = target
+                elif message.get("senderName") == username:
+                    # Rozmowa prywatna jest rozpoznawana po nadawcy - własna wiadomość należy do odbiorcy
+                    notification["receiverName"] = target
+                if self._handle_notification(notification):
+                    recovered += 1
+        return recovered
+
+    def watch_conversation(self, kind: str, target: str, last_seen: int = 0):
+        # Rozmowy otwarte w GUI są uzupełniane po ponownym połączeniu od ostatniego sentAt
+        self._watched[(kind, target)] = last_seen
+
+    def unwatch_conversation(self, kind: str, target: str):
+        self._watched.pop((kind, target), None)
+
+    def open_outbox(self, path: str, on_change: Optional[Callable[[OutboxEntry], None]] = None) -> Outbox:
+        # Wiadomości z dziennika, które nie zdążyły wyjść przed zamknięciem, wysyłane są od razu
+        self.outbox = Outbox(path)
+        self._on_outbox_change = on_change
+        self.outbox.on_change = self._handle_outbox_change
+        self._outbox_flusher = OutboxFlusher(self, self.outbox)
+        self._outbox_flusher.start()
+        return self.outbox
+
+    def _handle_outbox_change(self, entry: OutboxEntry):
+        if entry.state == SENT and entry.message_id is not None:
+            # Uzupełnienie luki po ponownym połączeniu nie pokaże tej wiadomości drugi raz
+            with self._seen_lock:
+                self._mark_seen(entry.message_id)
+        if entry.state == SENT and self._credentials:
+            self._record(entry.kind, entry.target, [{
+                "messageId": entry.message_id,
+                "senderName": self._credentials[0],
+                "content": entry.content,
+                "sentAt": entry.sent_at
+            }])
+        if self._on_outbox_change:
+            self._on_outbox_change(entry)
+        self._publish_status()
+
+    def open_message_archive(self, path: str) -> MessageArchive:
+        # Każda wiadomość, którą klient zobaczy (historia, powiadomienia, własne wysłane),
+        # trafia do lokalnego archiwum z indeksem pełnotekstowym
+        self.message_archive = MessageArchive(path)
+        return self.message_archive
+
+    def _record(self, kind: str, target: str, messages: list):
+        if self.message_archive is None:
+            return
+        try:
+            self.message_archive.record(kind, str(target), (m for m in messages if isinstance(m, dict)))
+        except Exception as e:
+            logger.warning("Nie udało się zapisać wiadomości w archiwum: %s", e)
+
+    def queue_message_to_user(self, receiver_username: str, message: str) -> OutboxEntry:
+        entry = self.outbox.add("user", receiver_username, message)
+        self._publish_status()
+        self._outbox_flusher.wake()
+        return entry
+
+    def queue_message_to_group(self, group_id: str, message: str) -> OutboxEntry:
+        entry = self.outbox.add("group", group_id, message)
+        self._publish_status()
+        self._outbox_flusher.wake()
+        return entry
+
+    def retry_outbox_entry(self, key: str) -> Optional[OutboxEntry]:
+        entry = self.outbox.retry(key)
+        if entry is not None:
+            self._outbox_flusher.wake()
+        return entry
+
+    def discard_outbox_entry(self, key: str) -> Optional[OutboxEntry]:
+        entry = self.outbox.discard(key)
+        if entry is not None:
+            # Późniejsze wiadomości rozmowy czekały za odrzuconą
+            self._outbox_flusher.wake()
+        return entry
+
+    @staticmethod
+    def _outbox_request(entry: OutboxEntry) -> tuple[str, dict]:
+        if entry.kind == "group":
+            return "SEND_GROUP_MESSAGE", {
+                "groupId": entry.target,
+                "content": entry.content,
+                "clientMessageId": entry.key
+            }
+        return "SEND_PRIVATE_MESSAGE", {
+            "receiverUsername": entry.target,
+            "content": entry.content,
+            "clientMessageId": entry.key
+        }
+
+    def outbox_lane(self, entry: OutboxEntry) -> Lane:
+        # Wiadomości jednej rozmowy idą potokowo tym samym połączeniem, żeby serwer obsłużył je po kolei
+        return self.pool.lane_for(self._outbox_request(entry)[0])
+
+    def submit_outbox_entry(self, entry: OutboxEntry, lane: Optional[Lane] = None) -> PendingRequest:
+        method, body = self._outbox_request(entry)
+        return self.submit(method, body, lane=lane)
+
+    def subscribe_changes(self) -> bool:
+        # Tryb subskrypcji: listy znajomych, zaproszeń i grup są aktualizowane zdarzeniami
+        # z serwera zamiast odpytywania. False, gdy serwer go nie obsługuje
+        if self.change_feed.active:
+            return True
+        if self.change_feed.supported is False:
+            return False
+        return self.change_feed.sync()
+
+    def _subscribe_changes_request(self, since: Optional[int]) -> dict:
+        return self._request("SUBSCRIBE_CHANGES", {} if since is None else {"since": since}, lane=self.pool.primary)
+
+    def _handle_notification(self, resp: dict) -> bool:
+        if resp.get("type") in CHANGE_EVENTS:
+            self.metrics.incr("api.change_events_in")
+            self.change_feed.handle(resp)
+            return True
+
+        message_id = resp.get("messageId")
+        if message_id is not None:
+            # Ta sama wiadomość może przyjść jako zaległe powiadomienie i w uzupełnieniu luki
+            with self._seen_lock:
+                if not self._mark_seen(message_id):
+                    self.metrics.incr("api.notifications_duplicate")
+                    return False
+                self._note_seen(resp)
+            if resp.get("type") in ("NEW_GROUP_MESSAGE", "NEW_PRIVATE_MESSAGE"):
+                self._record(*self._conversation_of(resp), [resp])
+
+        resp["_receivedAt"] = time.monotonic()
+        span = self.tracer.start_span(resp["type"], "notification", "queued")
+        if span is not None:
+            resp["_spanId"] = span.span_id
+        self.notification_queue.put(resp)
+        self.metrics.incr("api.notifications_in")
+        self.metrics.gauge("api.notification_queue.depth", self.notification_queue.qsize())
+        return True
+
+    def _mark_seen(self, message_id: str) -> bool:
+        # Pod _seen_lock; False, gdy wiadomość już była widziana
+        if message_id in self._seen_message_ids:
+            return False
+        self._seen_message_ids[message_id] = None
+        if len(self._seen_message_ids) > SEEN_MESSAGE_IDS:
+            self._seen_message_ids.popitem(last=False)
+        return True
+
+    @staticmethod
+    def _conversation_of(notification: dict) -> tuple[str, str]:
+        if notification.get("type") == "NEW_GROUP_MESSAGE":
+            return "group", str(notification.get("groupId"))
+        # Własna wiadomość z uzupełnienia luki ma odbiorcę w receiverName
+        return "user", notification.get("receiverName") or notification.get("senderName")
+
+    def _note_seen(self, notification: dict):
+        key = self._conversation_of(notification)
+        last_seen = self._watched.get(key)
+        if last_seen is not None:
+            self._watched[key] = max(last_seen, notification.get("sentAt", 0))
+
+    @property
+    def backpressure(self) -> bool:
+        return self.pool.backpressure
+
+    def _handle_backpressure(self, active: bool):
+        self.metrics.gauge("api.backpressure", int(active))
+        if self.on_backpressure:
+            self.on_backpressure(active)
+
+    @contextmanager
+    def background(self):
+        # Żądania wysłane w tym bloku (odpytywanie z timerów, kontrole połączeń) idą z najniższym
+        # priorytetem, a identyczne odczyty czekające jeszcze w kolejce są scalane w jedną ramkę
+        previous = getattr(self._local, "priority", None)
+        self._local.priority = Priority.BACKGROUND
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def _priority_for(self, method: str) -> Priority:
+        priority = getattr(self._local, "priority", None)
+        if priority is not None:
+            return priority
+        return Priority.INTERACTIVE if method in INTERACTIVE_METHODS else Priority.NORMAL
+
+    def _probe(self, lane: Lane):
+        # Każde żądanie z tokenem uwierzytelnia połączenie po stronie serwera (główne - również
+        # jako odbiorcę powiadomień)
+        if not self.token:
+            return
 
-    def _handle_receive(self, data: bytes):
-        resp = json.loads(data.decode('utf-8'))
-        if not "type" in resp:
-            self.response_queue.put(resp)
-        else:
-            self.notification_queue.put(resp)
+        with self.background():
+            response = self._request("GET_PENDING_REQUESTS", {}, lane=lane)
+        if response["code"] == 401 and self._credentials:
+            self.login(*self._credentials)
+
+    def submit(self, method: str, body: dict, authenticated: bool = True, lane: Optional[Lane] = None) -> PendingRequest:
+        # Umieszcza żądanie w kolejce wysyłania bez czekania na odpowiedź
+        if authenticated and not self.token:
+            raise Exception("User not authenticated")
+
+        lane = lane or self.pool.lane_for(method)
+
+        request = {"method": method}
+        if authenticated:
+            request["token"] = self.token
+            if lane is not self.pool.primary:
+                # Serwer rejestruje do powiadomień połączenie, które przedstawiło token - dodatkowe
+                # połączenia puli nie mogą przejąć ich od głównego
+                request["notifications"] = False
+        request["body"] = body
+
+        priority = self._priority_for(method)
+        # Znak nowej linii zamyka ramkę - serwer rozdziela po nim żądania wysłane potokowo
+        payload = json.dumps(request) + "\n"
+        merge_key = payload if method.startswith("GET_") else None
+
+        span = self.tracer.start_span(method, "request", "queued", {"lane": lane.name, "priority": priority.name.lower()})
+        on_sent = (lambda: self.tracer.mark(span, "wire")) if span is not None else None
+
+        started_at = time.monotonic()
+        frame = lane.submit(payload, on_sent, priority, merge_key)
+        return PendingRequest(method, lane, frame, span, started_at)
+
+    def wait(self, pending: PendingRequest) -> dict:
+        response, received_at = pending.lane.wait(pending.frame, self.request_timeout)
+        finished_at = time.monotonic()
+
+        self.metrics.observe("api.response_queue.wait", finished_at - received_at)
+        self.metrics.observe(f"api.latency.{pending.method}", finished_at - pending.started_at)
+
+        rtt = received_at - pending.started_at
+        self._rtt = rtt if self._rtt is None else self._rtt + RTT_SMOOTHING * (rtt - self._rtt)
+        if finished_at - self._status_published_at >= STATUS_INTERVAL:
+            self._publish_status()
+
+        span = pending.span
+        if span is not None:
+            self.tracer.mark(span, "client", at=received_at)
+            span.args["code"] = response.get("code")
+            self.tracer.finish_request(span)
+        return response
+
+    def pipeline(self, requests: Iterable[tuple[str, dict]], window: int = PIPELINE_WINDOW) -> Iterator[dict]:
+        # Żądania idą potokowo: najwyżej window czeka naraz na odpowiedź, a odpowiedzi są
+        # zwracane w kolejności żądań. Błąd pojedynczego żądania (zerwane połączenie, brak
+        # odpowiedzi, pełna kolejka) daje odpowiedź z code None zamiast przerywać resztę
+        in_flight: deque = deque()
+        for method, body in requests:
+            if len(in_flight) >= window:
+                yield self._pipeline_result(in_flight.popleft())
+            try:
+                in_flight.append(self.submit(method, body))
+            except (ConnectionError, SendQueueFull) as e:
+                in_flight.append(e)
+        while in_flight:
+            yield self._pipeline_result(in_flight.popleft())
+
+    def _pipeline_result(self, pending: Union[PendingRequest, Exception]) -> dict:
+        if isinstance(pending, Exception):
+            return {"code": None, "message": str(pending)}
+        try:
+            return self.wait(pending)
+        except (ConnectionError, TimeoutError, SendQueueFull) as e:
+            return {"code": None, "message": str(e)}
+
+    def _request(self, method: str, body: dict, authenticated: bool = True, lane: Optional[Lane] = None) -> dict:
+        return self.wait(self.submit(method, body, authenticated, lane))
 
     def register(self, username: str, password: str) -> bool:
-        self.tcp_client.send(json.dumps({
-            "method": "REGISTER",
-            "body": {
-                "username": username,
-                "password": password
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("REGISTER", {
+            "username": username,
+            "password": password
+        }, authenticated=False)
         if response["code"] == 201:
             self.token = response["token"]
+            self._credentials = (username, password)
             return True
 
         return False
 
     def login(self, username: str, password: str) -> bool:
-        self.tcp_client.send(json.dumps({
-            "method": "AUTH",
-            "body": {
-                "username": username,
-                "password": password
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("AUTH", {
+            "username": username,
+            "password": password
+        }, authenticated=False)
         if response["code"] == 200:
             self.token = response["token"]
+            self._credentials = (username, password)
             return True
 
         return False
 
-    def send_friend_request(self, friend_username: str) -> bool:
-        if not self.token:
-            raise Exception("User not authenticated")
+    def prefetch(self) -> tuple[list, list, list]:
+        # Dane startowe okna głównego: trzy żądania trafiają do kolejki naraz i idą potokowo,
+        # więc czekamy na jeden komplet odpowiedzi zamiast na trzy kolejne
+        requests = [self.submit(method, {}) for method in ("GET_PENDING_REQUESTS", "GET_FRIENDS", "GET_USER_GROUPS")]
+        pending_requests, friends, groups = (self.wait(request) for request in requests)
+        return (
+            pending_requests.get("pendingRequests", []) if pending_requests["code"] == 200 else [],
+            friends.get("friends", []) if friends["code"] == 200 else [],
+            groups.get("groups", []) if groups["code"] == 200 else [],
+        )
 
-        self.tcp_client.send(json.dumps({
-            "method": "SEND_FRIEND_REQUEST",
-            "token": self.token,
-            "body": {
-                "addresseeUsername": friend_username
-            }
-        }))
-        response = self.response_queue.get()
+    def send_friend_request(self, friend_username: str) -> bool:
+        response = self._request("SEND_FRIEND_REQUEST", {
+            "addresseeUsername": friend_username
+        })
         return response["code"] == 200
 
     def accept_friend_request(self, requester_username: str) -> bool:
-        if not self.token:
-            raise Exception("User not authenticated")
-
-        self.tcp_client.send(json.dumps({
-            "method": "ACCEPT_FRIEND_REQUEST",
-            "token": self.token,
-            "body": {
-                "requester": requester_username
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("ACCEPT_FRIEND_REQUEST", {
+            "requester": requester_username
+        })
         return response["code"] == 200
 
     def reject_friend_request(self, requester_username: str) -> bool:
-        if not self.token:
-            raise Exception("User not authenticated")
-
-        self.tcp_client.send(json.dumps({
-            "method": "REJECT_FRIEND_REQUEST",
-            "token": self.token,
-            "body": {
-                "requester": requester_username
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("REJECT_FRIEND_REQUEST", {
+            "requester": requester_username
+        })
         return response["code"] == 200
 
     def get_all_friends(self) -> Optional[list[str]]:
-        if not self.token:
-            raise Exception("User not authenticated")
-
-        self.tcp_client.send(json.dumps({
-            "method": "GET_FRIENDS",
-            "token": self.token,
-            "body": {}
-        }))
-        response = self.response_queue.get()
+        response = self._request("GET_FRIENDS", {})
         if response["code"] == 200:
             return response["friends"]
 
         return None
 
     def get_pending_friend_requests(self) -> Optional[list]:
-        if not self.token:
-            raise Exception("User not authenticated")
-
-        self.tcp_client.send(json.dumps({
-            "method": "GET_PENDING_REQUESTS",
-            "token": self.token,
-            "body": {}
-        }))
-        response = self.response_queue.get()
+        response = self._request("GET_PENDING_REQUESTS", {})
         if response["code"] == 200:
             return response["pendingRequests"]
 
         return None
 
     def create_group(self, group_name: str) -> Optional[str]:
-        if not self.token:
-            raise Exception("User not authenticated")
-
-        self.tcp_client.send(json.dumps({
-            "method": "CREATE_GROUP",
-            "token": self.token,
-            "body": {
-                "groupName": group_name
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("CREATE_GROUP", {
+            "groupName": group_name
+        })
         if response["code"] == 200:
             return response["groupId"]
         return None
 
     def add_member_to_group(self, group_id: str, username: str) -> bool:
-        if not self.token:
-            raise Exception("User not authenticated")
-
-        self.tcp_client.send(json.dumps({
-            "method": "ADD_MEMBER_TO_GROUP",
-            "token": self.token,
-            "body": {
-                "groupId": group_id,
-                "username": username
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("ADD_MEMBER_TO_GROUP", {
+            "groupId": group_id,
+            "username": username
+        })
         return response["code"] == 200
 
-    def change_group_name(self, group_id: str, new_name: str) -> bool:
-        if not self.token:
-            raise Exception("User not authenticated")
+    def add_members_to_group(
+        self,
+        group_id: str,
+        usernames: Iterable[str],
+        window: int = PIPELINE_WINDOW
+    ) -> Iterator[dict]:
+        # Żądania idą potokowo, wyniki w kolejności użytkowników (powtórzeni są pomijani):
+        # {"username", "status", "code", "message"}, status - MEMBER_ADDED, ALREADY_MEMBER,
+        # NOT_FRIEND, USER_NOT_FOUND, NO_RESPONSE albo FAILED
+        return self._bulk_members("ADD_MEMBER_TO_GROUP", group_id, usernames, window, MEMBER_ADDED)
+
+    def remove_members_from_group(
+        self,
+        group_id: str,
+        usernames: Iterable[str],
+        window: int = PIPELINE_WINDOW
+    ) -> Iterator[dict]:
+        # Jak add_members_to_group; status MEMBER_REMOVED, NOT_MEMBER albo UNSUPPORTED,
+        # gdy serwer nie obsługuje REMOVE_MEMBER_FROM_GROUP (backend w C++ jeszcze go nie ma)
+        return self._bulk_members("REMOVE_MEMBER_FROM_GROUP", group_id, usernames, window, MEMBER_REMOVED)
+
+    def _bulk_members(
+        self,
+        method: str,
+        group_id: str,
+        usernames: Iterable[str],
+        window: int,
+        success: str
+    ) -> Iterator[dict]:
+        usernames = list(dict.fromkeys(usernames))
+        requests = ((method, {"groupId": group_id, "username": username}) for username in usernames)
+        for username, response in zip(usernames, self.pipeline(requests, window)):
+            code = response.get("code")
+            status = success if code == 200 else self._member_error(method, code, response.get("message") or "")
+            self.metrics.incr(f"api.members.{status}")
+            yield {"username": username, "status": status, "code": code, "message": response.get("message")}
+
+    @staticmethod
+    def _member_error(method: str, code: Optional[int], message: str) -> str:
+        # Backend zwraca błędy grup jako 500 z opisem wyjątku, więc rozpoznajemy je po pełnej
+        # treści (tools.dev_server ma własne komunikaty). Wszystko inne, także brak uprawnień
+        # samego wywołującego, to FAILED
+        if code is None:
+            return NO_RESPONSE
+        if message == f"Unknown method: {method}":
+            return UNSUPPORTED
+        return MEMBER_ERRORS.get(message, FAILED)
 
-        self.tcp_client.send(json.dumps({
-            "method": "UPDATE_GROUP_NAME",
-            "token": self.token,
-            "body": {
-                "groupId": group_id,
-                "newName": new_name
-            }
-        }))
-        response = self.response_queue.get()
+    def change_group_name(self, group_id: str, new_name: str) -> bool:
+        response = self._request("UPDATE_GROUP_NAME", {
+            "groupId": group_id,
+            "newName": new_name
+        })
         return response["code"] == 200
 
     def leave_group(self, group_id: str) -> bool:
-        if not self.token:
-            raise Exception("User not authenticated")
-        self.tcp_client.send(json.dumps({
-            "method": "LEAVE_GROUP",
-            "token": self.token,
-            "body": {
-                "groupId": group_id
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("LEAVE_GROUP", {
+            "groupId": group_id
+        })
         return response["code"] == 200
 
     def delete_group(self, group_id: str) -> bool:
-        if not self.token:
-            raise Exception("User not authenticated")
-        self.tcp_client.send(json.dumps({
-            "method": "DELETE_GROUP",
-            "token": self.token,
-            "body": {
-                "groupId": group_id
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("DELETE_GROUP", {
+            "groupId": group_id
+        })
         return response["code"] == 200
 
     def get_all_users_groups(self) -> Optional[list]:
-        if not self.token:
-            raise Exception("User not authenticated")
-        self.tcp_client.send(json.dumps({
-            "method": "GET_USER_GROUPS",
-            "token": self.token,
-            "body": {}
-        }))
-        response = self.response_queue.get()
+        response = self._request("GET_USER_GROUPS", {})
         if response["code"] == 200:
             return response["groups"]
         return None
 
     def get_group_details(self, group_id: str) -> Optional[dict]:
-        if not self.token:
-            raise Exception("User not authenticated")
-        self.tcp_client.send(json.dumps({
-            "method": "GET_GROUP_DETAILS",
-            "token": self.token,
-            "body": {
-                "groupId": group_id
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("GET_GROUP_DETAILS", {
+            "groupId": group_id
+        })
         if response["code"] == 200:
             return response["group"]
         return None
 
-    def get_group_members(self, group_id: str) -> Optional[list]:
-        if not self.token:
-            raise Exception("User not authenticated")
-        self.tcp_client.send(json.dumps({
-            "method": "GET_GROUP_MEMBERS",
-            "token": self.token,
-            "body": {
-                "groupId": group_id
-            }
-        }))
-        response = self.response_queue.get()
+    def get_group_members(self, group_id: str, limit: Optional[int] = None, offset: int = 0) -> Optional[list]:
+        # Backend w C++ ignoruje limit i offset i zawsze zwraca całą listę - odpowiedź
+        # dłuższa niż limit oznacza, że to już wszyscy członkowie
+        body = {"groupId": group_id}
+        if limit is not None:
+            body["limit"] = limit
+            body["offset"] = offset
+        response = self._request("GET_GROUP_MEMBERS", body)
         if response["code"] == 200:
             return response["members"]
         return None
 
     def send_message_to_group(self, group_id: str, message: str) -> Optional[str]:
-        if not self.token:
-            raise Exception("User not authenticated")
-        self.tcp_client.send(json.dumps({
-            "method": "SEND_GROUP_MESSAGE",
-            "token": self.token,
-            "body": {
-                "groupId": group_id,
-                "content": message
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("SEND_GROUP_MESSAGE", {
+            "groupId": group_id,
+            "content": message
+        })
         if response["code"] == 200:
             return response["messageId"]
         return None
 
     def get_group_messages(self, group_id: str, since = 1638360000, limit = 100, offset= 0) -> Optional[list]:
-        if not self.token:
-            raise Exception("User not authenticated")
-        self.tcp_client.send(json.dumps({
-            "method": "GET_GROUP_MESSAGES",
-            "token": self.token,
-            "body": {
-                "groupId": group_id,
-                "since": since,
-                "limit": limit,
-                "offset": offset
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("GET_GROUP_MESSAGES", {
+            "groupId": group_id,
+            "since": since,
+            "limit": limit,
+            "offset": offset
+        })
         if response["code"] == 200:
+            self._record("group", group_id, response["messages"])
             return response["messages"]
         return None
 
     def send_message_to_user(self, receiver_username: str, message: str) -> Optional[str]:
-        if not self.token:
-            raise Exception("User not authenticated")
-
-        self.tcp_client.send(json.dumps({
-            "method": "SEND_PRIVATE_MESSAGE",
-            "token": self.token,
-            "body": {
-                "receiverUsername": receiver_username,
-                "content": message
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("SEND_PRIVATE_MESSAGE", {
+            "receiverUsername": receiver_username,
+            "content": message
+        })
         if response["code"] == 200:
             return response["messageId"]
         return None
 
     def get_private_messages(self, correspondent_username: str, since = 1638360000, limit = 100, offset= 0) -> Optional[list]:
-        if not self.token:
-            raise Exception("User not authenticated")
-
-        self.tcp_client.send(json.dumps({
-            "method": "GET_PRIVATE_MESSAGES",
-            "token": self.token,
-            "body": {
-                "otherUsername": correspondent_username,
-                "since": since,
-                "limit": limit,
-                "offset": offset
-            }
-        }))
-        response = self.response_queue.get()
+        response = self._request("GET_PRIVATE_MESSAGES", {
+            "otherUsername": correspondent_username,
+            "since": since,
+            "limit": limit,
+            "offset": offset
+        })
         if response["code"] == 200:
+            self._record("user", correspondent_username, response["messages"])
             return response["messages"]
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from tools.api_service import ApiService
+
+logger = logging.getLogger(__name__)
+
+CONNECT = "connect"
+AUTH = "auth"
+PREFETCH = "prefetch"
+
+STEP_LABELS = {
+    CONNECT: "Łączenie z serwerem...",
+    AUTH: "Logowanie...",
+    PREFETCH: "Pobieranie znajomych i grup...",
+}
+
+
+class BootstrapCancelled(Exception):
+    pass
+
+
+class AuthenticationFailed(Exception):
+    pass
+
+
+class BootstrapResult:
+    __slots__ = ("api_service", "username", "subscribed", "friends", "pending_requests", "groups")
+
+    def __init__(self, api_service: ApiService, username: Optional[str]):
+        self.api_service = api_service
+        self.username = username
+        # Czy działa subskrypcja zmian list; None, gdy nie udało się tego ustalić
+        self.subscribed: Optional[bool] = None
+        self.friends: Optional[list] = None
+        self.pending_requests: Optional[list] = None
+        self.groups: Optional[list] = None
+
+
+class Bootstrap:
+    # Łączenie, logowanie i pobranie danych startowych w jednym wątku w tle, żeby okno
+    # logowania nie zamarzało. Bez danych logowania wykonywany jest tylko krok łączenia;
+    # istniejące połączenie (api_service) jest używane ponownie zamiast tworzyć nowe
+    def __init__(
+        self,
+        create_service: Callable[[], ApiService],
+        api_service: Optional[ApiService] = None,
+        credentials: Optional[tuple[str, str]] = None,
+        register: bool = False
+    ):
+        self.create_service = create_service
+        self.api_service = api_service
+        self.credentials = credentials
+        self.register = register
+        self.on_progress: Optional[Callable[[str, int, int], None]] = None
+        self.on_finished: Optional[Callable[[BootstrapResult], None]] = None
+        self.on_failed: Optional[Callable[[Exception], None]] = None
+        self._owns_service = api_service is None
+        self._cancelled = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def steps(self) -> list[str]:
+        steps = [CONNECT] if self._owns_service else []
+        if self.credentials:
+            steps += [AUTH, PREFETCH]
+        return steps
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="bootstrap", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Przerywa łączenie w toku; połączenie utworzone wcześniej zostaje nietknięte
+        if self._owns_service and self.api_service is not None:
+            self.api_service.disconnect()
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise BootstrapCancelled()
+
+    def _progress(self, step: str):
+        self._check_cancelled()
+        if self.on_progress:
+            steps = self.steps
+            self.on_progress(STEP_LABELS[step], steps.index(step), len(steps))
+
+    def _run(self):
+        started_at = time.monotonic()
+        try:
+            result = self._bootstrap()
+        except BootstrapCancelled:
+            logger.info("Przerwano łączenie z serwerem")
+            return
+        except Exception as e:
+            # Po odrzuconym logowaniu połączenie zostaje - można od razu spróbować ponownie
+            if self._owns_service and self.api_service is not None and not isinstance(e, AuthenticationFailed):
+                self.api_service.disconnect()
+            if not self._cancelled.is_set() and self.on_failed:
+                self.on_failed(e)
+            return
+
+        result.api_service.metrics.observe("bootstrap.duration", time.monotonic() - started_at)
+        if self._cancelled.is_set():
+            return
+        if self.on_finished:
+            self.on_finished(result)
+
+    def _bootstrap(self) -> BootstrapResult:
+        if self.api_service is None:
+            self._progress(CONNECT)
+            self.api_service = self.create_service()
+            if self._cancelled.is_set():
+                self.api_service.disconnect()
+                raise BootstrapCancelled()
+            if not self.api_service.connect():
+                self._check_cancelled()
+                raise ConnectionError("Serwer nie odpowiada")
+
+        username = self.credentials[0] if self.credentials else None
+        result = BootstrapResult(self.api_service, username)
+        if not self.credentials:
+            return result
+
+        self._progress(AUTH)
+        if self.register:
+            if not self.api_service.register(*self.credentials):
+                raise AuthenticationFailed("Nie udało się zarejestrować. Użytkownik może już istnieć.")
+        elif not self.api_service.login(*self.credentials):
+            raise AuthenticationFailed("Nieprawidłowa nazwa użytkownika lub hasło.")
+
+        self._progress(PREFETCH)
+        try:
+            result.subscribed = self.api_service.subscribe_changes()
+            if result.subscribed:
+                result.pending_requests, result.friends, result.groups = self.api_service.change_feed.snapshot()
+            else:
+                result.pending_requests, result.friends, result.groups = self.api_service.prefetch()
+        except (ConnectionError, TimeoutError) as e:
+            # Okno główne dociągnie listy samo przy pierwszym odpytaniu
+            logger.warning("Nie udało się pobrać danych startowych: %s", e)
+        self._check_cancelled()
+        return result
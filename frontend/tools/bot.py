@@ -0,0 +1,167 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional
+
+from tools.api_service import ApiService, PIPELINE_WINDOW
+from tools.connection_pool import PRIMARY
+
+logger = logging.getLogger(__name__)
+
+# Strona historii - tyle wiadomości zwraca serwer w jednej odpowiedzi GET_*_MESSAGES
+HISTORY_PAGE = 100
+# Najstarszy sentAt, o który pyta GUI - wcześniejszych wiadomości serwer nie przechowuje
+HISTORY_SINCE = 1638360000
+
+
+class BotError(Exception):
+    pass
+
+
+class Bot:
+    # Sesja klienta bez GUI (boty ogłoszeniowe, zakładanie kont, monitoring syntetyczny).
+    # Żądania z list (send_many, add_members, remove_members) idą potokowo przez ApiService.pipeline,
+    # a powiadomienia rozsyła osobny wątek do callbacków on_* - wywoływanych z tego wątku,
+    # więc nie powinny blokować na długo
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        lanes: tuple[str, ...] = (PRIMARY,),
+        request_timeout: float = 15.0,
+        window: int = PIPELINE_WINDOW
+    ):
+        self.host = host
+        self.port = port
+        self.api_service = ApiService(host, port, lanes=lanes, request_timeout=request_timeout, connect=False)
+        self.window = window
+        self.username: Optional[str] = None
+        self.on_message: Optional[Callable[[dict], None]] = None
+        self.on_group_message: Optional[Callable[[dict], None]] = None
+        self.on_friend_request: Optional[Callable[[dict], None]] = None
+        self.on_notification: Optional[Callable[[dict], None]] = None
+        self._running = False
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self, username: str, password: str, register: bool = False) -> "Bot":
+        if not self.api_service.connect():
+            raise BotError(f"Nie udało się połączyć z {self.host}:{self.port}")
+        if register:
+            ok = self.api_service.register(username, password)
+        else:
+            ok = self.api_service.login(username, password)
+        if not ok:
+            raise BotError(f"Logowanie {username} nieudane")
+        self.username = username
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name=f"bot-{username}", daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def close(self):
+        self._running = False
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=2.0)
+            self._dispatcher = None
+        self.api_service.disconnect()
+
+    def _dispatch_loop(self):
+        notifications = self.api_service.notification_queue
+        while self._running:
+            try:
+                notification = notifications.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            self.api_service.tracer.end_id(notification.get("_spanId"))
+            notification = {key: value for key, value in notification.items() if not key.startswith("_")}
+            notification_type = notification.get("type")
+            if notification_type == "NEW_PRIVATE_MESSAGE":
+                callback = self.on_message
+            elif notification_type == "NEW_GROUP_MESSAGE":
+                callback = self.on_group_message
+            elif notification_type == "FRIEND_REQUEST":
+                callback = self.on_friend_request
+            else:
+                callback = None
+            for handler in (callback, self.on_notification):
+                if handler is None:
+                    continue
+                try:
+                    handler(notification)
+                except Exception as e:
+                    logger.error("Błąd w callbacku powiadomienia %s: %s", notification_type, e)
+
+    def send(self, target: str, text: str, group: bool = False) -> dict:
+        return next(self.send_many([target], text, group))
+
+    def send_many(self, targets: Iterable[str], text: str, group: bool = False) -> Iterator[dict]:
+        # Wyniki w kolejności celów, w miarę nadchodzenia odpowiedzi:
+        # {"target", "code", "messageId", "message"}; code None - brak odpowiedzi serwera
+        targets = list(targets)
+        if group:
+            requests = (("SEND_GROUP_MESSAGE", {"groupId": target, "content": text}) for target in targets)
+        else:
+            requests = (("SEND_PRIVATE_MESSAGE", {"receiverUsername": target, "content": text}) for target in targets)
+        for target, response in zip(targets, self.api_service.pipeline(requests, self.window)):
+            yield {
+                "target": target,
+                "code": response.get("code"),
+                "messageId": response.get("messageId"),
+                "message": response.get("message"),
+            }
+
+    def add_members(self, group_id: str, usernames: Iterable[str]) -> Iterator[dict]:
+        return self.api_service.add_members_to_group(group_id, usernames, self.window)
+
+    def remove_members(self, group_id: str, usernames: Iterable[str]) -> Iterator[dict]:
+        return self.api_service.remove_members_from_group(group_id, usernames, self.window)
+
+    def history(self, kind: str, target: str, since: int = HISTORY_SINCE, page_size: int = HISTORY_PAGE) -> Iterator[dict]:
+        # Cała rozmowa stronami od najnowszych; kończy się na niepełnej stronie
+        offset = 0
+        while True:
+            if kind == "group":
+                messages = self.api_service.get_group_messages(target, since, page_size, offset)
+            else:
+                messages = self.api_service.get_private_messages(target, since, page_size, offset)
+            if messages is None:
+                raise BotError(f"Nie udało się pobrać historii rozmowy {target}")
+            yield from messages
+            if len(messages) < page_size:
+                return
+            offset += len(messages)
+
+
+def run_sessions(
+    accounts: Iterable[tuple[str, str]],
+    action: Callable[[Bot], object],
+    host: str,
+    port: int,
+    concurrency: int = 8,
+    register: bool = False,
+    **options
+) -> Iterator[tuple[str, object, Optional[Exception]]]:
+    # Wiele kont naraz: każde dostaje własną sesję (połączenie i token), action wykonuje
+    # się w puli wątków. Wyniki (użytkownik, wynik, błąd) w kolejności kont
+    def run(account: tuple[str, str]):
+        username, password = account
+        started_at = time.monotonic()
+        try:
+            with Bot(host, port, **options) as bot:
+                bot.start(username, password, register)
+                result = action(bot)
+            logger.debug("Sesja %s zakończona po %.0f ms", username, (time.monotonic() - started_at) * 1000)
+            return username, result, None
+        except Exception as e:
+            return username, None, e
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bot-session") as executor:
+        yield from executor.map(run, accounts)
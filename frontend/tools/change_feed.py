@@ -0,0 +1,256 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+from tools.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+FRIEND_ADDED = "FRIEND_ADDED"
+FRIEND_REMOVED = "FRIEND_REMOVED"
+FRIEND_REQUEST_ADDED = "FRIEND_REQUEST_ADDED"
+FRIEND_REQUEST_REMOVED = "FRIEND_REQUEST_REMOVED"
+GROUP_ADDED = "GROUP_ADDED"
+GROUP_REMOVED = "GROUP_REMOVED"
+GROUP_RENAMED = "GROUP_RENAMED"
+MEMBER_JOINED = "MEMBER_JOINED"
+MEMBER_LEFT = "MEMBER_LEFT"
+
+CHANGE_EVENTS = frozenset({
+    FRIEND_ADDED, FRIEND_REMOVED, FRIEND_REQUEST_ADDED, FRIEND_REQUEST_REMOVED,
+    GROUP_ADDED, GROUP_REMOVED, GROUP_RENAMED, MEMBER_JOINED, MEMBER_LEFT,
+})
+
+# Która lista zmienia się po zdarzeniu - GUI odświeża tylko ją
+FRIENDS = "friends"
+GROUPS = "groups"
+MEMBERS = "members"
+SNAPSHOT = "snapshot"
+
+EVENT_SCOPES = {
+    FRIEND_ADDED: FRIENDS,
+    FRIEND_REMOVED: FRIENDS,
+    FRIEND_REQUEST_ADDED: FRIENDS,
+    FRIEND_REQUEST_REMOVED: FRIENDS,
+    GROUP_ADDED: GROUPS,
+    GROUP_REMOVED: GROUPS,
+    GROUP_RENAMED: GROUPS,
+    MEMBER_JOINED: MEMBERS,
+    MEMBER_LEFT: MEMBERS,
+}
+
+
+class Directory:
+    # Lokalna kopia list znajomych, zaproszeń i grup. Zdarzenia są idempotentne (dodanie
+    # istniejącego albo usunięcie brakującego nic nie zmienia), więc nałożenie zdarzenia,
+    # którego skutek jest już w pobranej migawce, jest bezpieczne
+    def __init__(self):
+        self.friends: dict[str, None] = {}
+        self.pending_requests: dict[str, None] = {}
+        self.groups: dict[str, dict] = {}
+
+    def load(self, pending_requests: list, friends: list, groups: list):
+        self.friends = dict.fromkeys(str(friend) for friend in friends)
+        self.pending_requests = {}
+        for request in pending_requests:
+            requester = request.get("requester", request.get("from")) if isinstance(request, dict) else request
+            if requester:
+                self.pending_requests[str(requester)] = None
+        self.groups = {}
+        for group in groups:
+            group_id = group.get("groupId", group.get("id")) if isinstance(group, dict) else group
+            name = group.get("name", str(group_id)) if isinstance(group, dict) else str(group)
+            self.groups[str(group_id)] = {"groupId": str(group_id), "name": name}
+
+    def apply(self, event: dict) -> bool:
+        event_type = event["type"]
+        if event_type == FRIEND_ADDED:
+            return self._add(self.friends, event["username"])
+        if event_type == FRIEND_REMOVED:
+            return self._remove(self.friends, event["username"])
+        if event_type == FRIEND_REQUEST_ADDED:
+            return self._add(self.pending_requests, event["requester"])
+        if event_type == FRIEND_REQUEST_REMOVED:
+            return self._remove(self.pending_requests, event["requester"])
+        if event_type == GROUP_ADDED:
+            if event["groupId"] in self.groups:
+                return False
+            self.groups[event["groupId"]] = {"groupId": event["groupId"], "name": event.get("name", "")}
+            return True
+        if event_type == GROUP_REMOVED:
+            return self.groups.pop(event["groupId"], None) is not None
+        if event_type == GROUP_RENAMED:
+            group = self.groups.get(event["groupId"])
+            if group is None or group["name"] == event["name"]:
+                return False
+            group["name"] = event["name"]
+            return True
+        # Składu grup lista nie przechowuje - zdarzenia członków trafiają tylko do GUI
+        return event_type in (MEMBER_JOINED, MEMBER_LEFT)
+
+    @staticmethod
+    def _add(items: dict[str, None], key: str) -> bool:
+        if key in items:
+            return False
+        items[key] = None
+        return True
+
+    @staticmethod
+    def _remove(items: dict[str, None], key: str) -> bool:
+        if key not in items:
+            return False
+        del items[key]
+        return True
+
+    def friend_list(self) -> list[str]:
+        return list(self.friends)
+
+    def pending_request_list(self) -> list[dict]:
+        return [{"requester": requester} for requester in self.pending_requests]
+
+    def group_list(self) -> list[dict]:
+        return [dict(group) for group in self.groups.values()]
+
+
+class ChangeFeed:
+    # Subskrypcja zmian list: serwer wysyła zdarzenia z kolejnym numerem wersji na
+    # użytkownika. Zdarzenie z następną wersją jest nakładane od razu, starsze są
+    # duplikatami, a dziura w numeracji uruchamia synchronizację - serwer dosyła brakujące
+    # zdarzenia albo, gdy ich już nie pamięta, klient pobiera pełne listy
+    def __init__(
+        self,
+        subscribe: Callable[[Optional[int]], dict],
+        fetch: Callable[[], tuple[list, list, list]],
+        metrics: Optional[Metrics] = None
+    ):
+        self.subscribe = subscribe
+        self.fetch = fetch
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.directory = Directory()
+        self.version: Optional[int] = None
+        self.supported: Optional[bool] = None
+        self.on_change: Optional[Callable[[str, dict], None]] = None
+        self._lock = threading.Lock()
+        self._syncing = False
+        self._sync_requested = False
+        self._buffer: list[dict] = []
+
+    @property
+    def active(self) -> bool:
+        return self.supported is True and self.version is not None
+
+    def snapshot(self) -> tuple[list[dict], list[str], list[dict]]:
+        with self._lock:
+            return (
+                self.directory.pending_request_list(),
+                self.directory.friend_list(),
+                self.directory.group_list(),
+            )
+
+    def handle(self, event: dict):
+        # Wywoływane z wątku odbioru - bez żądań sieciowych, synchronizacja idzie osobnym wątkiem
+        changes = []
+        with self._lock:
+            if self._syncing or self.version is None:
+                self._buffer.append(event)
+                return
+            gap = self._apply_events([event], changes)
+        self._publish(changes)
+        if gap:
+            self.request_sync()
+
+    def request_sync(self):
+        with self._lock:
+            self._sync_requested = True
+            if self._syncing:
+                return
+            self._syncing = True
+        threading.Thread(target=self._sync_loop, name="change-feed-sync", daemon=True).start()
+
+    def sync(self) -> bool:
+        # Synchroniczna wersja dla logowania i wznowienia sesji
+        with self._lock:
+            if self._syncing:
+                self._sync_requested = True
+                return self.active
+            self._syncing = True
+            self._sync_requested = True
+        return self._sync_loop()
+
+    def _sync_loop(self) -> bool:
+        ok = False
+        while True:
+            with self._lock:
+                if not self._sync_requested:
+                    self._syncing = False
+                    break
+                self._sync_requested = False
+            try:
+                ok = self._sync_once()
+            except Exception as e:
+                logger.warning("Synchronizacja zmian nieudana: %s", e)
+                ok = False
+        return ok
+
+    def _sync_once(self) -> bool:
+        since = self.version
+        response = self.subscribe(since)
+        if response.get("code") == 400:
+            if self.supported is None:
+                logger.info("Serwer nie obsługuje subskrypcji zmian - odpytywanie list")
+            self.supported = False
+            return False
+        if response.get("code") != 200:
+            logger.warning("Subskrypcja zmian odrzucona: %s", response.get("message"))
+            return False
+        self.supported = True
+
+        changes = []
+        if since is None or response.get("resync"):
+            pending_requests, friends, groups = self.fetch()
+            with self._lock:
+                self.directory.load(pending_requests, friends, groups)
+            changes.append((SNAPSHOT, {}))
+            self.metrics.incr("changes.resyncs")
+            events = []
+        else:
+            events = response.get("events", [])
+
+        with self._lock:
+            gap = self._apply_events(events, changes)
+            # Stan odpowiada wersji z odpowiedzi; zdarzenia, które przyszły w trakcie, są nowsze
+            self.version = max(self.version or 0, response.get("version", 0))
+            buffered = sorted(self._buffer, key=lambda e: e.get("version", 0))
+            self._buffer.clear()
+            gap = self._apply_events(buffered, changes) or gap
+            if gap:
+                self._sync_requested = True
+        self._publish(changes)
+        return True
+
+    def _apply_events(self, events: list[dict], changes: list) -> bool:
+        gap = False
+        for event in events:
+            version = event.get("version", 0)
+            if self.version is not None and version <= self.version:
+                self.metrics.incr("changes.duplicates")
+                continue
+            if self.version is not None and version > self.version + 1:
+                self.metrics.incr("changes.gaps")
+                self._buffer.append(event)
+                gap = True
+                continue
+            if self.directory.apply(event):
+                changes.append((EVENT_SCOPES.get(event["type"], SNAPSHOT), event))
+            self.version = version
+            self.metrics.incr("changes.applied")
+        return gap
+
+    def _publish(self, changes: list):
+        if not self.on_change:
+            return
+        for scope, event in changes:
+            try:
+                self.on_change(scope, event)
+            except Exception as e:
+                logger.error("Błąd w callbacku on_change: %s", e)
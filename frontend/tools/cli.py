@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Optional, TextIO
+
+from tools.api_service import ALREADY_MEMBER, MEMBER_ADDED, MEMBER_REMOVED, NOT_MEMBER, PIPELINE_WINDOW
+from tools.bot import Bot, BotError, HISTORY_SINCE, run_sessions
+from tools.history_export import HistoryExporter, PARALLEL_CONVERSATIONS
+from tools.log import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+class Output:
+    # Wyniki jako JSON, po jednym obiekcie w wierszu; przy wielu kontach z polem "account".
+    # Sesje piszą z różnych wątków, więc wiersze są zapisywane pod blokadą
+    def __init__(self, stream: TextIO, many_accounts: bool):
+        self.stream = stream
+        self.many_accounts = many_accounts
+        self._lock = threading.Lock()
+
+    def write(self, bot: Bot, record: dict):
+        if self.many_accounts:
+            record = dict(record, account=bot.username)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def split_values(values: Optional[list[str]]) -> list[str]:
+    result = []
+    for value in values or []:
+        result.extend(part.strip() for part in value.split(",") if part.strip())
+    return result
+
+
+def read_lines(path: str) -> list[str]:
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.startswith("#")]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def read_accounts(args) -> list[tuple[str, str]]:
+    if args.accounts:
+        accounts = []
+        for line in read_lines(args.accounts):
+            username, _, password = line.partition(":")
+            accounts.append((username, password))
+        return accounts
+    if not args.user or args.password is None:
+        raise SystemExit("Podaj --user i --password (albo RECOMM_USER i RECOMM_PASSWORD) lub --accounts")
+    return [(args.user, args.password)]
+
+
+def command_send(args, output: Output, stopping: threading.Event) -> Callable[[Bot], bool]:
+    users = split_values(args.to)
+    if args.targets_file:
+        users.extend(read_lines(args.targets_file))
+    groups = split_values(args.group)
+    if not users and not groups:
+        raise SystemExit("Podaj odbiorców: --to, --group albo --targets-file")
+    text = sys.stdin.read().strip() if args.text == "-" else args.text
+
+    def action(bot: Bot) -> bool:
+        ok = True
+        for targets, group in ((users, False), (groups, True)):
+            for result in bot.send_many(targets, text, group):
+                output.write(bot, result)
+                ok = ok and result["code"] == 200
+                if stopping.is_set():
+                    return False
+        return ok
+    return action
+
+
+def command_tail(args, output: Output, stopping: threading.Event) -> Callable[[Bot], bool]:
+    # Powiadomienia do --count sztuk albo do upływu --for sekund (Ctrl+C kończy wcześniej)
+    def action(bot: Bot) -> bool:
+        received = [0]
+        done = threading.Event()
+
+        def on_notification(notification: dict):
+            if args.type and notification.get("type") not in args.type:
+                return
+            output.write(bot, notification)
+            received[0] += 1
+            if args.count and received[0] >= args.count:
+                done.set()
+
+        bot.on_notification = on_notification
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while not done.is_set() and not stopping.is_set():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done.wait(0.5 if remaining is None else min(0.5, remaining))
+        bot.on_notification = None
+        return not args.count or received[0] >= args.count
+    return action
+
+
+def list_conversations(bot: Bot) -> list[tuple[str, str]]:
+    friends = bot.api_service.get_all_friends()
+    groups = bot.api_service.get_all_users_groups()
+    if friends is None or groups is None:
+        raise BotError("Nie udało się pobrać listy znajomych i grup")
+    conversations = [("user", str(friend)) for friend in friends]
+    for group in groups:
+        group_id = group.get("id", group.get("groupId", "")) if isinstance(group, dict) else str(group)
+        conversations.append(("group", group_id))
+    return conversations
+
+
+def command_export(args, output: Output, stopping: threading.Event) -> Callable[[Bot], bool]:
+    # Bez --dir jedna rozmowa na standardowe wyjście; z --dir - pliki per rozmowa
+    # z punktem wznowienia, kilka rozmów naraz
+    conversations = [("user", target) for target in split_values(args.user_target)]
+    conversations += [("group", target) for target in split_values(args.group_target)]
+    if args.dir is None:
+        if len(conversations) != 1 or args.all:
+            raise SystemExit("Bez --dir podaj dokładnie jedną rozmowę: --with albo --group")
+        kind, target = conversations[0]
+
+        def action(bot: Bot) -> bool:
+            count = 0
+            for message in bot.history(kind, target, args.since):
+                output.write(bot, message)
+                count += 1
+                if stopping.is_set():
+                    return False
+            logger.info("Wyeksportowano %d wiadomości rozmowy %s", count, target)
+            return True
+        return action
+
+    if not conversations and not args.all:
+        raise SystemExit("Podaj rozmowy: --with, --group albo --all")
+
+    def export_action(bot: Bot) -> bool:
+        # Przy wielu kontach każde dostaje własny podkatalog
+        directory = os.path.join(args.dir, bot.username) if output.many_accounts else args.dir
+        exporter = HistoryExporter(
+            bot.api_service, directory, args.since, parallel=args.parallel, compress=args.compress
+        )
+        ok = True
+        for result in exporter.export(list_conversations(bot) if args.all else conversations, stopping):
+            output.write(bot, result)
+            ok = ok and result["done"]
+        return ok and not stopping.is_set()
+    return export_action
+
+
+def command_members(args, output: Output, stopping: threading.Event) -> Callable[[Bot], bool]:
+    usernames = split_values(args.usernames)
+    if args.file:
+        usernames.extend(read_lines(args.file))
+    if not usernames:
+        raise SystemExit("Podaj użytkowników albo --file")
+    adding = args.command == "add-members"
+    # Użytkownik, który już jest (albo już go nie ma) w grupie, nie jest błędem - polecenie można powtórzyć
+    accepted = (MEMBER_ADDED, ALREADY_MEMBER) if adding else (MEMBER_REMOVED, NOT_MEMBER)
+
+    def action(bot: Bot) -> bool:
+        ok = True
+        results = bot.add_members if adding else bot.remove_members
+        for result in results(args.group_id, usernames):
+            output.write(bot, result)
+            ok = ok and result["status"] in accepted
+            if stopping.is_set():
+                return False
+        return ok
+    return action
+
+
+COMMANDS = {
+    "send": command_send,
+    "tail": command_tail,
+    "export": command_export,
+    "add-members": command_members,
+    "remove-members": command_members,
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="reComm :: klient wiersza poleceń (bez GUI)")
+    parser.add_argument("--host", default=os.environ.get("RECOMM_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("RECOMM_PORT", "8080")))
+    parser.add_argument("--user", default=os.environ.get("RECOMM_USER"))
+    parser.add_argument("--password", default=os.environ.get("RECOMM_PASSWORD"))
+    parser.add_argument("--register", action="store_true", help="Załóż konto zamiast logować")
+    parser.add_argument("--accounts", help="Plik z kontami użytkownik:hasło (po jednym w wierszu, '-' - stdin)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Ile sesji działa jednocześnie przy --accounts")
+    parser.add_argument("--window", type=int, default=PIPELINE_WINDOW, help="Ile żądań czeka naraz na odpowiedź")
+    parser.add_argument("--timeout", type=float, default=15.0, help="Czas oczekiwania na odpowiedź serwera")
+    parser.add_argument("--output", help="Zapisz wyniki (JSONL) do pliku zamiast na standardowe wyjście")
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    send = commands.add_parser("send", help="Wyślij wiadomość do wielu odbiorców (potokowo)")
+    send.add_argument("text", help="Treść wiadomości; '-' - ze standardowego wejścia")
+    send.add_argument("--to", action="append", help="Odbiorcy, np. --to ala,ola")
+    send.add_argument("--group", action="append", help="Identyfikatory grup")
+    send.add_argument("--targets-file", help="Plik z odbiorcami (po jednym w wierszu)")
+
+    tail = commands.add_parser("tail", help="Wypisuj powiadomienia na bieżąco")
+    tail.add_argument("--count", type=int, default=0, help="Zakończ po tylu powiadomieniach")
+    tail.add_argument("--for", dest="duration", type=float, default=0, help="Zakończ po tylu sekundach")
+    tail.add_argument("--type", action="append", help="Tylko powiadomienia tego typu, np. NEW_PRIVATE_MESSAGE")
+
+    export = commands.add_parser("export", help="Eksportuj historię rozmów (JSONL)")
+    export.add_argument("--with", dest="user_target", action="append", help="Rozmowy prywatne z użytkownikami")
+    export.add_argument("--group", dest="group_target", action="append", help="Rozmowy grupowe")
+    export.add_argument("--all", action="store_true", help="Wszystkie rozmowy ze znajomymi i grupami (z --dir)")
+    export.add_argument("--since", type=int, default=HISTORY_SINCE, help="Od sentAt (sekundy)")
+    export.add_argument("--dir", help="Katalog eksportu: plik na rozmowę i punkt wznowienia")
+    export.add_argument("--compress", action="store_true", help="Pliki .jsonl.gz (z --dir)")
+    export.add_argument(
+        "--parallel", type=int, default=PARALLEL_CONVERSATIONS, help="Ile rozmów eksportować naraz (z --dir)"
+    )
+
+    for name, help_text in (
+        ("add-members", "Dodaj użytkowników do grupy (potokowo)"),
+        ("remove-members", "Usuń użytkowników z grupy (potokowo)"),
+    ):
+        members = commands.add_parser(name, help=help_text)
+        members.add_argument("group_id")
+        members.add_argument("usernames", nargs="*")
+        members.add_argument("--file", help="Plik z użytkownikami (po jednym w wierszu)")
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    level = {0: logging.WARNING, 1: logging.INFO}.get(args.verbose, logging.DEBUG)
+    log_listener = setup_logging(level=level, log_file=os.environ.get("RECOMM_LOG_FILE"))
+
+    accounts = read_accounts(args)
+    stream = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    output = Output(stream, len(accounts) > 1)
+    # Ctrl+C kończy sesje po bieżącym żądaniu, zamiast przerywać wątki w połowie
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+    action = COMMANDS[args.command](args, output, stopping)
+    failed = 0
+    try:
+        for username, ok, error in run_sessions(
+            accounts, action, args.host, args.port, args.concurrency, args.register,
+            request_timeout=args.timeout, window=args.window
+        ):
+            if error is not None:
+                logger.error("Sesja %s: %s", username, error)
+            if error is not None or not ok:
+                failed += 1
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+        log_listener.stop()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Optional
+
+from tools.metrics import Metrics
+from tools.tcp_client import TCPClient, ConnectionState, OutgoingFrame, Priority, BackpressurePolicy, SendQueueFull
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "primary"
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Serwer dzieli strumień na żądania i odpowiada w ich kolejności, więc na połączeniu może
+# czekać kilka wysłanych żądań naraz; limit chroni przed zapchaniem bufora serwera
+PIPELINE_DEPTH = 8
+
+DEFAULT_ROUTES = {
+    "SEND_PRIVATE_MESSAGE": INTERACTIVE,
+    "SEND_GROUP_MESSAGE": INTERACTIVE,
+    "SEND_FRIEND_REQUEST": INTERACTIVE,
+    "ACCEPT_FRIEND_REQUEST": INTERACTIVE,
+    "REJECT_FRIEND_REQUEST": INTERACTIVE,
+    "GET_PRIVATE_MESSAGES": BULK,
+    "GET_GROUP_MESSAGES": BULK,
+    "GET_GROUP_MEMBERS": BULK,
+    "GET_GROUP_DETAILS": BULK,
+    "GET_USER_GROUPS": BULK,
+    "GET_FRIENDS": BULK,
+    "GET_PENDING_REQUESTS": BULK,
+}
+
+
+class Lane:
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        port: int,
+        metrics: Metrics,
+        on_frame: Callable[["Lane", dict], None],
+        backpressure_policy: BackpressurePolicy = BackpressurePolicy.DROP_BACKGROUND
+    ):
+        self.name = name
+        self.metrics = metrics
+        self.tcp_client = TCPClient(
+            host=host, port=port, metrics=metrics, max_in_flight=PIPELINE_DEPTH, backpressure_policy=backpressure_policy
+        )
+        self.last_used = time.monotonic()
+        self.reconnected = threading.Event()
+        self.on_connected: Optional[Callable[[], None]] = None
+        self.on_state: Optional[Callable[[ConnectionState], None]] = None
+        self._on_frame = on_frame
+        # Odpowiedzi przychodzą w kolejności zapisu żądań do gniazda
+        self._in_flight: deque[Future] = deque()
+        self._lock = threading.Lock()
+        self.tcp_client.on_message = self._handle_receive
+        self.tcp_client.on_connection_change = self._handle_state
+        self.tcp_client.on_frame_sent = self._handle_sent
+        self.tcp_client.on_frame_dropped = self._handle_dropped
+
+    def _handle_receive(self, frame: memoryview):
+        # TCPClient dzieli strumień na ramki i wydaje je jako widok na swój bufor odbioru -
+        # tekst jest dekodowany prosto z widoku, bez pośredniej kopii do bytes
+        text = str(frame, 'utf-8')
+        if text.strip():
+            self.metrics.incr("api.frames_in")
+            self._on_frame(self, json.loads(text))
+
+    def _handle_sent(self, frame: OutgoingFrame):
+        with self._lock:
+            self._in_flight.append(frame.tag)
+        self.metrics.gauge(f"pool.{self.name}.in_flight", len(self._in_flight))
+
+    def _handle_dropped(self, frame: OutgoingFrame):
+        # Żądanie w tle wyparte z przepełnionej kolejki przez nowszy ruch
+        if not frame.tag.done():
+            frame.tag.set_exception(SendQueueFull("Żądanie w tle pominięte z powodu przepełnienia kolejki"))
+
+    def _handle_state(self, state: ConnectionState):
+        if state == ConnectionState.CONNECTED:
+            self.reconnected.set()
+            if self.on_connected:
+                self.on_connected()
+        else:
+            # Żądania wysłane na zerwanym połączeniu nie doczekają się odpowiedzi
+            with self._lock:
+                lost = list(self._in_flight)
+                self._in_flight.clear()
+            for future in lost:
+                if not future.done():
+                    future.set_exception(ConnectionError("Połączenie zerwane w trakcie żądania"))
+        if self.on_state:
+            self.on_state(state)
+
+    def resolve(self, frame: dict):
+        with self._lock:
+            future = self._in_flight.popleft() if self._in_flight else None
+        self.tcp_client.complete()
+        if future is None:
+            logger.warning("Odpowiedź bez oczekującego żądania na połączeniu %s", self.name)
+            self.metrics.incr(f"pool.{self.name}.unmatched")
+            return
+        if not future.done():
+            future.set_result((frame, time.monotonic()))
+
+    def submit(
+        self,
+        payload: str,
+        on_sent: Optional[Callable[[], None]] = None,
+        priority: Priority = Priority.NORMAL,
+        merge_key: Optional[str] = None
+    ) -> OutgoingFrame:
+        self.last_used = time.monotonic()
+        future: Future = Future()
+        frame = self.tcp_client.send(payload, on_sent=on_sent, priority=priority, merge_key=merge_key, tag=future)
+        if frame is None:
+            raise ConnectionError("Połączenie nie jest uruchomione")
+        if frame.tag is not future:
+            self.metrics.incr(f"pool.{self.name}.merged")
+        return frame
+
+    def wait(self, frame: OutgoingFrame, timeout: float) -> tuple[dict, float]:
+        try:
+            return frame.tag.result(timeout=timeout)
+        except FutureTimeout:
+            self.metrics.incr(f"pool.{self.name}.timeouts")
+            with self._lock:
+                written = frame.tag in self._in_flight
+            if written:
+                # Odpowiedzi przychodzą po kolei, więc brak jednej blokuje wszystkie następne
+                logger.warning("Brak odpowiedzi na połączeniu %s po %.0fs - wymuszam ponowne połączenie", self.name, timeout)
+                self.tcp_client.reconnect()
+            elif frame.merged == 0:
+                self.tcp_client.cancel(frame)
+            raise TimeoutError("Przekroczono czas oczekiwania na odpowiedź serwera")
+
+    def request(
+        self,
+        payload: str,
+        timeout: float,
+        on_sent: Optional[Callable[[], None]] = None,
+        priority: Priority = Priority.NORMAL,
+        merge_key: Optional[str] = None
+    ) -> tuple[dict, float]:
+        return self.wait(self.submit(payload, on_sent, priority, merge_key), timeout)
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        metrics: Metrics,
+        on_notification: Callable[[dict], None],
+        lanes: tuple[str, ...] = (PRIMARY,),
+        routes: Optional[dict[str, str]] = None,
+        health_interval: float = 30.0,
+        backpressure_policy: BackpressurePolicy = BackpressurePolicy.DROP_BACKGROUND
+    ):
+        self.metrics = metrics
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.health_interval = health_interval
+        self.on_notification = on_notification
+        self.probe: Optional[Callable[[Lane], None]] = None
+        self.on_backpressure: Optional[Callable[[bool], None]] = None
+        self.on_connected: Optional[Callable[[Lane], None]] = None
+        self._pressured: set[str] = set()
+        self._pressure_lock = threading.Lock()
+        self._running = False
+        self._wakeup = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+        names = (PRIMARY,) + tuple(name for name in lanes if name != PRIMARY)
+        self.lanes: dict[str, Lane] = {
+            name: Lane(name, host, port, metrics, self._handle_frame, backpressure_policy) for name in names
+        }
+        self.primary = self.lanes[PRIMARY]
+        for lane in self.lanes.values():
+            lane.on_connected = functools.partial(self._handle_connected, lane)
+            lane.tcp_client.on_backpressure = functools.partial(self._handle_backpressure, lane)
+
+    @property
+    def backpressure(self) -> bool:
+        return bool(self._pressured)
+
+    def _handle_connected(self, lane: Lane):
+        self._wakeup.set()
+        if self.on_connected:
+            self.on_connected(lane)
+
+    def _handle_backpressure(self, lane: Lane, active: bool):
+        with self._pressure_lock:
+            before = bool(self._pressured)
+            if active:
+                self._pressured.add(lane.name)
+            else:
+                self._pressured.discard(lane.name)
+            after = bool(self._pressured)
+        if before != after and self.on_backpressure:
+            self.on_backpressure(after)
+
+    def _handle_frame(self, lane: Lane, frame: dict):
+        # Powiadomienia idą na połączenie główne - dodatkowe wysyłają żądania z "notifications":
+        # false i serwer ich nie rejestruje. Zbieramy je jednak ze wszystkich połączeń: starszy
+        # serwer bez tej opcji kieruje je na połączenie, które ostatnio przedstawiło token
+        if "type" in frame:
+            self.on_notification(frame)
+        else:
+            lane.resolve(frame)
+
+    def connect(self):
+        self.primary.tcp_client.connect()
+        for lane in self.lanes.values():
+            if lane is not self.primary:
+                lane.tcp_client.connect()
+        for lane in self.lanes.values():
+            lane.reconnected.clear()
+
+        if len(self.lanes) > 1 and self.health_interval > 0:
+            self._running = True
+            self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._health_thread.start()
+
+    def lane_for(self, method: str) -> Lane:
+        lane = self.lanes.get(self.routes.get(method, PRIMARY), self.primary)
+        if lane is not self.primary and not lane.tcp_client.is_connected:
+            self.metrics.incr("pool.fallbacks")
+            return self.primary
+        return lane
+
+    def _health_loop(self):
+        while self._running:
+            self._wakeup.wait(self.health_interval)
+            self._wakeup.clear()
+            if not self._running:
+                break
+
+            now = time.monotonic()
+            for lane in self.lanes.values():
+                reconnected = lane.reconnected.is_set() and lane is not self.primary
+                idle = now - lane.last_used >= self.health_interval
+                if not reconnected and not idle:
+                    continue
+                lane.reconnected.clear()
+                self.check(lane)
+
+    def check(self, lane: Lane):
+        if not lane.tcp_client.is_connected or self.probe is None:
+            return
+
+        try:
+            self.probe(lane)
+            self.metrics.incr(f"pool.{lane.name}.health_checks")
+        except (TimeoutError, ConnectionError) as e:
+            logger.warning("Połączenie %s nie przeszło kontroli: %s", lane.name, e)
+            self.metrics.incr(f"pool.{lane.name}.health_failures")
+
+    def disconnect(self):
+        self._running = False
+        self._wakeup.set()
+        for lane in self.lanes.values():
+            lane.tcp_client.disconnect()
+        if self._health_thread and self._health_thread.is_alive():
+            self._health_thread.join(timeout=2.0)
@@ -0,0 +1,274 @@
+import bisect
+import heapq
+import itertools
+import operator
+import re
+import time
+from typing import Iterable, Iterator, Optional
+
+from tools.prefix_index import PrefixIndex, normalize
+
+USER = "user"
+GROUP = "group"
+
+RESULT_LIMIT = 50
+WORD_SEPARATORS = re.compile(r"[\s_.\-]+")
+
+# Tyle czasu jedno wywołanie advance() dokłada kolejne kawałki dopasowania rozmytego - razem
+# z prefiksami znak mieści się w milisekundzie, a reszta idzie w kolejnych przebiegach pętli zdarzeń
+KEYSTROKE_BUDGET = 0.0005
+# Górna granica długości jednego kawałka tekstu nazw - jedno przejście wyrażenia regularnego
+# i szeregowanie jego trafień trwa ułamek budżetu
+FUZZY_CHUNK = 8192
+
+Conversation = tuple[str, str]
+# (pierwsza litera nazwy, litera w dalszej części nazwy)
+LetterPair = tuple[str, str]
+# (pozycja pierwszego wystąpienia drugiej litery pary + 1, długość nazwy)
+Segment = tuple[int, int]
+
+
+def fuzzy_segments(name: str) -> Iterator[tuple[LetterPair, Segment]]:
+    for letter in dict.fromkeys(name[1:]):
+        yield (name[0], letter), (name.index(letter, 1) + 1, len(name))
+
+
+class ConversationIndex:
+    # Znajomi i grupy do szybkiego przełączania rozmów. Ranking: najpierw nazwy zaczynające się
+    # od zapytania, potem nazwy z dalszym słowem zaczynającym się od zapytania ("kow" ->
+    # "Jan Kowalski"), na końcu dopasowanie rozmyte - litery zapytania po kolei w nazwie
+    # ("jkw" -> "Jan Kowalski"), im bliżej siebie, tym wyżej. Listy są nakładane różnicowo,
+    # więc odświeżenie bez zmian nie przebudowuje indeksu
+    def __init__(self):
+        self.names: PrefixIndex[Conversation] = PrefixIndex()
+        self.words: PrefixIndex[Conversation] = PrefixIndex()
+        self.titles: dict[Conversation, str] = {}
+        self.friends: set[str] = set()
+        self.groups: dict[str, str] = {}
+        # Rośnie przy każdej zmianie - rozpoczęte wyszukiwanie liczy się wtedy od nowa
+        self.version = 0
+        # Znormalizowana nazwa -> rozmowy o tej nazwie (znajomy i grupa mogą się nazywać tak samo)
+        self._named: dict[str, list[Conversation]] = {}
+        # Do dopasowania rozmytego: nazwy pogrupowane po parze liter (pierwsza litera nazwy,
+        # dalsza litera) i segmencie (pozycja tej litery, długość nazwy). Ostatnia litera
+        # zapytania musi wystąpić w nazwie najwcześniej na tej pozycji, więc segmenty
+        # w kolejności rosnącej dają dolne ograniczenie miejsca w rankingu - przeszukiwanie
+        # kończy się, gdy żaden dalszy segment nie może wejść do wyników. Nazwy segmentu
+        # sklejone w kawałki tekstu, każda między znakami nowej linii
+        self._chunks: dict[LetterPair, dict[Segment, list[str]]] = {}
+        self._segments: dict[LetterPair, list[Segment]] = {}
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def title(self, kind: str, target: str) -> Optional[str]:
+        return self.titles.get((kind, target))
+
+    def set_friends(self, friends: Iterable[str]):
+        friends = set(friends)
+        self.remove([(USER, friend) for friend in self.friends - friends])
+        self.add([((USER, friend), friend) for friend in friends - self.friends])
+        self.friends = friends
+
+    def set_groups(self, groups: Iterable[tuple[str, str]]):
+        groups = {str(group_id): group_name for group_id, group_name in groups}
+        # Zmiana nazwy to usunięcie starych kluczy i dodanie nowych
+        changed = [group_id for group_id, group_name in self.groups.items() if groups.get(group_id) != group_name]
+        self.remove([(GROUP, group_id) for group_id in changed])
+        self.add([((GROUP, group_id), group_name) for group_id, group_name in groups.items()
+                  if self.groups.get(group_id) != group_name])
+        self.groups = groups
+
+    def add(self, conversations: list[tuple[Conversation, str]]):
+        if not conversations:
+            return
+        words = []
+        for conversation, title in conversations:
+            self.titles[conversation] = title
+            words.extend((word, conversation) for word in WORD_SEPARATORS.split(title)[1:] if word)
+        self.names.update((title, conversation) for conversation, title in conversations)
+        self.words.update(words)
+        appended: dict[tuple[LetterPair, Segment], list[str]] = {}
+        for conversation, title in conversations:
+            name = normalize(title)
+            named = self._named.setdefault(name, [])
+            if not named:
+                for pair, segment in fuzzy_segments(name):
+                    appended.setdefault((pair, segment), []).append(name)
+            named.append(conversation)
+        # Jedno doklejenie na segment - przy pierwszym wczytaniu list kawałki nie są
+        # kopiowane dla każdej nazwy osobno
+        for (pair, segment), names in appended.items():
+            chunks = self._chunks.setdefault(pair, {}).get(segment)
+            if chunks is None:
+                chunks = self._chunks[pair][segment] = []
+                bisect.insort(self._segments.setdefault(pair, []), segment)
+            self._append_chunks(chunks, names)
+        self.version += 1
+
+    def remove(self, conversations: list[Conversation]):
+        if not conversations:
+            return
+        names = []
+        words = []
+        for conversation in conversations:
+            title = self.titles.pop(conversation)
+            names.append((title, conversation))
+            words.extend((word, conversation) for word in WORD_SEPARATORS.split(title)[1:] if word)
+        self.names.discard(names)
+        self.words.discard(words)
+        for title, conversation in names:
+            name = normalize(title)
+            named = self._named[name]
+            named.remove(conversation)
+            if named:
+                continue
+            del self._named[name]
+            for pair, segment in fuzzy_segments(name):
+                self._remove_chunk_name(pair, segment, name)
+        self.version += 1
+
+    @staticmethod
+    def _append_chunks(chunks: list[str], names: list[str]):
+        parts = [chunks.pop()] if chunks and len(chunks[-1]) < FUZZY_CHUNK else ["\n"]
+        size = len(parts[0])
+        for name in names:
+            if size >= FUZZY_CHUNK:
+                chunks.append("".join(parts))
+                parts = ["\n"]
+                size = 1
+            parts.append(f"{name}\n")
+            size += len(name) + 1
+        chunks.append("".join(parts))
+
+    def _remove_chunk_name(self, pair: LetterPair, segment: Segment, name: str):
+        chunks = self._chunks[pair][segment]
+        line = f"\n{name}\n"
+        for i, chunk in enumerate(chunks):
+            position = chunk.find(line)
+            if position < 0:
+                continue
+            chunk = chunk[:position + 1] + chunk[position + len(line):]
+            if len(chunk) > 1:
+                chunks[i] = chunk
+            else:
+                del chunks[i]
+            break
+        if chunks:
+            return
+        del self._chunks[pair][segment]
+        segments = self._segments[pair]
+        del segments[bisect.bisect_left(segments, segment)]
+        if not segments:
+            del self._chunks[pair]
+            del self._segments[pair]
+
+    def search(self, query: str, limit: int = RESULT_LIMIT) -> list[Conversation]:
+        search = ConversationSearch(self, query, limit)
+        search.advance()
+        return search.results()
+
+    def fuzzy(self, key: str, limit: int) -> list[Conversation]:
+        found: list[Conversation] = []
+        for _ in self.fuzzy_steps(key, limit, found):
+            pass
+        return found
+
+    def fuzzy_steps(self, key: str, limit: int, found: list[Conversation]) -> Iterator[None]:
+        # Pierwsza litera zapytania zaczyna nazwę, reszta występuje w niej po kolei; im krótszy
+        # fragment nazwy obejmuje dopasowanie, tym wyżej, potem krótsze nazwy i alfabetycznie.
+        # Generator oddaje sterowanie po każdym kawałku tekstu, a wynik dopisuje do found na
+        # końcu. Wynik jest dokładny: segment jest pomijany dopiero wtedy, gdy jego dolne
+        # ograniczenie (pozycja ostatniej litery zapytania, długość nazwy) jest gorsze od
+        # ostatniego z limit najlepszych trafień
+        if len(key) < 2:
+            # Sama pierwsza litera to dopasowanie prefiksu
+            return
+        pair = (key[0], key[-1])
+        segments = self._segments.get(pair)
+        if not segments:
+            return
+        chunks = self._chunks[pair]
+        # Kwantyfikatory zaborcze: brak kolejnej litery w nazwie kończy próbę bez cofania się,
+        # a stały początek "\n" + litera pozwala silnikowi przeskakiwać do kolejnych nazw
+        letters = re.escape(key[0]) + "".join(f"[^{re.escape(c)}\n]*+{re.escape(c)}" for c in key[1:])
+        pattern = re.compile(f"\n({letters})([^\n]*)")
+        # (długość dopasowania, długość nazwy, nazwa) - limit najlepszych, rosnąco
+        best: list[tuple[int, int, str]] = []
+        for segment in segments:
+            if len(best) >= limit and segment > best[-1][:2]:
+                break
+            length = segment[1]
+            for chunk in chunks[segment]:
+                # (dopasowany początek nazwy, reszta nazwy) - trafienia budowane i szeregowane w C
+                hits = pattern.findall(chunk)
+                if hits:
+                    best = heapq.nsmallest(limit, itertools.chain(best, zip(
+                        map(len, map(operator.itemgetter(0), hits)), itertools.repeat(length), map("".join, hits)
+                    )))
+                yield
+        for *_, name in best:
+            found.extend(sorted(self._named[name]))
+
+
+class ConversationSearch:
+    # Wyniki jednego zapytania. Prefiksy i dalsze słowa są gotowe od razu, dopasowanie rozmyte
+    # liczy się porcjami w advance() - okno przełączania rozkłada je na kolejne przebiegi pętli
+    # zdarzeń, więc żaden znak nie czeka na przejście wszystkich nazw. Zmiana indeksu w trakcie
+    # zaczyna wyszukiwanie od nowa
+    def __init__(self, index: ConversationIndex, query: str, limit: int = RESULT_LIMIT):
+        self.index = index
+        self.query = query
+        self.limit = limit
+        self.found: dict[Conversation, None] = {}
+        self._fuzzy: list[Conversation] = []
+        self._steps: Optional[Iterator[None]] = None
+        self._version = -1
+        self._start()
+
+    @property
+    def done(self) -> bool:
+        return self._steps is None and self._version == self.index.version
+
+    def _start(self):
+        self._version = self.index.version
+        self._fuzzy = []
+        self._steps = None
+        key = normalize(self.query.strip())
+        if not key:
+            self.found = dict.fromkeys(self.index.names.search("", self.limit))
+            return
+
+        found = dict.fromkeys(self.index.names.search(key, self.limit))
+        if len(found) < self.limit:
+            for conversation in self.index.words.search(key, self.limit):
+                found.setdefault(conversation)
+                if len(found) >= self.limit:
+                    break
+        self.found = found
+        if len(found) < self.limit:
+            self._steps = self.index.fuzzy_steps(key, self.limit + len(found), self._fuzzy)
+
+    def advance(self, budget: Optional[float] = None) -> bool:
+        # Liczy dalej przez najwyżej budget sekund (bez limitu - do końca); True, gdy wyniki są kompletne
+        if self._version != self.index.version:
+            self._start()
+        if self._steps is None:
+            return True
+        deadline = None if budget is None else time.perf_counter() + budget
+        for _ in self._steps:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+        self._steps = None
+        return True
+
+    def results(self) -> list[Conversation]:
+        # Dopasowania rozmyte dochodzą dopiero komplet - ich kolejność zmienia się do końca liczenia
+        if self._steps is not None:
+            return list(self.found)
+        found = dict(self.found)
+        for conversation in self._fuzzy:
+            found.setdefault(conversation)
+            if len(found) >= self.limit:
+                break
+        return list(found)
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Optional
+
+from tools.log import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Tyle ostatnich zdarzeń zmian na użytkownika serwer pamięta do odtworzenia po przerwie;
+# klient, który został dalej w tyle, dostaje polecenie pełnej resynchronizacji
+CHANGE_LOG_LIMIT = 1000
+MAX_FRAME_SIZE = 1024 * 1024
+
+
+class DevError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class Session:
+    __slots__ = ("conn", "username", "send_lock")
+
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self.username: Optional[str] = None
+        self.send_lock = threading.Lock()
+
+    def send(self, frame: dict) -> bool:
+        data = (json.dumps(frame) + "\n").encode("utf-8")
+        with self.send_lock:
+            try:
+                self.conn.sendall(data)
+                return True
+            except OSError:
+                return False
+
+
+class DevServer:
+    # Serwer zastępczy w pamięci z tym samym protokołem co backend w C++ (żądania JSON
+    # potokowo, odpowiedzi w kolejności żądań, powiadomienia na połączenie, które ostatnio
+    # przedstawiło token bez "notifications": false). Dodatkowo obsługuje SUBSCRIBE_CHANGES i wersjonowane zdarzenia
+    # zmian list znajomych i grup, więc tryb subskrypcji klienta można testować bez backendu,
+    # oraz REMOVE_MEMBER_FROM_GROUP dla zbiorczego usuwania członków i stronicowanie
+    # GET_GROUP_MEMBERS (limit, offset)
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+        self.delay = delay
+        self._lock = threading.RLock()
+        self._users: dict[str, dict] = {}
+        self._tokens: dict[str, str] = {}
+        self._friends: dict[str, dict[str, None]] = {}
+        self._pending: dict[str, dict[str, None]] = {}
+        self._groups: dict[str, dict] = {}
+        self._messages: list[dict] = []
+        self._client_ids: dict[tuple[str, str], dict] = {}
+        self._sessions: dict[str, Session] = {}
+        self._offline: dict[str, list[dict]] = {}
+        self._versions: dict[str, int] = {}
+        self._changes: dict[str, deque] = {}
+        self._subscribed: set[str] = set()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(128)
+        self.host, self.port = self._sock.getsockname()[:2]
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self.serve_forever, name="dev-server", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.conn.close()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+
+    def serve_forever(self):
+        self._running = True
+        logger.info("Serwer zastępczy nasłuchuje na %s:%s", self.host, self.port)
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn: socket.socket):
+        session = Session(conn)
+        decoder = json.JSONDecoder()
+        buffer = ""
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                buffer += data.decode("utf-8", errors="replace")
+                if len(buffer) > MAX_FRAME_SIZE:
+                    break
+                while True:
+                    buffer = buffer.lstrip()
+                    if not buffer:
+                        break
+                    try:
+                        request, end = decoder.raw_decode(buffer)
+                    except ValueError:
+                        break
+                    buffer = buffer[end:]
+                    if self.delay:
+                        time.sleep(self.delay)
+                    if not session.send(self.handle(session, request)):
+                        return
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                if session.username and self._sessions.get(session.username) is session:
+                    del self._sessions[session.username]
+            conn.close()
+
+    def handle(self, session: Session, request: dict) -> dict:
+        method = request.get("method", "")
+        body = request.get("body")
+        handler = getattr(self, f"_do_{method.lower()}", None) if method else None
+        try:
+            if not method or not isinstance(body, dict):
+                raise DevError(400, "Bad request format")
+            if handler is None:
+                raise DevError(400, f"Unknown method: {method}")
+            with self._lock:
+                # Jak w backendzie: każde uwierzytelnione żądanie przenosi powiadomienia na swoje
+                # połączenie, chyba że klient zaznaczy "notifications": false
+                if method not in ("REGISTER", "AUTH"):
+                    self._authenticate(session, request.get("token", ""), request.get("notifications", True))
+                return handler(session, body)
+        except DevError as e:
+            response = {"code": e.code, "message": str(e)}
+            if e.code == 401 and method not in ("REGISTER", "AUTH"):
+                response["close"] = True
+            return response
+        except (KeyError, TypeError, ValueError) as e:
+            return {"code": 400, "message": f"Missing required field: {e}"}
+
+    def _authenticate(self, session: Session, token: str, notifications: bool = True):
+        username = self._tokens.get(token)
+        if username is None:
+            raise DevError(401, "Unauthorized")
+        if notifications:
+            self._attach(session, username)
+        else:
+            session.username = username
+
+    def _attach(self, session: Session, username: str):
+        self._sessions[username] = session
+        session.username = username
+        for notification in self._offline.pop(username, []):
+            session.send(notification)
+
+    def _notify(self, username: str, notification: dict):
+        session = self._sessions.get(username)
+        if session is None or not session.send(notification):
+            self._offline.setdefault(username, []).append(notification)
+
+    def _change(self, recipient: str, event_type: str, **fields):
+        version = self._versions.get(recipient, 0) + 1
+        self._versions[recipient] = version
+        event = dict(fields, type=event_type, version=version)
+        self._changes.setdefault(recipient, deque(maxlen=CHANGE_LOG_LIMIT)).append(event)
+        session = self._sessions.get(recipient)
+        if session is not None and recipient in self._subscribed:
+            session.send(event)
+
+    def _issue_token(self, session: Session, username: str) -> str:
+        token = uuid.uuid4().hex
+        self._tokens[token] = username
+        self._attach(session, username)
+        return token
+
+    def _user(self, username: str) -> dict:
+        user = self._users.get(username)
+        if user is None:
+            raise DevError(404, "User not found")
+        return user
+
+    def _group(self, group_id: str, username: str) -> dict:
+        group = self._groups.get(group_id)
+        if group is None:
+            raise DevError(404, "Group not found")
+        if username not in group["members"]:
+            raise DevError(403, "User is not a member of the group")
+        return group
+
+    def _group_json(self, group: dict) -> dict:
+        return {
+            "groupId": group["groupId"],
+            "name": group["name"],
+            "creatorId": self._users[group["creator"]]["uuid"],
+            "members": [self._users[member]["uuid"] for member in group["members"]],
+            "createdAt": group["createdAt"],
+            "updatedAt": group["updatedAt"],
+        }
+
+    def _do_register(self, session: Session, body: dict) -> dict:
+        username, password = body["username"], body["password"]
+        if username in self._users:
+            raise DevError(409, "User already exists")
+        self._users[username] = {"uuid": str(uuid.uuid4()), "password": password}
+        self._friends[username] = {}
+        self._pending[username] = {}
+        return {"code": 201, "message": "User registered successfully", "token": self._issue_token(session, username)}
+
+    def _do_auth(self, session: Session, body: dict) -> dict:
+        user = self._users.get(body["username"])
+        if user is None or user["password"] != body["password"]:
+            raise DevError(401, "Invalid credentials")
+        return {"code": 200, "message": "Authenticated", "token": self._issue_token(session, body["username"])}
+
+    def _do_subscribe_changes(self, session: Session, body: dict) -> dict:
+        # Bez "since" klient nie ma stanu i pobierze pełne listy; z "since" dostaje brakujące
+        # zdarzenia, o ile serwer jeszcze je pamięta
+        username = session.username
+        self._subscribed.add(username)
+        version = self._versions.get(username, 0)
+        response = {"code": 200, "version": version}
+        since = body.get("since")
+        if since is None:
+            response["resync"] = True
+            return response
+
+        log = self._changes.get(username, ())
+        oldest = log[0]["version"] if log else version + 1
+        if since > version or since < oldest - 1:
+            response["resync"] = True
+        else:
+            response["events"] = [event for event in log if event["version"] > since]
+        return response
+
+    def _do_send_friend_request(self, session: Session, body: dict) -> dict:
+        requester, addressee = session.username, body["addresseeUsername"]
+        self._user(addressee)
+        if addressee == requester:
+            raise DevError(400, "Cannot be friends with yourself")
+        if addressee in self._friends[requester]:
+            raise DevError(409, "Already friends")
+        if requester in self._pending[addressee] or addressee in self._pending[requester]:
+            raise DevError(409, "Friend request already sent")
+        self._pending[addressee][requester] = None
+        self._notify(addressee, {"type": "FRIEND_REQUEST", "from": requester, "message": "You have a new friend request"})
+        self._change(addressee, "FRIEND_REQUEST_ADDED", requester=requester)
+        return {"code": 200, "message": "Friend request sent successfully"}
+
+    def _do_accept_friend_request(self, session: Session, body: dict) -> dict:
+        addressee, requester = session.username, body["requester"]
+        if requester not in self._pending[addressee]:
+            raise DevError(404, "Friend request not found")
+        del self._pending[addressee][requester]
+        self._friends[addressee][requester] = None
+        self._friends[requester][addressee] = None
+        self._change(addressee, "FRIEND_REQUEST_REMOVED", requester=requester)
+        self._change(addressee, "FRIEND_ADDED", username=requester)
+        self._change(requester, "FRIEND_ADDED", username=addressee)
+        return {"code": 200, "message": "Friend request accepted"}
+
+    def _do_reject_friend_request(self, session: Session, body: dict) -> dict:
+        addressee, requester = session.username, body["requester"]
+        if requester not in self._pending[addressee]:
+            raise DevError(404, "Friend request not found")
+        del self._pending[addressee][requester]
+        self._change(addressee, "FRIEND_REQUEST_REMOVED", requester=requester)
+        return {"code": 200, "message": "Friend request rejected"}
+
+    def _do_get_friends(self, session: Session, body: dict) -> dict:
+        return {"code": 200, "friends": list(self._friends[session.username])}
+
+    def _do_get_pending_requests(self, session: Session, body: dict) -> dict:
+        username = session.username
+        return {"code": 200, "pendingRequests": [
+            {"requester": requester, "addressee": username, "status": "PENDING"} for requester in self._pending[username]
+        ]}
+
+    def _do_create_group(self, session: Session, body: dict) -> dict:
+        name = body["groupName"]
+        if not name:
+            raise DevError(400, "Missing required field: groupName")
+        now = int(time.time())
+        group_id = str(uuid.uuid4())
+        self._groups[group_id] = {
+            "groupId": group_id, "name": name, "creator": session.username,
+            "members": {session.username: None}, "createdAt": now, "updatedAt": now,
+        }
+        self._change(session.username, "GROUP_ADDED", groupId=group_id, name=name)
+        return {"code": 200, "message": "Group created successfully", "groupId": group_id}
+
+    def _do_add_member_to_group(self, session: Session, body: dict) -> dict:
+        group = self._group(body["groupId"], session.username)
+        username = body["username"]
+        self._user(username)
+        if username not in self._friends[session.username]:
+            raise DevError(403, "Cannot add non-friend to group")
+        if username in group["members"]:
+            raise DevError(409, "User already in group")
+        for member in group["members"]:
+            self._change(member, "MEMBER_JOINED", groupId=group["groupId"], username=username)
+        group["members"][username] = None
+        self._change(username, "GROUP_ADDED", groupId=group["groupId"], name=group["name"])
+        return {"code": 200, "message": "Member added to group successfully"}
+
+    def _do_remove_member_from_group(self, session: Session, body: dict) -> dict:
+        # Nie ma jeszcze w backendzie w C++ - usuwać może tylko twórca grupy
+        group = self._group(body["groupId"], session.username)
+        username = body["username"]
+        self._user(username)
+        if group["creator"] != session.username:
+            raise DevError(403, "Only the creator can remove members")
+        if username not in group["members"]:
+            raise DevError(404, "User not in group")
+        if username == session.username:
+            raise DevError(400, "Cannot remove yourself - use LEAVE_GROUP")
+        del group["members"][username]
+        self._change(username, "GROUP_REMOVED", groupId=group["groupId"])
+        for member in group["members"]:
+            self._change(member, "MEMBER_LEFT", groupId=group["groupId"], username=username)
+        return {"code": 200, "message": "Member removed from group successfully"}
+
+    def _do_update_group_name(self, session: Session, body: dict) -> dict:
+        group = self._group(body["groupId"], session.username)
+        group["name"] = body["newName"]
+        group["updatedAt"] = int(time.time())
+        for member in group["members"]:
+            self._change(member, "GROUP_RENAMED", groupId=group["groupId"], name=group["name"])
+        return {"code": 200, "message": "Group name updated successfully"}
+
+    def _do_leave_group(self, session: Session, body: dict) -> dict:
+        group = self._group(body["groupId"], session.username)
+        if len(group["members"]) == 1:
+            raise DevError(409, "Cannot leave group as last member")
+        del group["members"][session.username]
+        self._change(session.username, "GROUP_REMOVED", groupId=group["groupId"])
+        for member in group["members"]:
+            self._change(member, "MEMBER_LEFT", groupId=group["groupId"], username=session.username)
+        return {"code": 200, "message": "Left group successfully"}
+
+    def _do_delete_group(self, session: Session, body: dict) -> dict:
+        group = self._group(body["groupId"], session.username)
+        if group["creator"] != session.username:
+            raise DevError(403, "Only the creator can delete the group")
+        del self._groups[group["groupId"]]
+        for member in group["members"]:
+            self._change(member, "GROUP_REMOVED", groupId=group["groupId"])
+        return {"code": 200, "message": "Group deleted successfully"}
+
+    def _do_get_user_groups(self, session: Session, body: dict) -> dict:
+        groups = [group for group in self._groups.values() if session.username in group["members"]]
+        return {"code": 200, "groups": [self._group_json(group) for group in groups]}
+
+    def _do_get_group_details(self, session: Session, body: dict) -> dict:
+        return {"code": 200, "group": self._group_json(self._group(body["groupId"], session.username))}
+
+    def _do_get_group_members(self, session: Session, body: dict) -> dict:
+        group = self._group(body["groupId"], session.username)
+        members = list(group["members"])
+        if "limit" in body:
+            offset = body.get("offset", 0)
+            members = members[offset:offset + body["limit"]]
+        return {"code": 200, "members": [
+            {"uuid": self._users[member]["uuid"], "username": member} for member in members
+        ]}
+
+    def _send_message(self, session: Session, body: dict, message: dict, recipients) -> dict:
+        client_message_id = body.get("clientMessageId", "")
+        if client_message_id:
+            sent = self._client_ids.get((session.username, client_message_id))
+            if sent is not None:
+                return dict(sent, code=200, message="Message already sent")
+
+        message.update(
+            messageId=str(uuid.uuid4()), senderId=self._users[session.username]["uuid"],
+            senderName=session.username, content=body["content"], sentAt=int(time.time())
+        )
+        self._messages.append(message)
+        sent = {"messageId": message["messageId"], "sentAt": message["sentAt"]}
+        if client_message_id:
+            self._client_ids[(session.username, client_message_id)] = sent
+
+        notification_type = "NEW_GROUP_MESSAGE" if message["type"] == "GROUP" else "NEW_PRIVATE_MESSAGE"
+        notification = {key: value for key, value in message.items() if key not in ("type", "receiver")}
+        for recipient in recipients:
+            if recipient != session.username:
+                self._notify(recipient, dict(notification, type=notification_type))
+        return dict(sent, code=200, message="Message sent successfully")
+
+    def _do_send_private_message(self, session: Session, body: dict) -> dict:
+        receiver = body["receiverUsername"]
+        self._user(receiver)
+        if receiver not in self._friends[session.username]:
+            raise DevError(403, "Users are not friends")
+        message = {"type": "PRIVATE", "receiver": receiver, "receiverId": self._users[receiver]["uuid"]}
+        return self._send_message(session, body, message, [receiver])
+
+    def _do_send_group_message(self, session: Session, body: dict) -> dict:
+        group = self._group(body["groupId"], session.username)
+        message = {"type": "GROUP", "groupId": group["groupId"], "receiverId": group["groupId"]}
+        return self._send_message(session, body, message, list(group["members"]))
+
+    def _page(self, messages: list[dict], body: dict) -> dict:
+        since = body.get("since", 0)
+        limit = body.get("limit", 100)
+        offset = body.get("offset", 0)
+        selected = sorted((m for m in messages if m["sentAt"] >= since), key=lambda m: m["sentAt"], reverse=True)
+        page = [{key: value for key, value in m.items() if key != "receiver"} for m in selected[offset:offset + limit]]
+        return {"code": 200, "messages": page}
+
+    def _do_get_private_messages(self, session: Session, body: dict) -> dict:
+        other = body["otherUsername"]
+        self._user(other)
+        pair = {session.username, other}
+        return self._page([
+            m for m in self._messages if m["type"] == "PRIVATE" and {m["senderName"], m["receiver"]} == pair
+        ], body)
+
+    def _do_get_group_messages(self, session: Session, body: dict) -> dict:
+        group = self._group(body["groupId"], session.username)
+        return self._page([m for m in self._messages if m.get("groupId") == group["groupId"]], body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reComm :: serwer zastępczy w pamięci")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay", type=float, default=0.0, help="Opóźnienie każdej odpowiedzi w sekundach")
+    args = parser.parse_args()
+
+    log_listener = setup_logging(level=logging.INFO, log_file=os.environ.get("RECOMM_LOG_FILE"))
+    server = DevServer(args.host, args.port, args.delay)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    finally:
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import errno
+import logging
+import os
+import selectors
+import socket
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+AddressInfo = tuple[int, int, int, str, tuple]
+
+
+class ResolverCache:
+    # getaddrinfo() blokuje i przy każdym ponownym połączeniu pytałby DNS od nowa.
+    # Wyniki są trzymane przez ttl sekund; gdy odświeżenie się nie uda, używany jest
+    # ostatni znany wynik (stale_ttl), żeby chwilowa awaria DNS nie blokowała połączenia
+    def __init__(self, ttl: float = 60.0, stale_ttl: float = 3600.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: dict[tuple[str, int], tuple[float, list[AddressInfo]]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int, metrics=None) -> list[AddressInfo]:
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached is not None and now - cached[0] < self.ttl:
+            if metrics:
+                metrics.incr("tcp.dns.cache_hits")
+            return list(cached[1])
+
+        started_at = time.monotonic()
+        try:
+            addresses = interleave(socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        except socket.gaierror as e:
+            if cached is not None and now - cached[0] < self.stale_ttl:
+                logger.warning("Nie udało się odświeżyć adresu %s (%s) - używam zapamiętanego", host, e)
+                if metrics:
+                    metrics.incr("tcp.dns.stale")
+                return list(cached[1])
+            raise
+
+        if metrics:
+            metrics.incr("tcp.dns.cache_misses")
+            metrics.observe("tcp.dns.duration", time.monotonic() - started_at)
+        self.put(host, port, addresses)
+        return list(addresses)
+
+    def put(self, host: str, port: int, addresses: list[AddressInfo]):
+        with self._lock:
+            self._entries[(host, port)] = (time.monotonic(), list(addresses))
+
+    def prefer(self, host: str, port: int, address: AddressInfo):
+        # Adres, z którym ostatnio się połączono, jest próbowany jako pierwszy
+        with self._lock:
+            cached = self._entries.get((host, port))
+            if cached is None or address not in cached[1]:
+                return
+            addresses = [address] + [a for a in cached[1] if a != address]
+            self._entries[(host, port)] = (cached[0], addresses)
+
+    def expire(self, host: str, port: int):
+        # Następne resolve() odpyta DNS, ale wpis zostaje jako zapas na wypadek jego awarii
+        with self._lock:
+            cached = self._entries.get((host, port))
+            if cached is not None:
+                self._entries[(host, port)] = (min(cached[0], time.monotonic() - self.ttl), cached[1])
+
+
+def interleave(addresses: list[AddressInfo]) -> list[AddressInfo]:
+    # Na przemian rodziny adresów (RFC 8305), zaczynając od tej, którą zwrócił resolver
+    by_family: dict[int, list[AddressInfo]] = {}
+    for address in addresses:
+        if address not in by_family.setdefault(address[0], []):
+            by_family[address[0]].append(address)
+    groups = list(by_family.values())
+    result = []
+    for i in range(max((len(group) for group in groups), default=0)):
+        for group in groups:
+            if i < len(group):
+                result.append(group[i])
+    return result
+
+
+def dial(
+    addresses: list[AddressInfo],
+    timeout: float,
+    stagger: float = 0.25,
+    cancel: Optional[threading.Event] = None
+) -> tuple[socket.socket, AddressInfo, int]:
+    # Happy eyeballs: kolejny adres dostaje własną próbę po `stagger` sekundach (albo od razu,
+    # gdy poprzednia się nie powiedzie), a wygrywa pierwsze zestawione połączenie.
+    # Wszystko w jednym wątku na gniazdach nieblokujących - przegrane gniazda są zamykane
+    if not addresses:
+        raise OSError(errno.EADDRNOTAVAIL, "Brak adresów do połączenia")
+
+    deadline = time.monotonic() + timeout
+    selector = selectors.DefaultSelector()
+    pending: dict[socket.socket, AddressInfo] = {}
+    next_index = 0
+    next_start = time.monotonic()
+    last_error: Optional[OSError] = None
+    winner: Optional[tuple[socket.socket, AddressInfo]] = None
+
+    def start(address: AddressInfo) -> Optional[socket.socket]:
+        nonlocal last_error
+        family, type_, proto, _, sockaddr = address
+        # Błąd samego adresu (np. EAFNOSUPPORT dla AAAA przy wyłączonym IPv6) przechodzi
+        # do kolejnego adresu, zamiast przerywać całą próbę
+        try:
+            sock = socket.socket(family, type_, proto)
+        except OSError as e:
+            last_error = e
+            return None
+        try:
+            sock.setblocking(False)
+            code = sock.connect_ex(sockaddr)
+        except OSError as e:
+            last_error = e
+            sock.close()
+            return None
+        if code == 0:
+            return sock
+        if code in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+            pending[sock] = address
+            selector.register(sock, selectors.EVENT_WRITE)
+        else:
+            last_error = OSError(code, f"{os.strerror(code)} ({sockaddr[0]})")
+            sock.close()
+        return None
+
+    try:
+        while winner is None:
+            now = time.monotonic()
+            if now >= deadline:
+                raise socket.timeout("Przekroczono czas łączenia")
+            if cancel is not None and cancel.is_set():
+                raise OSError(errno.ECANCELED, "Łączenie przerwane")
+
+            if next_index < len(addresses) and (now >= next_start or not pending):
+                address = addresses[next_index]
+                next_index += 1
+                next_start = now + stagger
+                sock = start(address)
+                if sock is not None:
+                    winner = (sock, address)
+                continue
+
+            if not pending:
+                raise last_error or OSError(errno.ECONNREFUSED, "Żaden adres nie przyjął połączenia")
+
+            wait_until = deadline if next_index >= len(addresses) else min(deadline, next_start)
+            # Krótkie odcinki oczekiwania, żeby disconnect() nie czekał na pełny timeout
+            for key, _ in selector.select(min(max(0.0, wait_until - now), 0.1)):
+                sock = key.fileobj
+                address = pending.pop(sock)
+                selector.unregister(sock)
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0:
+                    winner = (sock, address)
+                    break
+                last_error = OSError(code, f"{os.strerror(code)} ({address[4][0]})")
+                sock.close()
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
+
+    sock, address = winner
+    sock.setblocking(True)
+    return sock, address, next_index
+
+
+default_resolver = ResolverCache()
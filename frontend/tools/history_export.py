@@ -0,0 +1,270 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Iterable, Iterator, Optional, Union
+from urllib.parse import quote
+
+from tools.api_service import ApiService, PendingRequest, SendQueueFull
+from tools.bot import HISTORY_PAGE, HISTORY_SINCE
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "checkpoint.json"
+# Co tyle stron rozmowy zapisywany jest punkt wznowienia (przy kompresji - nowy człon gzip)
+CHECKPOINT_PAGES = 10
+PARALLEL_CONVERSATIONS = 4
+
+
+class ExportError(Exception):
+    pass
+
+
+class ConversationExport:
+    # Stan eksportu jednej rozmowy. Serwer zwraca strony od najnowszych (limit/offset),
+    # więc nowa wiadomość w trakcie eksportu przesuwa offsety - już zapisane wiadomości
+    # wracają wtedy na kolejnej stronie. Zapisywane są tylko starsze niż najstarsza
+    # dotąd zapisana (oldest), a z tej samej sekundy - tylko o nieznanych identyfikatorach.
+    # Pamiętanych jest najwyżej strona ostatnich identyfikatorów z tej sekundy: przy większej
+    # liczbie wiadomości w jednej sekundzie eksport może powtórzyć wiadomość, ale jej nie zgubi
+    __slots__ = (
+        "kind", "target", "file", "offset", "position", "oldest", "oldest_ids", "written", "done",
+        "max_ids", "error", "stream", "writer", "pages"
+    )
+
+    def __init__(self, kind: str, target: str, file: str, state: Optional[dict] = None, max_ids: int = HISTORY_PAGE):
+        state = state or {}
+        self.kind = kind
+        self.target = target
+        self.file = file
+        self.offset: int = state.get("offset", 0)
+        self.position: int = state.get("position", 0)
+        self.oldest: Optional[int] = state.get("oldest")
+        self.oldest_ids: dict[str, None] = dict.fromkeys(state.get("oldestIds", []))
+        self.max_ids = max_ids
+        self.written: int = state.get("written", 0)
+        self.done: bool = state.get("done", False)
+        self.error: Optional[str] = None
+        self.stream = None
+        self.writer = None
+        self.pages = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.kind}:{self.target}"
+
+    def state(self) -> dict:
+        return {
+            "file": self.file,
+            "offset": self.offset,
+            "position": self.position,
+            "oldest": self.oldest,
+            "oldestIds": list(self.oldest_ids),
+            "written": self.written,
+            "done": self.done,
+        }
+
+    def result(self) -> dict:
+        return {
+            "kind": self.kind,
+            "target": self.target,
+            "file": self.file,
+            "messages": self.written,
+            "done": self.done,
+            "error": self.error,
+        }
+
+    def is_new(self, message: dict) -> bool:
+        sent_at = message.get("sentAt", 0)
+        message_id = message.get("messageId")
+        if self.oldest is None or sent_at < self.oldest:
+            self.oldest = sent_at
+            self.oldest_ids = {message_id: None}
+            return True
+        if sent_at == self.oldest and message_id not in self.oldest_ids:
+            self.oldest_ids[message_id] = None
+            if len(self.oldest_ids) > self.max_ids:
+                del self.oldest_ids[next(iter(self.oldest_ids))]
+            return True
+        return False
+
+
+class HistoryExporter:
+    # Eksport pełnych historii rozmów do plików JSONL (po jednym na rozmowę, wiadomości od
+    # najnowszych) ze stałym zużyciem pamięci: strona jest zapisywana zaraz po odebraniu.
+    # Kilka rozmów idzie naraz - po jednym żądaniu strony na rozmowę, potokowo na tym samym
+    # połączeniu. Punkt wznowienia w checkpoint.json pozwala dokończyć przerwany eksport
+    def __init__(
+        self,
+        api_service: ApiService,
+        directory: str,
+        since: int = HISTORY_SINCE,
+        page_size: int = HISTORY_PAGE,
+        parallel: int = PARALLEL_CONVERSATIONS,
+        compress: bool = False,
+        checkpoint_pages: int = CHECKPOINT_PAGES
+    ):
+        self.api_service = api_service
+        self.directory = directory
+        self.since = since
+        self.page_size = page_size
+        self.parallel = max(1, parallel)
+        self.compress = compress
+        self.checkpoint_pages = checkpoint_pages
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_FILE)
+        os.makedirs(directory, exist_ok=True)
+        self._states = self._load_checkpoint()
+
+    def _load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if checkpoint.get("since") != self.since or checkpoint.get("compress") != self.compress:
+            raise ExportError(
+                f"Katalog {self.directory} zawiera eksport z innymi ustawieniami "
+                f"(since={checkpoint.get('since')}, compress={checkpoint.get('compress')})"
+            )
+        return checkpoint.get("conversations", {})
+
+    def _save_checkpoint(self):
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"since": self.since, "compress": self.compress, "conversations": self._states}, f)
+        os.replace(temporary, self.checkpoint_path)
+
+    def file_name(self, kind: str, target: str) -> str:
+        return f"{kind}_{quote(target, safe='')}.jsonl" + (".gz" if self.compress else "")
+
+    def export(
+        self,
+        conversations: Iterable[tuple[str, str]],
+        stopping: Optional[threading.Event] = None
+    ) -> Iterator[dict]:
+        # Wynik dla każdej rozmowy po jej zakończeniu: {"kind", "target", "file", "messages",
+        # "done", "error"}; rozmowa z błędem albo przerwana przez stopping zachowuje punkt wznowienia
+        waiting = iter(conversations)
+        in_flight: deque = deque()
+        active: list[ConversationExport] = []
+        try:
+            while stopping is None or not stopping.is_set():
+                while len(active) < self.parallel:
+                    conversation = self._next(waiting)
+                    if conversation is None:
+                        break
+                    if conversation.done:
+                        yield conversation.result()
+                        continue
+                    self._open(conversation)
+                    active.append(conversation)
+                    in_flight.append((conversation, conversation.offset, self._submit(conversation, conversation.offset)))
+                if not in_flight:
+                    return
+
+                conversation, offset, pending = in_flight.popleft()
+                response = self._response(pending)
+                if response.get("code") != 200:
+                    conversation.error = response.get("message") or f"kod {response.get('code')}"
+                    logger.warning("Eksport rozmowy %s przerwany: %s", conversation.key, conversation.error)
+                else:
+                    self._write_page(conversation, offset, response.get("messages", []))
+                if conversation.done or conversation.error is not None:
+                    active.remove(conversation)
+                    self._close(conversation)
+                    yield conversation.result()
+                else:
+                    in_flight.append((conversation, conversation.offset, self._submit(conversation, conversation.offset)))
+        finally:
+            for conversation in active:
+                self._close(conversation)
+
+    def _next(self, waiting: Iterator[tuple[str, str]]) -> Optional[ConversationExport]:
+        for kind, target in waiting:
+            return ConversationExport(
+                kind, target, self.file_name(kind, target), self._states.get(f"{kind}:{target}"), self.page_size
+            )
+        return None
+
+    def _submit(self, conversation: ConversationExport, offset: int) -> Union[PendingRequest, Exception]:
+        body = {"since": self.since, "limit": self.page_size, "offset": offset}
+        try:
+            if conversation.kind == "group":
+                return self.api_service.submit("GET_GROUP_MESSAGES", dict(body, groupId=conversation.target))
+            return self.api_service.submit("GET_PRIVATE_MESSAGES", dict(body, otherUsername=conversation.target))
+        except (ConnectionError, SendQueueFull) as e:
+            return e
+
+    def _response(self, pending: Union[PendingRequest, Exception]) -> dict:
+        if isinstance(pending, Exception):
+            return {"code": None, "message": str(pending)}
+        try:
+            return self.api_service.wait(pending)
+        except (ConnectionError, TimeoutError, SendQueueFull) as e:
+            return {"code": None, "message": str(e)}
+
+    def _write_page(self, conversation: ConversationExport, offset: int, messages: list[dict]):
+        lines = [
+            json.dumps(message, ensure_ascii=False) + "\n" for message in messages if conversation.is_new(message)
+        ]
+        if lines:
+            conversation.writer.write("".join(lines).encode("utf-8"))
+            conversation.written += len(lines)
+        conversation.pages += 1
+        if len(messages) < self.page_size:
+            conversation.done = True
+            return
+        # Sortowanie po sentAt na serwerze nie jest stabilne - wiadomości z tej samej sekundy
+        # mogą zamienić się miejscami między stronami. Kolejna strona zaczyna się więc od
+        # początku tej sekundy, a już zapisane wiadomości odrzuca is_new
+        overlap = min(len(conversation.oldest_ids), self.page_size // 2)
+        conversation.offset = offset + len(messages) - overlap
+        if conversation.pages % self.checkpoint_pages == 0:
+            self._checkpoint(conversation)
+
+    def _open(self, conversation: ConversationExport):
+        # Dane za ostatnim punktem wznowienia (przerwany zapis) są obcinane
+        path = os.path.join(self.directory, conversation.file)
+        stream = open(path, "r+b" if os.path.exists(path) else "w+b")
+        size = stream.seek(0, os.SEEK_END)
+        if size < conversation.position:
+            stream.close()
+            raise ExportError(f"Plik {path} jest krótszy niż zapisany punkt wznowienia")
+        stream.truncate(conversation.position)
+        stream.seek(conversation.position)
+        conversation.stream = stream
+        conversation.writer = self._writer(stream)
+        if conversation.offset or conversation.written:
+            logger.info("Wznawianie eksportu %s od offsetu %d", conversation.key, conversation.offset)
+
+    def _writer(self, stream):
+        # Każdy człon gzip kończy się przy punkcie wznowienia, więc obcięty plik pozostaje
+        # poprawnym (wieloczłonowym) archiwum
+        return gzip.GzipFile(fileobj=stream, mode="wb", mtime=0) if self.compress else stream
+
+    def _checkpoint(self, conversation: ConversationExport, closing: bool = False):
+        started_at = time.monotonic()
+        if self.compress:
+            conversation.writer.close()
+        conversation.stream.flush()
+        os.fsync(conversation.stream.fileno())
+        conversation.position = conversation.stream.tell()
+        self._states[conversation.key] = conversation.state()
+        self._save_checkpoint()
+        if self.compress and not closing:
+            conversation.writer = self._writer(conversation.stream)
+        logger.debug(
+            "Punkt wznowienia %s: %d wiadomości (%.1f ms)",
+            conversation.key, conversation.written, (time.monotonic() - started_at) * 1000
+        )
+
+    def _close(self, conversation: ConversationExport):
+        self._checkpoint(conversation, closing=True)
+        conversation.stream.close()
+        conversation.stream = None
+        conversation.writer = None
+        logger.info("Eksport %s: %d wiadomości, %s", conversation.key, conversation.written,
+                    "zakończony" if conversation.done else "przerwany")
@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue, Full
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(threadName)s - %(name)s - %(message)s'
+
+
+class RateLimitFilter(logging.Filter):
+    # Limit per miejsce wywołania (plik + linia): kubełek tokenów dla rekordów poniżej ERROR,
+    # a wywołania z extra={"sample": N} przepuszczają tylko co N-ty rekord
+    def __init__(self, rate: float = 5.0, burst: int = 20):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._sites: dict[tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [float(self.burst), now, 0, 0]
+            tokens, last, suppressed, seen = site
+            site[3] = seen + 1
+
+            sample = getattr(record, "sample", 0)
+            if sample > 1 and seen % sample:
+                site[2] = suppressed + 1
+                return False
+
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            site[1] = now
+            if tokens < 1.0:
+                site[0] = tokens
+                site[2] = suppressed + 1
+                return False
+
+            site[0] = tokens - 1.0
+            site[2] = 0
+
+        # Osobny atrybut zamiast dopisywania do msg - inne filtry i handlery widzą rekord bez
+        # zmian, a %-formatowanie z args działa jak dotąd; licznik dopisuje LogFormatter
+        record.suppressed = suppressed
+        return True
+
+
+class LogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" [pominięto {suppressed} podobnych]"
+        return text
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, queue: Queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatowanie odbywa się dopiero w wątku zapisującym
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    log_file: Optional[str] = None,
+    rate: float = 5.0,
+    burst: int = 20,
+    queue_size: int = 10000
+) -> QueueListener:
+    formatter = LogFormatter(LOG_FORMAT)
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: Queue = Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate, burst))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
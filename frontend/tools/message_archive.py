@@ -0,0 +1,387 @@
+import functools
+import itertools
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Archiwum jest pamięcią podręczną - przy zmianie schematu jest zakładane od nowa
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    message_id TEXT,
+    author TEXT NOT NULL,
+    content TEXT NOT NULL,
+    sent_at INTEGER,
+    sort_at INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    UNIQUE (kind, target, message_id)
+);
+CREATE INDEX IF NOT EXISTS messages_order ON messages (kind, target, sort_at, seq);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, target, author, content='messages', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6 7 8'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, target, author) VALUES (new.id, new.content, new.target, new.author);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content, target, author)
+    VALUES ('delete', old.id, old.content, old.target, old.author);
+END;
+"""
+
+# Najdłuższy indeksowany prefiks - dłuższe słowa są dopasowywane po tylu pierwszych znakach.
+# Zapytanie o prefiks bez indeksu przegląda wszystkie pasujące wpisy zamiast skończyć po limicie
+MAX_PREFIX = 8
+
+# Wiadomości bez sentAt (jeszcze niepotwierdzone) sortują się za wszystkimi potwierdzonymi
+UNSENT_ORDER = 1 << 62
+
+# Tyle słów wokół pierwszego trafienia pokazuje fragment w wynikach
+SNIPPET_WORDS = 10
+
+# Zapis z powiadomień i historii jest grupowany - jedna transakcja na paczkę wiadomości
+RECORD_BATCH = 256
+RECORD_INTERVAL = 1.0
+
+# Zatrzymuje wątek zapisu po dopisaniu wszystkiego, co było przed nim w kolejce
+CLOSE = object()
+
+# (message_id, author, content, sent_at, sort_at, seq)
+ArchivedRow = tuple[Optional[str], str, str, Optional[int], int, int]
+
+
+class SearchHit:
+    __slots__ = ("kind", "target", "message_id", "author", "content", "sent_at", "order", "words")
+
+    def __init__(
+        self,
+        kind: str,
+        target: str,
+        message_id: Optional[str],
+        author: str,
+        content: str,
+        sent_at: Optional[int],
+        order: tuple[int, int],
+        words: tuple[str, ...]
+    ):
+        self.kind = kind
+        self.target = target
+        self.message_id = message_id
+        self.author = author
+        self.content = content
+        self.sent_at = sent_at
+        self.order = order
+        self.words = words
+
+    @property
+    def snippet(self) -> str:
+        # Liczony dopiero przy wyświetlaniu - wyników bywa więcej, niż widać na liście
+        return snippet(self.content, self.words)
+
+
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+def query_words(text: str) -> list[str]:
+    # Słowa tak, jak dopasowuje je FTS5: pojedyncze znaki dokładnie (nie mają indeksu
+    # prefiksów), dłuższe jako prefiks skrócony do MAX_PREFIX
+    return [word if len(word) == 1 else word[:MAX_PREFIX] for word in WORD_PATTERN.findall(text)]
+
+
+def fts_query(text: str) -> str:
+    # Każde słowo w cudzysłowie - składnia FTS5 z tekstu użytkownika nie przejdzie,
+    # a wyszukiwanie działa już od pierwszych liter
+    return " AND ".join(f'"{word}"' if len(word) == 1 else f'"{word}"*' for word in query_words(text))
+
+
+@functools.lru_cache(maxsize=65536)
+def fold(word: str) -> str:
+    # Przybliżenie tokenizera unicode61 z remove_diacritics - tylko do zaznaczania trafień
+    return "".join(c for c in unicodedata.normalize("NFKD", word.lower()) if not unicodedata.combining(c))
+
+
+def is_hit(token: str, words: tuple[str, ...]) -> bool:
+    token = fold(token)
+    for word in words:
+        if token == word if len(word) == 1 else token.startswith(word):
+            return True
+    return False
+
+
+def snippet(content: str, words: tuple[str, ...]) -> str:
+    # Fragment wokół pierwszego trafienia z zaznaczonymi słowami (words - wynik fold()).
+    # Funkcja snippet() z FTS5 czyta treść jeszcze raz i kilkukrotnie wydłuża zapytanie,
+    # więc fragment powstaje tutaj
+    matches = [(match.start(), match.end(), is_hit(match.group(), words)) for match in WORD_PATTERN.finditer(content)]
+    first = next((i for i, (_, _, hit) in enumerate(matches) if hit), 0)
+    start = max(0, min(first - SNIPPET_WORDS // 2, len(matches) - SNIPPET_WORDS))
+    window = matches[start:start + SNIPPET_WORDS]
+    if not window:
+        return content
+    parts = ["…" if start > 0 else ""]
+    position = window[0][0] if start > 0 else 0
+    for begin, end, hit in window:
+        parts.append(content[position:begin])
+        parts.append(f"[{content[begin:end]}]" if hit else content[begin:end])
+        position = end
+    end_of_window = start + len(window) >= len(matches)
+    parts.append(content[position:] if end_of_window else "…")
+    return "".join(parts)
+
+
+def fts_phrase(column: str, value: str) -> str:
+    return f'{column} : "{value.replace(chr(34), chr(34) * 2)}"'
+
+
+class MessageArchive:
+    # Lokalna kopia wiadomości (SQLite) z indeksem pełnotekstowym FTS5. Trafia tu każda
+    # wiadomość z historii i powiadomień (record) oraz wiadomości wypchnięte z pamięci okna
+    # czatu (put). Kolejność w rozmowie to (sort_at, seq) - ta sama, której używa
+    # ConversationStore, więc strona wczytana z archiwum trafia przed albo za wiadomości,
+    # które są w pamięci.
+    # Zapisy wykonuje osobny wątek z własnym połączeniem - record() i put() tylko wstawiają
+    # wiersze do kolejki, więc wątek odbierający z sieci nie czeka na dysk. Odczyty idą
+    # drugim połączeniem (WAL pozwala czytać w trakcie zapisu) i czekają tylko na wiersze
+    # z put(), które okno czatu może od razu chcieć wczytać z powrotem
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.Queue = queue.Queue()
+        # Numer kolejnego zapisu nadawany razem z wstawieniem do kolejki - kolejność numerów
+        # jest kolejnością zapisu
+        self._queue_lock = threading.Lock()
+        self._queued = 0
+        # Ostatni zapis wymagany przez odczyty (z put) i ostatni zatwierdzony
+        self._required = 0
+        self._committed = 0
+        self._stopped = False
+        self._written = threading.Condition()
+        self._read_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Utrata ostatnich zapisów przy awarii systemu oznacza tylko ponowne pobranie historii
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._db.executescript(
+                "DROP TABLE IF EXISTS messages_fts; DROP TABLE IF EXISTS messages; "
+                f"PRAGMA user_version = {SCHEMA_VERSION};"
+            )
+        self._db.executescript(SCHEMA)
+        row = self._db.execute("SELECT MAX(seq) FROM messages").fetchone()
+        self._seq = itertools.count(row[0] + 1 if row[0] is not None else 0)
+
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.execute("PRAGMA query_only = ON")
+        self._writer = threading.Thread(target=self._write_loop, name="message-archive", daemon=True)
+        self._writer.start()
+
+    def next_seq(self) -> int:
+        # Jeden licznik dla całego archiwum - wiadomości z tej samej sekundy zachowują
+        # kolejność niezależnie od tego, czy zapisało je okno czatu, czy record()
+        return next(self._seq)
+
+    def count(self, kind: str, target: str) -> int:
+        self.flush()
+        return self._read(
+            "SELECT COUNT(*) FROM messages WHERE kind = ? AND target = ?", (kind, target)
+        )[0][0]
+
+    def record(self, kind: str, target: str, messages: Iterable[dict]):
+        # Wiadomości z serwera (historia, powiadomienia) - wątek zapisu zbiera je w paczki
+        # po RECORD_BATCH albo RECORD_INTERVAL; wyszukiwanie widzi je po zatwierdzeniu paczki
+        rows = []
+        for message in messages:
+            content = message.get("content", message.get("message"))
+            if content is None:
+                continue
+            sent_at = message.get("sentAt")
+            rows.append((
+                kind, target, message.get("messageId"),
+                message.get("senderName", message.get("sender", "")), content, sent_at,
+                UNSENT_ORDER if sent_at is None else sent_at, self.next_seq()
+            ))
+        if rows:
+            self._enqueue(rows, False)
+
+    def put(self, kind: str, target: str, rows: Iterable[ArchivedRow]):
+        # Zatwierdzane od razu razem z oczekującymi paczkami; kolejne odczyty je widzą
+        ticket = self._enqueue([(kind, target) + tuple(row) for row in rows], True)
+        with self._written:
+            self._required = max(self._required, ticket)
+
+    def flush(self):
+        # Czeka, aż wszystko, co trafiło do kolejki wcześniej, będzie zapisane
+        self._wait(self._enqueue([], True))
+
+    def _enqueue(self, rows: list[tuple], urgent: bool) -> int:
+        with self._queue_lock:
+            self._queued += 1
+            self._queue.put((self._queued, rows, urgent))
+            return self._queued
+
+    def _wait(self, ticket: int):
+        with self._written:
+            self._written.wait_for(lambda: self._committed >= ticket or self._stopped)
+
+    def _write_loop(self):
+        try:
+            self._write()
+        finally:
+            # Odczyty nie czekają na zapis, którego już nie będzie
+            with self._written:
+                self._stopped = True
+                self._written.notify_all()
+
+    def _write(self):
+        pending: list[tuple] = []
+        last = 0
+        deadline: Optional[float] = None
+        while True:
+            try:
+                item = self._queue.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            urgent = item is CLOSE
+            # To, co czeka w kolejce, trafia do tej samej transakcji - do RECORD_BATCH wierszy
+            while item is not None and item is not CLOSE:
+                last, rows, urgent_item = item
+                pending.extend(rows)
+                urgent = urgent or urgent_item
+                if deadline is None:
+                    deadline = time.monotonic() + RECORD_INTERVAL
+                if len(pending) >= RECORD_BATCH:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+                if item is CLOSE:
+                    urgent = True
+
+            if urgent or len(pending) >= RECORD_BATCH or (deadline is not None and time.monotonic() >= deadline):
+                if pending:
+                    self._insert(pending)
+                pending = []
+                deadline = None
+                with self._written:
+                    self._committed = last
+                    self._written.notify_all()
+            if item is CLOSE:
+                return
+
+    def _insert(self, rows: list[tuple]):
+        try:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO messages (kind, target, message_id, author, content, sent_at, sort_at, seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logger.warning("Nie udało się zapisać %d wiadomości w archiwum: %s", len(rows), e)
+
+    def _read(self, sql: str, params) -> list[tuple]:
+        # Wiersze z put() muszą być zapisane; paczki z record() nie wstrzymują odczytu
+        with self._written:
+            required = self._required
+        self._wait(required)
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def before(self, kind: str, target: str, order: tuple[int, int], limit: int) -> list[ArchivedRow]:
+        # Najnowsze wiadomości starsze niż order, w kolejności rosnącej
+        rows = self._read(
+            "SELECT message_id, author, content, sent_at, sort_at, seq FROM messages "
+            "WHERE kind = ? AND target = ? AND (sort_at, seq) < (?, ?) "
+            "ORDER BY sort_at DESC, seq DESC LIMIT ?",
+            (kind, target, order[0], order[1], limit)
+        )
+        rows.reverse()
+        return rows
+
+    def after(self, kind: str, target: str, order: tuple[int, int], limit: int) -> list[ArchivedRow]:
+        return self._read(
+            "SELECT message_id, author, content, sent_at, sort_at, seq FROM messages "
+            "WHERE kind = ? AND target = ? AND (sort_at, seq) > (?, ?) "
+            "ORDER BY sort_at, seq LIMIT ?",
+            (kind, target, order[0], order[1], limit)
+        )
+
+    def search(
+        self,
+        text: str,
+        conversation: Optional[tuple[str, str]] = None,
+        author: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: int = 50
+    ) -> list[SearchHit]:
+        # Wyniki od najnowszych. id rośnie z kolejnością zapisu, więc FTS5 podaje trafienia
+        # malejąco po rowid prosto z indeksu i kończy po limit - bez sortowania wszystkich
+        query = fts_query(text)
+        if not query:
+            return []
+        # Rozmowa i autor są też kolumnami indeksu - FTS5 przecina listy trafień, zamiast
+        # odrzucać je po kolei; dokładne porównanie w SQL usuwa dopasowania częściowe
+        match = [f"content : ({query})"]
+        if conversation is not None:
+            match.append(fts_phrase("target", conversation[1]))
+        if author:
+            match.append(fts_phrase("author", author))
+        sql = [
+            "SELECT m.kind, m.target, m.message_id, m.author, m.content, m.sent_at, m.sort_at, m.seq "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ?"
+        ]
+        params: list = [" AND ".join(match)]
+        if conversation is not None:
+            sql.append("AND m.kind = ? AND m.target = ?")
+            params.extend(conversation)
+        if author:
+            sql.append("AND m.author = ?")
+            params.append(author)
+        if since is not None:
+            sql.append("AND m.sent_at >= ?")
+            params.append(since)
+        if until is not None:
+            sql.append("AND m.sent_at < ?")
+            params.append(until)
+        sql.append("ORDER BY messages_fts.rowid DESC LIMIT ?")
+        params.append(limit)
+
+        try:
+            rows = self._read(" ".join(sql), params)
+        except sqlite3.Error as e:
+            logger.warning("Wyszukiwanie nieudane: %s", e)
+            return []
+        words = tuple(fold(word) for word in query_words(text))
+        return [
+            SearchHit(kind, target, message_id, author, content, sent_at, (sort_at, seq), words)
+            for kind, target, message_id, author, content, sent_at, sort_at, seq in rows
+        ]
+
+    def close(self):
+        self._queue.put(CLOSE)
+        self._writer.join()
+        try:
+            with self._read_lock:
+                self._reader.close()
+            self._db.close()
+        except sqlite3.Error as e:
+            logger.warning("Nie udało się zamknąć archiwum wiadomości: %s", e)
@@ -0,0 +1,308 @@
+import bisect
+import itertools
+from typing import Iterator, Optional
+
+from tools.message_archive import UNSENT_ORDER, MessageArchive
+
+MAX_RESIDENT_MESSAGES = 500
+MAX_RESIDENT_BYTES = 512 * 1024
+# Tyle ostatnio wypchniętych do archiwum messageId pamięta okno - spóźniona strona historii
+# albo powiadomienie o takiej wiadomości nie wraca do okna jako duplikat
+MAX_EVICTED_IDS = 10 * MAX_RESIDENT_MESSAGES
+
+
+class StoredMessage:
+    __slots__ = ("message_id", "key", "author", "content", "sent_at", "order", "size", "archived")
+
+    def __init__(
+        self,
+        message_id: Optional[str],
+        key: Optional[str],
+        author: str,
+        content: str,
+        sent_at: Optional[int],
+        order: tuple
+    ):
+        self.message_id = message_id
+        self.key = key
+        self.author = author
+        self.content = content
+        self.sent_at = sent_at
+        self.order = order
+        self.size = len(author.encode("utf-8")) + len(content.encode("utf-8"))
+        self.archived = False
+
+
+class ConversationStore:
+    # Wiadomości jednej rozmowy posortowane po sentAt. Historia, powiadomienia i własne
+    # wiadomości trafiają tu z różnych wątków w dowolnej kolejności - wstawianie bisekcją
+    # zwraca pozycję w widoku, a messageId odrzuca duplikaty. Wiadomości jeszcze
+    # niepotwierdzone przez serwer (bez sentAt) są zawsze na końcu, w kolejności napisania.
+    #
+    # Z archiwum w pamięci jest tylko ciągłe okno rozmowy ograniczone liczbą wiadomości
+    # i bajtów. trim() wypycha do archiwum wiadomości z jednego końca okna, a load_older()
+    # i load_newer() wczytują je z powrotem stronami. Wiadomość spoza okna (np. nowa, gdy
+    # użytkownik czyta starsze) trafia od razu do archiwum
+    def __init__(
+        self,
+        archive: Optional[MessageArchive] = None,
+        conversation: Optional[tuple[str, str]] = None,
+        max_messages: int = MAX_RESIDENT_MESSAGES,
+        max_bytes: int = MAX_RESIDENT_BYTES
+    ):
+        self.archive = archive if conversation is not None else None
+        self.conversation = conversation
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        # None - nie wiadomo, czy archiwum ma starsze wiadomości
+        self.has_older: Optional[bool] = None
+        self.has_newer = False
+        self._orders: list[tuple] = []
+        self._messages: list[StoredMessage] = []
+        self._by_id: dict[str, StoredMessage] = {}
+        self._by_key: dict[str, StoredMessage] = {}
+        # messageId wypchnięte przez trim() / load_around(), od najstarszego
+        self._evicted: dict[str, None] = {}
+        self._bytes = 0
+        # Numery kolejne pochodzą z archiwum, więc wczytane strony i nowe wiadomości
+        # z tej samej sekundy zachowują kolejność między sesjami
+        self._seq = self.archive.next_seq if self.archive is not None else itertools.count().__next__
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[StoredMessage]:
+        return iter(self._messages)
+
+    def __contains__(self, message_id: str) -> bool:
+        return message_id in self._by_id
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def get(self, message_id: str) -> Optional[StoredMessage]:
+        return self._by_id.get(message_id)
+
+    def insert(self, message_id: Optional[str], author: str, content: str, sent_at: Optional[int]) -> Optional[int]:
+        # Zwraca pozycję nowej wiadomości albo None, jeśli już jest w rozmowie lub trafiła
+        # do archiwum, bo leży poza oknem
+        if message_id is not None and (message_id in self._by_id or message_id in self._evicted):
+            return None
+        message = StoredMessage(message_id, None, author, content, sent_at, self._order(sent_at))
+        if self._outside(message):
+            self._spill([message])
+            return None
+        if message_id is not None:
+            self._by_id[message_id] = message
+        return self._place(message)
+
+    def add_local(self, key: str, author: str, content: str) -> Optional[int]:
+        if key in self._by_key:
+            return None
+        message = StoredMessage(None, key, author, content, None, self._order(None))
+        self._by_key[key] = message
+        return self._place(message)
+
+    def discard_local(self, key: str) -> Optional[int]:
+        # Usuwa niewysłaną wiadomość, z której użytkownik zrezygnował; zwraca jej pozycję
+        message = self._by_key.pop(key, None)
+        if message is None:
+            return None
+        index = self.index(message)
+        self._remove(index)
+        return index
+
+    def confirm(self, key: str, message_id: Optional[str], sent_at: Optional[int]) -> tuple[Optional[int], Optional[int]]:
+        # Przenosi potwierdzoną wiadomość na miejsce wynikające z sentAt serwera.
+        # Zwraca (stara pozycja, nowa pozycja); nowa pozycja None oznacza, że ta sama
+        # wiadomość przyszła już z historią albo wypadła poza okno i lokalną kopię usunięto
+        message = self._by_key.pop(key, None)
+        if message is None:
+            return None, None
+        old_index = self.index(message)
+        self._remove(old_index)
+
+        if message_id is not None and (message_id in self._by_id or message_id in self._evicted):
+            return old_index, None
+
+        message.key = None
+        message.message_id = message_id
+        if sent_at is not None:
+            message.sent_at = sent_at
+            message.order = self._order(sent_at)
+        if self._outside(message):
+            self._spill([message])
+            return old_index, None
+        if message_id is not None:
+            self._by_id[message_id] = message
+        return old_index, self._place(message)
+
+    def index(self, message: StoredMessage) -> int:
+        return bisect.bisect_left(self._orders, message.order)
+
+    def last_sent_at(self) -> int:
+        for message in reversed(self._messages):
+            if message.sent_at is not None:
+                return message.sent_at
+        return 0
+
+    def over_budget(self) -> bool:
+        return len(self._messages) > self.max_messages or self._bytes > self.max_bytes
+
+    def trim(self, from_front: bool) -> list[int]:
+        # Wypycha do archiwum wiadomości z jednego końca okna, aż zajętość spadnie o 10%
+        # poniżej limitu - kolejne wiadomości nie wymuszają zapisu każda z osobna.
+        # Niepotwierdzone zostają w pamięci. Zwraca pozycje usuniętych, od największej
+        if self.archive is None or not self.over_budget():
+            return []
+        keep_messages = self.max_messages - self.max_messages // 10
+        keep_bytes = self.max_bytes - self.max_bytes // 10
+        count = len(self._messages)
+        size = self._bytes
+        positions = range(count) if from_front else range(count - 1, -1, -1)
+        evicted = []
+        for index in positions:
+            if count <= keep_messages and size <= keep_bytes:
+                break
+            message = self._messages[index]
+            if message.key is not None:
+                continue
+            # Ostatnia wiadomość okna zostaje - wyznacza, gdzie w archiwum jest okno
+            if count - len(self._by_key) <= 1:
+                break
+            evicted.append(index)
+            count -= 1
+            size -= message.size
+        if not evicted:
+            return []
+
+        evicted.sort(reverse=True)
+        self._evict(evicted)
+        if from_front:
+            self.has_older = True
+        else:
+            self.has_newer = True
+        return evicted
+
+    def load_older(self, limit: int) -> list[StoredMessage]:
+        if self.archive is None or self.has_older is False:
+            return []
+        # Granica obejmuje całą sekundu pierwszej wiadomości - ta sama wiadomość zapisana
+        # przez record() ma w archiwum inny numer kolejny; duplikaty odrzuca messageId
+        first = (self._messages[0].order[0], UNSENT_ORDER) if self._messages else (UNSENT_ORDER + 1, 0)
+        loaded = []
+        while not loaded:
+            rows = self.archive.before(*self.conversation, first, limit)
+            if len(rows) < limit:
+                self.has_older = False
+            if not rows:
+                break
+            first = (rows[0][4], rows[0][5])
+            loaded = self._restore(rows)
+            if self.has_older is False:
+                break
+        return loaded
+
+    def load_newer(self, limit: int) -> list[StoredMessage]:
+        if self.archive is None or not self.has_newer:
+            return []
+        last = self._last_confirmed()
+        bound = (last.order[0], -1) if last is not None else (-1, -1)
+        loaded = []
+        while not loaded:
+            rows = self.archive.after(*self.conversation, bound, limit)
+            if len(rows) < limit:
+                self.has_newer = False
+            if not rows:
+                break
+            bound = (rows[-1][4], rows[-1][5])
+            loaded = self._restore(rows)
+            if not self.has_newer:
+                break
+        return loaded
+
+    def load_around(self, order: tuple[int, int], limit: int) -> tuple[list[int], list[StoredMessage]]:
+        # Przeskok do wiadomości z archiwum (wyszukiwanie): okno jest zastępowane stroną
+        # wokół order. Zwraca (pozycje usuniętych od największej, wczytane wiadomości);
+        # niepotwierdzone zostają na końcu
+        if self.archive is None:
+            return [], []
+        evicted = [index for index in range(len(self._messages) - 1, -1, -1) if self._messages[index].key is None]
+        self._evict(evicted)
+
+        half = limit // 2
+        older = self.archive.before(*self.conversation, (order[0], order[1] + 1), half)
+        newer = self.archive.after(*self.conversation, order, limit - half)
+        self.has_older = len(older) == half
+        self.has_newer = len(newer) == limit - half
+        return evicted, self._restore(older + newer)
+
+    def _restore(self, rows: list) -> list[StoredMessage]:
+        restored = []
+        for message_id, author, content, sent_at, sort_at, seq in rows:
+            if message_id is not None and message_id in self._by_id:
+                continue
+            message = StoredMessage(message_id, None, author, content, sent_at, (sort_at, seq))
+            message.archived = True
+            if message_id is not None:
+                self._by_id[message_id] = message
+                self._evicted.pop(message_id, None)
+            self._place(message)
+            restored.append(message)
+        return restored
+
+    def _outside(self, message: StoredMessage) -> bool:
+        if self.archive is None:
+            return False
+        if self.has_newer:
+            last = self._last_confirmed()
+            if last is not None and message.order > last.order:
+                return True
+        if self.has_older and self._messages and message.order < self._messages[0].order:
+            return True
+        return False
+
+    def _last_confirmed(self) -> Optional[StoredMessage]:
+        for message in reversed(self._messages):
+            if message.key is None:
+                return message
+        return None
+
+    def _evict(self, indexes: list[int]):
+        # indexes od największej
+        self._spill([self._messages[index] for index in indexes])
+        for index in indexes:
+            message = self._remove(index)
+            if message.message_id is not None:
+                self._by_id.pop(message.message_id, None)
+                self._evicted[message.message_id] = None
+        while len(self._evicted) > MAX_EVICTED_IDS:
+            del self._evicted[next(iter(self._evicted))]
+
+    def _spill(self, messages: list[StoredMessage]):
+        rows = [
+            (m.message_id, m.author, m.content, m.sent_at, m.order[0], m.order[1])
+            for m in messages if not m.archived
+        ]
+        if rows:
+            self.archive.put(*self.conversation, rows)
+        for message in messages:
+            message.archived = True
+
+    def _order(self, sent_at: Optional[int]) -> tuple:
+        # Numer kolejny rozstrzyga remisy w obrębie tej samej sekundy
+        return (UNSENT_ORDER if sent_at is None else sent_at, self._seq())
+
+    def _place(self, message: StoredMessage) -> int:
+        index = bisect.bisect_right(self._orders, message.order)
+        self._orders.insert(index, message.order)
+        self._messages.insert(index, message)
+        self._bytes += message.size
+        return index
+
+    def _remove(self, index: int) -> StoredMessage:
+        del self._orders[index]
+        message = self._messages.pop(index)
+        self._bytes -= message.size
+        return message
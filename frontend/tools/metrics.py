@@ -0,0 +1,123 @@
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+
+class Histogram:
+    # Kubełki logarytmiczne od 50 µs do ~52 s - zapis to jedno bisect i dwie inkrementacje
+    BOUNDS = tuple(0.00005 * 2 ** i for i in range(21))
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= rank:
+                upper = self.BOUNDS[i] if i < len(self.BOUNDS) else self.max
+                return min(upper, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._counters: dict[str, int] = {}
+        self._gauges: dict[str, list[float]] = {}
+        self._histograms: dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float):
+        with self._lock:
+            entry = self._gauges.get(name)
+            if entry is None:
+                self._gauges[name] = [value, value]
+            else:
+                entry[0] = value
+                if value > entry[1]:
+                    entry[1] = value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "uptime_s": time.time() - self._started_at,
+                "counters": dict(self._counters),
+                "gauges": {name: {"value": v[0], "max": v[1]} for name, v in self._gauges.items()},
+                "histograms": {name: h.snapshot() for name, h in self._histograms.items()},
+            }
+
+    def dump(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+class MetricsDumper:
+    def __init__(self, metrics: Metrics, path: str, interval: float = 10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.metrics.dump(self.path)
+            except OSError:
+                pass
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        try:
+            self.metrics.dump(self.path)
+        except OSError:
+            pass
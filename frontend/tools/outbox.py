@@ -0,0 +1,363 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from tools.tcp_client import SendQueueFull
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+DISCARDED = "discarded"
+
+# Tyle razy wiadomość może zostać bez potwierdzenia na działającym połączeniu, zanim zostanie
+# oznaczona jako niewysłana; próby przy zerwanym połączeniu się nie liczą
+MAX_ATTEMPTS = 5
+# Dziennik jest przepisywany, gdy zbierze tyle rekordów, które nic już nie wnoszą (wysłane,
+# odrzucone, zastąpione ponowieniem), i gdy jest ich więcej niż potrzebnych
+COMPACT_RECORDS = 1000
+# Najwięcej wiadomości jednej rozmowy wysyłanych potokowo w jednej rundzie
+FLUSH_BATCH = 32
+
+
+class OutboxEntry:
+    __slots__ = ("key", "kind", "target", "content", "created_at", "state", "message_id", "sent_at", "error", "attempts")
+
+    def __init__(self, key: str, kind: str, target: str, content: str, created_at: float):
+        self.key = key
+        self.kind = kind
+        self.target = target
+        self.content = content
+        self.created_at = created_at
+        self.state = PENDING
+        self.message_id: Optional[str] = None
+        self.sent_at: Optional[int] = None
+        self.error: Optional[str] = None
+        self.attempts = 0
+
+    @property
+    def conversation(self) -> tuple[str, str]:
+        return self.kind, self.target
+
+
+class Outbox:
+    # Dziennik dopisywany na dysk (JSONL): rekord "add" przy każdej nowej wiadomości,
+    # "sent"/"failed" po odpowiedzi serwera i "discarded", gdy użytkownik zrezygnuje
+    # z niewysłanej. Przy otwarciu dziennik jest odtwarzany - niewysłane wiadomości wracają
+    # do kolejki, a odrzucone przez serwer jako do ponowienia albo odrzucenia - i przepisywany
+    # tak, żeby zostały w nim tylko one; w trakcie sesji przepisywany po zebraniu
+    # COMPACT_RECORDS zbędnych rekordów
+    def __init__(self, path: str):
+        self.path = path
+        self.on_change: Optional[Callable[[OutboxEntry], None]] = None
+        self._entries: dict[str, OutboxEntry] = {}
+        # Niewysłane wiadomości, które użytkownik może ponowić albo odrzucić
+        self._failed: dict[str, OutboxEntry] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        # Liczba rekordów w pliku dziennika
+        self._records = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._compact()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Ostatni wiersz mógł zostać urwany przy awarii w trakcie zapisu
+                    continue
+
+                op = record.get("op")
+                if op == "add":
+                    # Ponowienie dopisuje "add" z tym samym kluczem
+                    entry = OutboxEntry(
+                        record["key"], record["kind"], record["target"], record["content"], record["createdAt"]
+                    )
+                    self._failed.pop(entry.key, None)
+                    self._entries[entry.key] = entry
+                elif op == FAILED:
+                    entry = self._entries.pop(record.get("key"), None)
+                    if entry is not None:
+                        entry.state = FAILED
+                        entry.error = record.get("error")
+                        self._failed[entry.key] = entry
+                elif op in (SENT, DISCARDED):
+                    self._entries.pop(record.get("key"), None)
+                    self._failed.pop(record.get("key"), None)
+
+        if self._entries or self._failed:
+            logger.info(
+                "Odtworzono %d niewysłanych i %d odrzuconych wiadomości z %s",
+                len(self._entries), len(self._failed), self.path
+            )
+
+    def _compact(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(self._add_record(entry)) + "\n")
+            for entry in self._failed.values():
+                f.write(json.dumps(self._add_record(entry)) + "\n")
+                f.write(json.dumps(self._failed_record(entry)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._records = self._live_records()
+
+    def _live_records(self) -> int:
+        # Niewysłana wiadomość to rekord "add", odrzucona przez serwer - "add" i "failed"
+        return len(self._entries) + 2 * len(self._failed)
+
+    def _compact_if_needed(self):
+        # Wywoływane pod blokadą z wątku wysyłającego - przepisanie z fsync nie trafia do wątku GUI
+        dead = self._records - self._live_records()
+        if dead < COMPACT_RECORDS or dead <= self._live_records() or self._file.closed:
+            return
+        self._file.close()
+        try:
+            self._compact()
+        except OSError as e:
+            logger.warning("Nie udało się przepisać skrzynki nadawczej: %s", e)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._dirty = False
+
+    @staticmethod
+    def _add_record(entry: OutboxEntry) -> dict:
+        return {
+            "op": "add",
+            "key": entry.key,
+            "kind": entry.kind,
+            "target": entry.target,
+            "content": entry.content,
+            "createdAt": entry.created_at,
+        }
+
+    @staticmethod
+    def _failed_record(entry: OutboxEntry) -> dict:
+        return {"op": FAILED, "key": entry.key, "error": entry.error}
+
+    def _append(self, record: dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._records += 1
+
+    def add(self, kind: str, target: str, content: str) -> OutboxEntry:
+        entry = OutboxEntry(str(uuid.uuid4()), kind, target, content, time.time())
+        with self._lock:
+            # fsync robi sync() w wątku wysyłającym, zanim wiadomość pójdzie do serwera -
+            # szybkie pisanie nie czeka w wątku GUI na dysk, a kilka wiadomości dzieli jeden zapis
+            self._append(self._add_record(entry))
+            self._entries[entry.key] = entry
+            self._dirty = True
+        return entry
+
+    def sync(self):
+        with self._lock:
+            self._compact_if_needed()
+            if not self._dirty or self._file.closed:
+                return
+            self._dirty = False
+            fileno = self._file.fileno()
+        try:
+            os.fsync(fileno)
+        except OSError as e:
+            logger.warning("Nie udało się zapisać skrzynki nadawczej na dysk: %s", e)
+
+    def retry(self, key: str) -> Optional[OutboxEntry]:
+        with self._lock:
+            entry = self._failed.pop(key, None)
+            if entry is None:
+                return None
+            entry.state = PENDING
+            entry.error = None
+            entry.attempts = 0
+            self._append(self._add_record(entry))
+            self._entries[entry.key] = entry
+            self._dirty = True
+        self._notify(entry)
+        return entry
+
+    def discard(self, key: str) -> Optional[OutboxEntry]:
+        with self._lock:
+            entry = self._failed.pop(key, None)
+            if entry is None:
+                return None
+            self._append({"op": DISCARDED, "key": entry.key})
+        entry.state = DISCARDED
+        self._notify(entry)
+        return entry
+
+    def mark_sent(self, entry: OutboxEntry, message_id: Optional[str], sent_at: Optional[int] = None):
+        with self._lock:
+            # Utrata tego rekordu oznacza jedynie ponowne, idempotentne wysłanie
+            self._append({"op": SENT, "key": entry.key, "messageId": message_id})
+            self._entries.pop(entry.key, None)
+            self._compact_if_needed()
+        entry.state = SENT
+        entry.message_id = message_id
+        entry.sent_at = sent_at
+        self._notify(entry)
+
+    def mark_failed(self, entry: OutboxEntry, error: str):
+        with self._lock:
+            entry.state = FAILED
+            entry.error = error
+            self._append(self._failed_record(entry))
+            self._entries.pop(entry.key, None)
+            self._failed[entry.key] = entry
+        self._notify(entry)
+
+    def _notify(self, entry: OutboxEntry):
+        if self.on_change:
+            try:
+                self.on_change(entry)
+            except Exception as e:
+                logger.error("Błąd w callbacku on_change: %s", e)
+
+    def pending(self, conversation: Optional[tuple[str, str]] = None) -> list[OutboxEntry]:
+        with self._lock:
+            entries = list(self._entries.values())
+        if conversation is None:
+            return entries
+        return [entry for entry in entries if entry.conversation == conversation]
+
+    def unsent(self, conversation: tuple[str, str]) -> list[OutboxEntry]:
+        # Oczekujące i odrzucone przez serwer wiadomości rozmowy w kolejności napisania
+        with self._lock:
+            entries = [*self._entries.values(), *self._failed.values()]
+        return sorted((entry for entry in entries if entry.conversation == conversation), key=lambda e: e.created_at)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def backlog(self, limit: int) -> list[list[OutboxEntry]]:
+        # Dla każdej rozmowy najwyżej limit najstarszych oczekujących wiadomości w kolejności
+        # napisania. Wiadomość odrzucona (przez serwer albo po MAX_ATTEMPTS próbach bez
+        # odpowiedzi) zatrzymuje późniejsze wiadomości rozmowy, dopóki użytkownik jej nie ponowi
+        # albo nie odrzuci - inaczej dotarłyby do odbiorcy przed nią
+        with self._lock:
+            entries = sorted([*self._entries.values(), *self._failed.values()], key=lambda e: e.created_at)
+        batches: dict[tuple[str, str], list[OutboxEntry]] = {}
+        held: set[tuple[str, str]] = set()
+        for entry in entries:
+            conversation = entry.conversation
+            if conversation in held:
+                continue
+            if entry.state == FAILED:
+                held.add(conversation)
+                continue
+            batch = batches.setdefault(conversation, [])
+            if len(batch) < limit:
+                batch.append(entry)
+        return [batch for batch in batches.values() if batch]
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self._file.close()
+
+
+class OutboxFlusher:
+    # W jednej rundzie każda rozmowa wysyła potokowo do FLUSH_BATCH kolejnych wiadomości, całą
+    # serię jednym połączeniem - serwer obsługuje żądania połączenia po kolei, więc kolejność
+    # u odbiorcy jest zachowana, a zaległości nie czekają na potwierdzenie każdej wiadomości
+    # osobno. Pierwsza wiadomość bez potwierdzenia zatrzymuje rozmowę: po błędzie połączenia
+    # albo braku odpowiedzi runda się kończy, a odrzucona wiadomość wstrzymuje kolejne (backlog)
+    def __init__(self, api_service, outbox: Outbox, retry_interval: float = 2.0, max_attempts: int = MAX_ATTEMPTS):
+        self.api_service = api_service
+        self.outbox = outbox
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while self._running:
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Błąd podczas wysyłania skrzynki nadawczej: %s", e)
+
+            timeout = self.retry_interval if self.outbox.backlog(1) else None
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def flush(self):
+        while self._running:
+            batches = self.outbox.backlog(FLUSH_BATCH)
+            if not batches or not self.api_service.token:
+                return
+
+            self.outbox.sync()
+            requests = []
+            interrupted = False
+            for batch in batches:
+                lane = self.api_service.outbox_lane(batch[0])
+                for entry in batch:
+                    try:
+                        requests.append((entry, self.api_service.submit_outbox_entry(entry, lane)))
+                    except (ConnectionError, SendQueueFull) as e:
+                        logger.debug("Wstrzymano wysyłanie skrzynki nadawczej: %s", e)
+                        interrupted = True
+                        break
+                if interrupted:
+                    break
+
+            for entry, pending in requests:
+                try:
+                    response = self.api_service.wait(pending)
+                except (ConnectionError, TimeoutError, SendQueueFull) as e:
+                    # Wiadomość mogła dotrzeć do serwera - ponowienie z tym samym kluczem
+                    # nie utworzy duplikatu
+                    logger.debug("Wiadomość %s czeka na ponowienie: %s", entry.key, e)
+                    interrupted = True
+                    # Zerwane połączenie to nie wina wiadomości - liczą się tylko próby,
+                    # na które serwer nie odpowiedział w czasie
+                    if isinstance(e, TimeoutError):
+                        entry.attempts += 1
+                        if entry.attempts >= self.max_attempts:
+                            logger.warning("Wiadomość %s bez potwierdzenia po %d próbach", entry.key, entry.attempts)
+                            self.outbox.mark_failed(entry, "Serwer nie potwierdził wiadomości")
+                    continue
+
+                # Dalsze wiadomości serii serwer obsłużył już po odrzuconej - każda dostaje
+                # stan z własnej odpowiedzi, a kolejne rundy czekają za odrzuconą
+                if response.get("code") == 200:
+                    self.outbox.mark_sent(entry, response.get("messageId"), response.get("sentAt"))
+                else:
+                    logger.warning("Serwer odrzucił wiadomość %s: %s", entry.key, response.get("message"))
+                    self.outbox.mark_failed(entry, response.get("message", "Nieznany błąd"))
+
+            if interrupted:
+                return
@@ -0,0 +1,118 @@
+import bisect
+import unicodedata
+from typing import Generic, Hashable, Iterable, Optional, TypeVar
+
+V = TypeVar("V", bound=Hashable)
+
+# Do tylu zmian naraz wpisy są wstawiane i usuwane pojedynczo wyszukiwaniem binarnym (przesunięcie
+# listy w C) - odświeżenie z jedną zmianą nie sortuje ani nie filtruje całego indeksu
+SMALL_CHANGE = 64
+
+# Większy od każdego znaku, który może wystąpić w kluczu - górna granica zakresu prefiksu
+KEY_END = "\U0010ffff"
+# Litery, których NFKD nie rozkłada na literę bazową i znak diakrytyczny
+BASE_LETTERS = str.maketrans({"ł": "l", "ø": "o", "đ": "d"})
+
+
+def normalize(text: str) -> str:
+    # Bez rozróżniania wielkości liter i znaków diakrytycznych ("Łukasz" ~ "lukasz", "Żaneta" ~ "zaneta")
+    # Nazwy w ASCII (większość) omijają rozkład znaków - indeks budowany jest dla wszystkich wpisów
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text.casefold().translate(BASE_LETTERS))
+    if text.isascii():
+        return text
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+class PrefixIndex(Generic[V]):
+    # Posortowana lista par (znormalizowany klucz, wartość). Wszystkie wartości, których klucz
+    # zaczyna się od danego prefiksu, leżą obok siebie, więc filtr to dwa wyszukiwania binarne,
+    # a jego wynik - ciągły zakres pozycji. Wartości muszą być porównywalne (rozstrzygają
+    # kolejność przy równych kluczach); jedna wartość może mieć kilka kluczy (np. słowa nazwy)
+    def __init__(self, entries: Iterable[tuple[str, V]] = ()):
+        self._entries: list[tuple[str, V]] = sorted({(normalize(key), value) for key, value in entries})
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, position: int) -> V:
+        return self._entries[position][1]
+
+    def key(self, position: int) -> str:
+        return self._entries[position][0]
+
+    def entries(self, start: int, end: int) -> list[tuple[str, V]]:
+        return self._entries[start:end]
+
+    def find(self, key: str, value: V) -> tuple[int, bool]:
+        # Pozycja wpisu i czy już jest w indeksie; jeśli nie - pozycja, na którą trafiłby po add
+        entry = (normalize(key), value)
+        position = bisect.bisect_left(self._entries, entry)
+        return position, position < len(self._entries) and self._entries[position] == entry
+
+    def add(self, key: str, value: V) -> Optional[int]:
+        # Pozycja nowego wpisu albo None, gdy już był
+        position, present = self.find(key, value)
+        if present:
+            return None
+        self._entries.insert(position, (normalize(key), value))
+        return position
+
+    def remove(self, key: str, value: V) -> Optional[int]:
+        # Pozycja usuniętego wpisu albo None, gdy go nie było
+        position, present = self.find(key, value)
+        if not present:
+            return None
+        del self._entries[position]
+        return position
+
+    def update(self, items: Iterable[tuple[str, V]]) -> int:
+        # Wiele wpisów naraz: posortowane nowe wpisy są scalane z listą jednym sortowaniem
+        # (timsort łączy dwa uporządkowane ciągi liniowo) zamiast wstawiania po jednym;
+        # kilka wpisów taniej wstawić pojedynczo niż przejść całą listę
+        entries = sorted({(normalize(key), value) for key, value in items})
+        entries = [entry for entry in entries if not self._contains(entry)]
+        if len(entries) <= SMALL_CHANGE:
+            for entry in entries:
+                bisect.insort(self._entries, entry)
+        else:
+            self._entries.extend(entries)
+            self._entries.sort()
+        return len(entries)
+
+    def discard(self, items: Iterable[tuple[str, V]]) -> int:
+        removed = {(normalize(key), value) for key, value in items}
+        count = len(self._entries)
+        if len(removed) <= SMALL_CHANGE:
+            for entry in removed:
+                position = bisect.bisect_left(self._entries, entry)
+                if position < len(self._entries) and self._entries[position] == entry:
+                    del self._entries[position]
+            return count - len(self._entries)
+        self._entries = [entry for entry in self._entries if entry not in removed]
+        return count - len(self._entries)
+
+    def _contains(self, entry: tuple[str, V]) -> bool:
+        position = bisect.bisect_left(self._entries, entry)
+        return position < len(self._entries) and self._entries[position] == entry
+
+    def range(self, prefix: str) -> tuple[int, int]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return 0, len(self._entries)
+        return (
+            bisect.bisect_left(self._entries, (prefix,)),
+            bisect.bisect_left(self._entries, (prefix + KEY_END,)),
+        )
+
+    def search(self, prefix: str, limit: int) -> list[V]:
+        # Najwyżej limit różnych wartości w kolejności kluczy - przy kilku kluczach na wartość
+        # ta sama wartość może trafić się w zakresie wielokrotnie
+        start, end = self.range(prefix)
+        found: dict[V, None] = {}
+        for position in range(start, end):
+            found[self._entries[position][1]] = None
+            if len(found) >= limit:
+                break
+        return list(found)
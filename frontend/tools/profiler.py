@@ -0,0 +1,73 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cpu", "memory")
+
+
+class Profiler:
+    def __init__(self, output_dir: str = "."):
+        self.output_dir = output_dir
+        self.mode: Optional[str] = None
+        self._profile: Optional[cProfile.Profile] = None
+
+    @property
+    def running(self) -> bool:
+        return self.mode is not None
+
+    def start(self, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Nieznany tryb profilowania: {mode}")
+        if self.running:
+            return
+
+        if mode == "cpu":
+            # cProfile obejmuje wątek, z którego go włączono - tu wątek GUI
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            tracemalloc.start(25)
+
+        self.mode = mode
+        logger.info("Profilowanie (%s) włączone", mode)
+
+    def stop(self) -> Optional[str]:
+        if not self.running:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"recomm_{self.mode}_{time.strftime('%Y%m%d-%H%M%S')}")
+
+        if self.mode == "cpu":
+            self._profile.disable()
+            self._profile.dump_stats(f"{base}.prof")
+            summary = io.StringIO()
+            pstats.Stats(self._profile, stream=summary).sort_stats("cumulative").print_stats(50)
+            self._profile = None
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            snapshot.dump(f"{base}.tracemalloc")
+            summary = io.StringIO()
+            for stat in snapshot.statistics("lineno")[:50]:
+                summary.write(f"{stat}\n")
+
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+
+        logger.info("Profilowanie (%s) zakończone, wyniki w %s.*", self.mode, base)
+        self.mode = None
+        return base
+
+    def toggle(self, mode: str) -> Optional[str]:
+        if self.running:
+            return self.stop()
+        self.start(mode)
+        return None
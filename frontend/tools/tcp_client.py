@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 
+import random
 import socket
 import threading
 import time
 import logging
-from typing import Callable, Optional
-from queue import Queue
-from enum import Enum
+from collections import deque
+from typing import Any, Callable, Iterator, Optional
+from queue import Empty
+from enum import Enum, IntEnum
+
+from tools.dialer import ResolverCache, default_resolver, dial
+from tools.metrics import Metrics
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
@@ -19,6 +23,315 @@ class ConnectionState(Enum):
     RECONNECTING = "reconnecting"
 
 
+class BackpressurePolicy(Enum):
+    BLOCK = "block"
+    FAIL_FAST = "fail_fast"
+    DROP_BACKGROUND = "drop_background"
+
+
+class SendQueueFull(Exception):
+    pass
+
+
+class FrameTooLarge(Exception):
+    pass
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+class OutgoingFrame:
+    __slots__ = ("data", "priority", "merge_key", "enqueued_at", "callbacks", "tag", "merged")
+
+    def __init__(self, data: bytes, priority: Priority, merge_key: Optional[str], tag: Any = None):
+        self.data = data
+        self.priority = priority
+        self.merge_key = merge_key
+        self.enqueued_at = time.monotonic()
+        self.callbacks: list[Callable[[], None]] = []
+        self.tag = tag
+        self.merged = 0
+
+
+class SendQueue:
+    # Osobna kolejka FIFO dla każdego priorytetu. Ramka z niższego priorytetu, która czeka
+    # dłużej niż max_wait, wychodzi przed wyższymi - tło nie zagłodzi się przy ciągłym pisaniu.
+    # Rozmiar kolejki jest ograniczony w bajtach i ramkach; po przekroczeniu high_watermark
+    # zgłaszana jest presja zwrotna, odwoływana dopiero po spadku poniżej low_watermark
+    def __init__(
+        self,
+        max_wait: Optional[dict[Priority, float]] = None,
+        max_bytes: int = 4 * 1024 * 1024,
+        max_frames: int = 1000,
+        high_watermark: float = 0.8,
+        low_watermark: float = 0.5,
+        policy: BackpressurePolicy = BackpressurePolicy.DROP_BACKGROUND,
+        block_timeout: float = 5.0
+    ):
+        self.max_wait = max_wait if max_wait is not None else {Priority.NORMAL: 0.5, Priority.BACKGROUND: 2.0}
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.backpressure = False
+        self.on_backpressure: Optional[Callable[[bool], None]] = None
+        self.on_dropped: Optional[Callable[[OutgoingFrame], None]] = None
+        self._lanes: dict[Priority, deque] = {priority: deque() for priority in Priority}
+        self._mergeable: dict[str, OutgoingFrame] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._bytes = 0
+        self._frames = 0
+        self.aged = 0
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def _fill(self) -> float:
+        return max(self._bytes / self.max_bytes, self._frames / self.max_frames)
+
+    def _fits(self, frame: OutgoingFrame) -> bool:
+        if not self._frames:
+            return True
+        return self._frames + 1 <= self.max_frames and self._bytes + len(frame.data) <= self.max_bytes
+
+    def _update_pressure(self) -> Optional[bool]:
+        fill = self._fill()
+        if not self.backpressure and fill >= self.high_watermark:
+            self.backpressure = True
+            return True
+        if self.backpressure and fill <= self.low_watermark:
+            self.backpressure = False
+            return False
+        return None
+
+    def _append(self, frame: OutgoingFrame):
+        self._lanes[frame.priority].append(frame)
+        self._bytes += len(frame.data)
+        self._frames += 1
+
+    def _discard(self, frame: OutgoingFrame):
+        self._bytes -= len(frame.data)
+        self._frames -= 1
+        if frame.merge_key is not None and self._mergeable.get(frame.merge_key) is frame:
+            del self._mergeable[frame.merge_key]
+
+    def _notify(self, changed: Optional[bool], dropped: list[OutgoingFrame]):
+        # Callbacki wywoływane poza blokadą kolejki
+        for frame in dropped:
+            if self.on_dropped:
+                self.on_dropped(frame)
+        if changed is not None and self.on_backpressure:
+            self.on_backpressure(changed)
+
+    def qsize(self) -> int:
+        with self._cond:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def depth(self, priority: Priority) -> int:
+        with self._cond:
+            return len(self._lanes[priority])
+
+    def put(self, frame: OutgoingFrame) -> OutgoingFrame:
+        dropped: list[OutgoingFrame] = []
+        changed = None
+        try:
+            with self._cond:
+                if self._closed:
+                    raise SendQueueFull("Kolejka wysyłania jest zamknięta")
+                if frame.merge_key is not None:
+                    queued = self._mergeable.get(frame.merge_key)
+                    if queued is not None:
+                        # Identyczne żądanie jeszcze czeka - nowsze dołącza do niego zamiast
+                        # wysyłać drugą ramkę, odpowiedź dostaną obaj wywołujący
+                        queued.callbacks.extend(frame.callbacks)
+                        queued.merged += 1
+                        return queued
+
+                try:
+                    self._make_room(frame, dropped)
+                    self._append(frame)
+                    if frame.merge_key is not None:
+                        self._mergeable[frame.merge_key] = frame
+                finally:
+                    # Także gdy ramka się nie zmieściła - _make_room mógł już usunąć ramki z tła
+                    changed = self._update_pressure()
+                    self._cond.notify_all()
+        finally:
+            self._notify(changed, dropped)
+        return frame
+
+    def _make_room(self, frame: OutgoingFrame, dropped: list[OutgoingFrame]):
+        if self.policy == BackpressurePolicy.DROP_BACKGROUND:
+            if frame.priority == Priority.BACKGROUND and self.backpressure:
+                raise SendQueueFull("Kolejka wysyłania przepełniona - pominięto żądanie w tle")
+            background = self._lanes[Priority.BACKGROUND]
+            while background and not self._fits(frame):
+                victim = background.popleft()
+                self._discard(victim)
+                dropped.append(victim)
+        elif self.policy == BackpressurePolicy.BLOCK:
+            deadline = time.monotonic() + self.block_timeout
+            while not self._fits(frame) and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+        if not self._fits(frame):
+            raise SendQueueFull(
+                f"Kolejka wysyłania przepełniona ({self._frames} ramek, {self._bytes} B)"
+            )
+
+    def remove(self, frame: OutgoingFrame) -> bool:
+        with self._cond:
+            try:
+                self._lanes[frame.priority].remove(frame)
+            except ValueError:
+                return False
+            self._discard(frame)
+            changed = self._update_pressure()
+            self._cond.notify_all()
+        self._notify(changed, [])
+        return True
+
+    def _pick(self) -> Optional[OutgoingFrame]:
+        now = time.monotonic()
+        for priority in sorted(self.max_wait, reverse=True):
+            lane = self._lanes[priority]
+            if lane and now - lane[0].enqueued_at >= self.max_wait[priority]:
+                if any(self._lanes[p] for p in Priority if p < priority):
+                    self.aged += 1
+                return lane.popleft()
+        for priority in Priority:
+            if self._lanes[priority]:
+                return self._lanes[priority].popleft()
+        return None
+
+    def get(self, timeout: float, interrupt: Optional[threading.Event] = None) -> Optional[OutgoingFrame]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed or (interrupt is not None and interrupt.is_set()):
+                    return None
+                frame = self._pick()
+                if frame is not None:
+                    self._discard(frame)
+                    changed = self._update_pressure()
+                    self._cond.notify_all()
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Empty
+                self._cond.wait(remaining)
+        self._notify(changed, [])
+        return frame
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def open(self):
+        with self._cond:
+            self._closed = False
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# Serwer kończy każdą odpowiedź i powiadomienie znakiem nowej linii
+FRAME_DELIMITER = b"\n"
+
+
+class ReceiveBuffer:
+    # Bufor odbioru jednego połączenia: recv_into pisze bezpośrednio do bytearray, a kompletne
+    # ramki są wydawane jako memoryview na jego fragment, bez kopiowania. Niedokończona ramka
+    # jest przesuwana na początek bufora; gdy zajmuje ponad połowę, bufor rośnie dwukrotnie
+    # (do max_size). Jeśli przez shrink_after odczytów dane zajmowały najwyżej ćwierć bufora,
+    # bufor maleje o połowę (do min_size)
+    def __init__(self, min_size: int = 2048, max_size: int = 64 * 1024 * 1024, shrink_after: int = 64):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.shrink_after = shrink_after
+        self.resizes = 0
+        self.copied = 0
+        self._buffer = bytearray(min_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+        self._high = 0
+        self._reads = 0
+
+    @property
+    def size(self) -> int:
+        return len(self._buffer)
+
+    def recv_into(self, sock: socket.socket) -> int:
+        self._reads += 1
+        if self._reads >= self.shrink_after:
+            size = len(self._buffer)
+            if size > self.min_size and self._high * 4 <= size:
+                self._relocate(max(self.min_size, size // 2))
+            self._reads = 0
+            self._high = 0
+
+        if self._end == len(self._buffer):
+            self._make_room()
+        count = sock.recv_into(self._view[self._end:])
+        self._end += count
+        if self._end - self._start > self._high:
+            self._high = self._end - self._start
+        return count
+
+    def frames(self) -> Iterator[memoryview]:
+        # Widok ramki jest ważny tylko do następnego odczytu - kto chce go zachować, kopiuje
+        while True:
+            end = self._buffer.find(FRAME_DELIMITER, self._scan, self._end)
+            if end < 0:
+                self._scan = self._end
+                break
+            frame = self._view[self._start:end]
+            self._start = self._scan = end + 1
+            yield frame
+        if self._start == self._end:
+            self._start = self._end = self._scan = 0
+
+    def _make_room(self):
+        pending = self._end - self._start
+        size = len(self._buffer)
+        if pending >= self.max_size:
+            raise FrameTooLarge(f"Ramka przekracza {self.max_size} B")
+        if pending > size // 2 and size < self.max_size:
+            self._relocate(min(size * 2, self.max_size))
+        else:
+            self._relocate(size)
+
+    def _relocate(self, size: int):
+        pending = self._end - self._start
+        if size != len(self._buffer):
+            buffer = bytearray(size)
+            buffer[:pending] = self._view[self._start:self._end]
+            # Poprzedni bufor nie jest zmieniany w miejscu - widoki wydane wcześniej pozostają ważne
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+            self.resizes += 1
+        elif pending and self._start:
+            self._view[:pending] = self._view[self._start:self._end]
+        self.copied += pending
+        self._scan -= self._start
+        self._start = 0
+        self._end = pending
+
+
 class TCPClient:
     def __init__(
         self,
@@ -29,7 +342,16 @@ class TCPClient:
         heartbeat_interval: float = 10.0,
         connection_timeout: float = 10.0,
         buffer_size: int = 2048,
-        auto_reconnect: bool = True
+        max_frame_size: int = 64 * 1024 * 1024,
+        auto_reconnect: bool = True,
+        metrics: Optional[Metrics] = None,
+        max_in_flight: int = 0,
+        send_buffer_bytes: int = 4 * 1024 * 1024,
+        send_buffer_frames: int = 1000,
+        backpressure_policy: BackpressurePolicy = BackpressurePolicy.DROP_BACKGROUND,
+        resolver: Optional[ResolverCache] = None,
+        connect_stagger: float = 0.25,
+        fast_retry: bool = True
     ):
         self.host = host
         self.port = port
@@ -37,282 +359,472 @@ class TCPClient:
         self.max_reconnect_delay = max_reconnect_delay
         self.heartbeat_interval = heartbeat_interval
         self.connection_timeout = connection_timeout
+        # Początkowy (i najmniejszy) rozmiar bufora odbioru; rośnie z rozmiarem ramek
         self.buffer_size = buffer_size
+        self.max_frame_size = max_frame_size
         self.auto_reconnect = auto_reconnect
+        self.metrics = metrics if metrics is not None else Metrics()
+        # Limit ramek wysłanych bez odpowiedzi (0 = bez limitu); zwalniany przez complete()
+        self.max_in_flight = max_in_flight
+        self.resolver = resolver if resolver is not None else default_resolver
+        # Odstęp między równoległymi próbami kolejnych adresów (happy eyeballs)
+        self.connect_stagger = connect_stagger
+        # Natychmiastowa ponowna próba po zerwaniu połączenia - pokrywa chwilowe resety bez
+        # czekania na backoff. Połączenie, które padło szybciej niż reconnect_delay, dostaje
+        # ją najwyżej raz na max_reconnect_delay, żeby niestabilny serwer nie był zasypywany
+        self.fast_retry = fast_retry
 
         self._socket: Optional[socket.socket] = None
         self._state = ConnectionState.DISCONNECTED
         self._state_lock = threading.Lock()
 
         self._running = False
-        self._receive_thread: Optional[threading.Thread] = None
-        self._heartbeat_thread: Optional[threading.Thread] = None
-        self._reconnect_thread: Optional[threading.Thread] = None
-
-        self._send_queue: Queue = Queue()
-        self._send_thread: Optional[threading.Thread] = None
+        self._supervisor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._lost: Optional[threading.Event] = None
+        self._generation = 0
+        self._first_attempt = threading.Event()
+        self._first_attempt_ok = False
+
+        self._send_queue = SendQueue(
+            max_bytes=send_buffer_bytes,
+            max_frames=send_buffer_frames,
+            policy=backpressure_policy
+        )
+        self._send_queue.on_backpressure = self._handle_backpressure
+        self._send_queue.on_dropped = self._handle_dropped
+        self._in_flight = 0
+        self._flow = threading.Condition()
 
         self._current_reconnect_delay = reconnect_delay
         self._reconnect_attempts = 0
+        self._reconnect_started_at: Optional[float] = None
+        self._retry_now = False
+        self._last_fast_retry: Optional[float] = None
 
-        self.on_message: Optional[Callable[[bytes], None]] = None
+        # Wywoływane dla każdej ramki (bez znaku nowej linii) z widokiem na bufor odbioru
+        self.on_message: Optional[Callable[[memoryview], None]] = None
         self.on_connection_change: Optional[Callable[[ConnectionState], None]] = None
+        self.on_reconnect_scheduled: Optional[Callable[[int, float], None]] = None
         self.on_error: Optional[Callable[[Exception], None]] = None
+        self.on_frame_sent: Optional[Callable[[OutgoingFrame], None]] = None
+        self.on_frame_dropped: Optional[Callable[[OutgoingFrame], None]] = None
+        self.on_backpressure: Optional[Callable[[bool], None]] = None
 
     @property
     def state(self) -> ConnectionState:
-        with self._state_lock:
-            return self._state
+        # Odczyt pojedynczego atrybutu jest atomowy - is_connected na gorących ścieżkach
+        # nie czeka na blokadę
+        return self._state
 
     @state.setter
     def state(self, new_state: ConnectionState):
         with self._state_lock:
-            if self._state != new_state:
-                self._state = new_state
-                logger.info(f"Stan połączenia: {new_state.value}")
-                if self.on_connection_change:
-                    try:
-                        self.on_connection_change(new_state)
-                    except Exception as e:
-                        logger.error(f"Błąd w callbacku on_connection_change: {e}")
+            if self._state == new_state:
+                return
+            self._state = new_state
+        logger.info("Stan połączenia: %s", new_state.value)
+        # Callback poza blokadą - wolny odbiorca nie wstrzymuje innych zmian ani odczytów stanu.
+        # Stan zmienia tylko nadzorca (i disconnect() po jego zakończeniu), więc kolejność
+        # powiadomień odpowiada kolejności zmian
+        if self.on_connection_change:
+            try:
+                self.on_connection_change(new_state)
+            except Exception as e:
+                logger.error("Błąd w callbacku on_connection_change: %s", e)
 
     @property
-    def is_connected(self) -> bool:
-        return self.state == ConnectionState.CONNECTED
-
-    def connect(self) -> bool:
-        if self.is_connected:
-            logger.warning("Już połączono")
-            return True
-
-        self._running = True
-        self.state = ConnectionState.CONNECTING
+    def backpressure(self) -> bool:
+        return self._send_queue.backpressure
 
-        try:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._socket.settimeout(self.connection_timeout)
-            self._socket.connect((self.host, self.port))
-            self._socket.settimeout(None)
-
-            self.state = ConnectionState.CONNECTED
-            self._current_reconnect_delay = self.reconnect_delay
-            self._reconnect_attempts = 0
-
-            self._start_threads()
-
-            logger.info(f"Połączono z {self.host}:{self.port}")
-            return True
-
-        except socket.error as e:
-            logger.error(f"Błąd połączenia: {e}")
-            self._handle_connection_error(e)
-            return False
-
-    def _start_threads(self):
-        self._receive_thread = threading.Thread(target=self._receive_loop, daemon=True)
-        self._receive_thread.start()
-
-        self._send_thread = threading.Thread(target=self._send_loop, daemon=True)
-        self._send_thread.start()
-
-        if self.heartbeat_interval > 0:
-            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
-            self._heartbeat_thread.start()
+    def _handle_backpressure(self, active: bool):
+        if active:
+            logger.warning("Kolejka wysyłania przekroczyła górny próg (%d B)", self._send_queue.bytes)
+            self.metrics.incr("tcp.backpressure.events")
+        else:
+            logger.info("Kolejka wysyłania opróżniona poniżej dolnego progu")
+        self.metrics.gauge("tcp.backpressure", int(active))
+        if self.on_backpressure:
+            try:
+                self.on_backpressure(active)
+            except Exception as e:
+                logger.error("Błąd w callbacku on_backpressure: %s", e)
 
-    def _receive_loop(self):
-        while self._running and self.is_connected:
+    def _handle_dropped(self, frame: OutgoingFrame):
+        self.metrics.incr("tcp.send_queue.dropped")
+        if self.on_frame_dropped:
             try:
-                if self._socket is None:
-                    break
+                self.on_frame_dropped(frame)
+            except Exception as e:
+                logger.error("Błąd w callbacku on_frame_dropped: %s", e)
 
-                data = self._socket.recv(self.buffer_size)
+    @property
+    def is_connected(self) -> bool:
+        return self.state == ConnectionState.CONNECTED
 
-                if not data:
-                    logger.info("Serwer zamknął połączenie")
-                    self._handle_disconnect()
-                    break
+    @property
+    def generation(self) -> int:
+        return self._generation
 
-                if self.on_message:
-                    try:
-                        self.on_message(data)
-                    except Exception as e:
-                        logger.error(f"Błąd w callbacku on_message: {e}")
+    def connect(self) -> bool:
+        if self._supervisor and self._supervisor.is_alive():
+            if self.is_connected:
+                logger.warning("Już połączono")
+            return self.is_connected
 
-            except socket.timeout:
-                continue
-            except socket.error as e:
-                if self._running:
-                    logger.error(f"Błąd odbioru: {e}")
-                    self._handle_disconnect()
-                break
+        self._first_attempt.clear()
+        self._start_supervisor()
+        self._first_attempt.wait()
+        return self._first_attempt_ok
 
-    def _send_loop(self):
-        while self._running:
-            try:
-                data = self._send_queue.get(timeout=1.0)
-                if data is None:
+    def _start_supervisor(self):
+        self._running = True
+        self._stop.clear()
+        self._wakeup.clear()
+        self._send_queue.open()
+        self._supervisor = threading.Thread(
+            target=self._supervise, name=f"tcp-supervisor-{self.host}:{self.port}", daemon=True
+        )
+        self._supervisor.start()
+
+    def _supervise(self):
+        # Jedyny właściciel połączenia: tylko ten wątek otwiera i zamyka gniazdo, zmienia stan
+        # i uruchamia wątki robocze. Każde połączenie to nowa generacja wątków, które po jego
+        # utracie kończą się, zanim powstanie następna
+        attempt_state = ConnectionState.CONNECTING
+        while not self._stop.is_set():
+            self.state = attempt_state
+            sock = self._open_socket(initial=attempt_state == ConnectionState.CONNECTING)
+
+            if attempt_state == ConnectionState.CONNECTING:
+                self._first_attempt_ok = sock is not None
+                self._first_attempt.set()
+
+            if sock is not None:
+                connected_at = time.monotonic()
+                self._serve(sock)
+                if self._stop.is_set():
                     break
-
-                if self.is_connected and self._socket:
-                    try:
-                        self._socket.sendall(data)
-                    except socket.error as e:
-                        logger.error(f"Błąd wysyłania: {e}")
-                        self._handle_disconnect()
-                else:
-                    self._send_queue.put(data)
-                    time.sleep(0.5)
-
-            except Exception:
-                continue
-
-    def _heartbeat_loop(self):
-        while self._running and self.is_connected:
-            time.sleep(self.heartbeat_interval)
-
-            if not self._running or not self.is_connected:
-                break
-
-            try:
-                if self._socket:
-                    self._socket.send(b'')
-            except socket.error as e:
-                logger.warning(f"Heartbeat failed: {e}")
-                self._handle_disconnect()
+                self.metrics.incr("tcp.disconnects")
+                self._reconnect_started_at = time.monotonic()
+                if self.fast_retry:
+                    stable = self._reconnect_started_at - connected_at >= self.reconnect_delay
+                    rare = (
+                        self._last_fast_retry is None
+                        or self._reconnect_started_at - self._last_fast_retry >= self.max_reconnect_delay
+                    )
+                    self._retry_now = stable or rare
+
+            if not self.auto_reconnect:
                 break
 
-    def _handle_disconnect(self):
-        was_connected = self.is_connected
-        self._close_socket()
-
-        if was_connected and self.auto_reconnect and self._running:
+            attempt_state = ConnectionState.RECONNECTING
             self.state = ConnectionState.RECONNECTING
-            self._start_reconnect()
-        else:
-            self.state = ConnectionState.DISCONNECTED
-
-    def _handle_connection_error(self, error: Exception):
-        self._close_socket()
-
-        if self.on_error:
-            try:
-                self.on_error(error)
-            except Exception as e:
-                logger.error(f"Błąd w callbacku on_error: {e}")
-
-        if self.auto_reconnect and self._running:
-            self.state = ConnectionState.RECONNECTING
-            self._start_reconnect()
-        else:
-            self.state = ConnectionState.DISCONNECTED
+            if self._reconnect_started_at is None:
+                self._reconnect_started_at = time.monotonic()
 
-    def _start_reconnect(self):
-        if self._reconnect_thread and self._reconnect_thread.is_alive():
-            return
-
-        self._reconnect_thread = threading.Thread(target=self._reconnect_loop, daemon=True)
-        self._reconnect_thread.start()
-
-    def _reconnect_loop(self):
-        while self._running and self.state == ConnectionState.RECONNECTING:
             self._reconnect_attempts += 1
-            logger.info(f"Próba ponownego połączenia #{self._reconnect_attempts} za {self._current_reconnect_delay:.1f}s...")
-
-            time.sleep(self._current_reconnect_delay)
-
-            if not self._running:
-                break
+            delay = self._next_delay()
+            logger.info("Próba ponownego połączenia #%d za %.1fs...", self._reconnect_attempts, delay)
+            if self.on_reconnect_scheduled:
+                try:
+                    self.on_reconnect_scheduled(self._reconnect_attempts, delay)
+                except Exception as e:
+                    logger.error("Błąd w callbacku on_reconnect_scheduled: %s", e)
+            if delay > 0:
+                self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+        self._first_attempt.set()
+        self.state = ConnectionState.DISCONNECTED
 
+    def _next_delay(self) -> float:
+        if self._retry_now:
+            self._retry_now = False
+            self._last_fast_retry = time.monotonic()
+            self.metrics.incr("tcp.reconnect.fast_retries")
+            return 0.0
+        # Decorrelated jitter: klienci rozłączeni w tej samej chwili (np. restart serwera)
+        # nie wracają jednocześnie, a opóźnienie nadal rośnie do max_reconnect_delay
+        self._current_reconnect_delay = min(
+            self.max_reconnect_delay,
+            random.uniform(self.reconnect_delay, self._current_reconnect_delay * 3)
+        )
+        return self._current_reconnect_delay
+
+    def _open_socket(self, initial: bool) -> Optional[socket.socket]:
+        started_at = time.monotonic()
+        try:
+            addresses = self.resolver.resolve(self.host, self.port, self.metrics)
+            sock, address, attempts = dial(addresses, self.connection_timeout, self.connect_stagger, self._stop)
+        except socket.error as e:
+            if self._stop.is_set():
+                return None
+            # Adresy mogły się zmienić - przy następnej próbie pytamy DNS od nowa
+            self.resolver.expire(self.host, self.port)
+            if initial:
+                logger.error("Błąd połączenia: %s", e)
+                if self.on_error:
+                    try:
+                        self.on_error(e)
+                    except Exception as callback_error:
+                        logger.error("Błąd w callbacku on_error: %s", callback_error)
+            else:
+                logger.warning("Próba połączenia nieudana: %s", e)
+                self.metrics.incr("tcp.reconnect.failures")
+            return None
+
+        self.resolver.prefer(self.host, self.port, address)
+        self.metrics.observe("tcp.connect.duration", time.monotonic() - started_at)
+        self.metrics.gauge("tcp.connect.addresses_tried", attempts)
+
+        if not initial:
+            self.metrics.incr("tcp.reconnects")
+            self.metrics.gauge("tcp.reconnect.attempts", self._reconnect_attempts)
+        if self._reconnect_started_at is not None:
+            self.metrics.observe("tcp.reconnect.duration", time.monotonic() - self._reconnect_started_at)
+            self._reconnect_started_at = None
+        self._current_reconnect_delay = self.reconnect_delay
+        self._reconnect_attempts = 0
+        return sock
+
+    def _serve(self, sock: socket.socket):
+        self._generation += 1
+        generation = self._generation
+        lost = threading.Event()
+        self._lost = lost
+        self._socket = sock
+        self.metrics.gauge("tcp.generation", generation)
+
+        workers = [
+            threading.Thread(target=self._receive_loop, args=(sock, lost), name=f"tcp-recv-{generation}", daemon=True),
+            threading.Thread(target=self._send_loop, args=(sock, lost), name=f"tcp-send-{generation}", daemon=True),
+        ]
+        self.state = ConnectionState.CONNECTED
+        logger.info("Połączono z %s:%s", self.host, self.port)
+        for worker in workers:
+            worker.start()
+
+        # Wątek nadzorcy pełni też rolę heartbeatu
+        interval = self.heartbeat_interval if self.heartbeat_interval > 0 else None
+        while not lost.wait(interval):
             try:
-                self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self._socket.settimeout(self.connection_timeout)
-                self._socket.connect((self.host, self.port))
-                self._socket.settimeout(None)
-
-                self.state = ConnectionState.CONNECTED
-                self._current_reconnect_delay = self.reconnect_delay
-                self._reconnect_attempts = 0
+                sock.send(b'')
+            except socket.error as e:
+                logger.warning("Heartbeat failed: %s", e)
+                break
 
-                self._start_threads()
+        lost.set()
+        self._socket = None
+        self._close(sock)
+        self._send_queue.wake()
+        self._reset_in_flight()
 
-                logger.info(f"Ponownie połączono z {self.host}:{self.port}")
-                return
+        for worker in workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                logger.error("Wątek %s nie zakończył się po utracie połączenia", worker.name)
+                self.metrics.incr("tcp.workers_leaked")
 
-            except socket.error as e:
-                logger.warning(f"Próba połączenia nieudana: {e}")
-                self._close_socket()
+    def _receive_loop(self, sock: socket.socket, lost: threading.Event):
+        buffer = ReceiveBuffer(self.buffer_size, self.max_frame_size)
+        try:
+            while not lost.is_set():
+                resizes = buffer.resizes
+                try:
+                    count = buffer.recv_into(sock)
+                except socket.timeout:
+                    continue
+                except FrameTooLarge as e:
+                    logger.error("Błąd odbioru: %s", e)
+                    break
+                except socket.error as e:
+                    if not lost.is_set():
+                        logger.error("Błąd odbioru: %s", e)
+                    break
 
-                self._current_reconnect_delay = min(
-                    self._current_reconnect_delay * 1.5,
-                    self.max_reconnect_delay
-                )
+                if not count:
+                    logger.info("Serwer zamknął połączenie")
+                    break
 
-        if not self._running:
-            self.state = ConnectionState.DISCONNECTED
+                self.metrics.incr("tcp.bytes_in", count)
+                self.metrics.incr("tcp.recv_calls")
+                if buffer.resizes != resizes:
+                    self.metrics.incr("tcp.recv_buffer.resizes")
+                    self.metrics.gauge("tcp.recv_buffer.size", buffer.size)
+
+                for frame in buffer.frames():
+                    if self.on_message:
+                        try:
+                            self.on_message(frame)
+                        except Exception as e:
+                            logger.error("Błąd w callbacku on_message: %s", e)
+        finally:
+            lost.set()
+
+    def _wait_for_slot(self, timeout: float) -> bool:
+        with self._flow:
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                self._flow.wait(timeout)
+            return not self.max_in_flight or self._in_flight < self.max_in_flight
+
+    def complete(self):
+        with self._flow:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._flow.notify()
+
+    def _reset_in_flight(self):
+        # Ramki wysłane na zerwanym połączeniu nie doczekają się odpowiedzi
+        with self._flow:
+            self._in_flight = 0
+            self._flow.notify_all()
+
+    def _send_loop(self, sock: socket.socket, lost: threading.Event):
+        # Każde wyjście wątku (także nieprzewidziany wyjątek) zgłasza utratę połączenia -
+        # nadzorca łączy ponownie, zamiast zostawić CONNECTED bez wątku wysyłania
+        try:
+            while not lost.is_set():
+                if not self._wait_for_slot(1.0):
+                    continue
+                try:
+                    frame = self._send_queue.get(timeout=1.0, interrupt=lost)
+                except Empty:
+                    continue
+                if frame is None:
+                    break
 
-    def _close_socket(self):
-        if self._socket:
+                with self._flow:
+                    self._in_flight += 1
+                self._frame_sent(frame)
+                try:
+                    sock.sendall(frame.data)
+                except socket.error as e:
+                    if not lost.is_set():
+                        logger.error("Błąd wysyłania: %s", e)
+                    break
+                self.metrics.observe("tcp.send_queue.wait", time.monotonic() - frame.enqueued_at)
+                self.metrics.observe(f"tcp.send_queue.wait.{frame.priority.name.lower()}", time.monotonic() - frame.enqueued_at)
+                self.metrics.incr("tcp.bytes_out", len(frame.data))
+                self.metrics.incr("tcp.frames_out")
+                self.metrics.gauge("tcp.send_queue.aged", self._send_queue.aged)
+        finally:
+            lost.set()
+
+    def _frame_sent(self, frame: OutgoingFrame):
+        # Jak on_message w wątku odbioru - błąd w callbacku nie zatrzymuje wysyłania
+        if self.on_frame_sent:
             try:
-                self._socket.shutdown(socket.SHUT_RDWR)
-            except Exception:
-                pass
+                self.on_frame_sent(frame)
+            except Exception as e:
+                logger.error("Błąd w callbacku on_frame_sent: %s", e)
+        for callback in frame.callbacks:
             try:
-                self._socket.close()
-            except Exception:
-                pass
-            self._socket = None
+                callback()
+            except Exception as e:
+                logger.error("Błąd w callbacku wysłanej ramki: %s", e)
+
+    @staticmethod
+    def _close(sock: socket.socket):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        try:
+            sock.close()
+        except Exception:
+            pass
 
-    def send(self, data: bytes | str) -> bool:
+    def send(
+        self,
+        data: bytes | str,
+        on_sent: Optional[Callable[[], None]] = None,
+        priority: Priority = Priority.NORMAL,
+        merge_key: Optional[str] = None,
+        tag: Any = None
+    ) -> Optional[OutgoingFrame]:
         if isinstance(data, str):
             data = data.encode('utf-8')
 
         if not self._running:
             logger.warning("Klient nie jest uruchomiony")
-            return False
+            return None
 
-        self._send_queue.put(data)
-        return True
+        # Scalać można tylko ruch w tle - żądania użytkownika zawsze idą osobno
+        if priority != Priority.BACKGROUND:
+            merge_key = None
+
+        frame = OutgoingFrame(data, priority, merge_key, tag)
+        if on_sent:
+            frame.callbacks.append(on_sent)
+        try:
+            queued = self._send_queue.put(frame)
+        except SendQueueFull:
+            self.metrics.incr("tcp.send_queue.rejected")
+            raise
+        if queued is not frame:
+            self.metrics.incr("tcp.send_queue.merged")
+        self.metrics.gauge("tcp.send_queue.depth", self._send_queue.qsize())
+        self.metrics.gauge("tcp.send_queue.bytes", self._send_queue.bytes)
+        self.metrics.gauge(f"tcp.send_queue.depth.{priority.name.lower()}", self._send_queue.depth(priority))
+        return queued
+
+    def cancel(self, frame: OutgoingFrame) -> bool:
+        # Usuwa ramkę, która jeszcze nie trafiła do gniazda
+        return self._send_queue.remove(frame)
 
     def send_now(self, data: bytes | str) -> bool:
         if isinstance(data, str):
             data = data.encode('utf-8')
 
-        if not self.is_connected or not self._socket:
+        sock = self._socket
+        if not self.is_connected or sock is None:
             logger.warning("Nie połączono - nie można wysłać")
             return False
 
         try:
-            self._socket.sendall(data)
+            sock.sendall(data)
+            self.metrics.incr("tcp.bytes_out", len(data))
+            self.metrics.incr("tcp.frames_out")
             return True
         except socket.error as e:
-            logger.error(f"Błąd wysyłania: {e}")
-            self._handle_disconnect()
+            logger.error("Błąd wysyłania: %s", e)
+            self._drop_connection()
             return False
 
+    def _drop_connection(self):
+        lost = self._lost
+        if lost is not None:
+            lost.set()
+
     def disconnect(self):
         logger.info("Rozłączanie...")
         self._running = False
         self.auto_reconnect = False
-        self._send_queue.put(None)
-
-        self._close_socket()
+        self._stop.set()
+        self._wakeup.set()
+        self._drop_connection()
+        self._send_queue.close()
+
+        supervisor = self._supervisor
+        if supervisor and supervisor.is_alive() and supervisor is not threading.current_thread():
+            supervisor.join(timeout=10.0)
         self.state = ConnectionState.DISCONNECTED
 
-        for thread in [self._receive_thread, self._send_thread, self._heartbeat_thread, self._reconnect_thread]:
-            if thread and thread.is_alive():
-                thread.join(timeout=2.0)
-
         logger.info("Rozłączono")
 
     def reconnect(self):
         logger.info("Wymuszam ponowne połączenie...")
-        self._close_socket()
         self._current_reconnect_delay = self.reconnect_delay
         self._reconnect_attempts = 0
-        self.state = ConnectionState.RECONNECTING
-        self._running = True
         self.auto_reconnect = True
-        self._start_reconnect()
+        if self._supervisor and self._supervisor.is_alive():
+            # Wymuszone zerwanie nie powinno czekać na backoff
+            self._retry_now = self.is_connected
+            self._drop_connection()
+            self._wakeup.set()
+        else:
+            self._start_supervisor()
 
     def __enter__(self):
         self.connect()
@@ -323,8 +835,12 @@ class TCPClient:
         return False
 
 if __name__ == "__main__":
-    def on_message(data: bytes):
-        print(f"📩 Otrzymano: {data.decode('utf-8', errors='replace')}")
+    from tools.log import setup_logging
+
+    log_listener = setup_logging()
+
+    def on_message(data: memoryview):
+        print(f"📩 Otrzymano: {str(data, 'utf-8', errors='replace')}")
 
     def on_state_change(state: ConnectionState):
         print(f"🔌 Stan połączenia: {state.value}")
@@ -360,3 +876,4 @@ if __name__ == "__main__":
         print("\nPrzerwano")
     finally:
         client.disconnect()
+        log_listener.stop()
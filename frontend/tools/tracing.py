@@ -0,0 +1,162 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+
+class Span:
+    __slots__ = ("span_id", "name", "category", "thread_id", "start", "end", "phases", "args", "children")
+
+    def __init__(self, span_id: int, name: str, category: str, phase: str, args: Optional[dict] = None):
+        self.span_id = span_id
+        self.name = name
+        self.category = category
+        self.thread_id = threading.get_ident()
+        self.start = time.monotonic()
+        self.end: Optional[float] = None
+        self.phases: list[tuple[str, float]] = [(phase, self.start)]
+        self.args = args or {}
+        self.children: list["Span"] = []
+
+
+class TraceHook:
+    def on_span_start(self, span: Span):
+        pass
+
+    def on_span_end(self, span: Span):
+        pass
+
+
+class Tracer:
+    def __init__(self):
+        self.hooks: list[TraceHook] = []
+        self._ids = itertools.count(1)
+        self._open: dict[int, Span] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.hooks)
+
+    def add_hook(self, hook: TraceHook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: TraceHook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def start_span(self, name: str, category: str, phase: str, args: Optional[dict] = None) -> Optional[Span]:
+        if not self.hooks:
+            return None
+
+        span = Span(next(self._ids), name, category, phase, args)
+        with self._lock:
+            self._open[span.span_id] = span
+        for hook in self.hooks:
+            hook.on_span_start(span)
+        return span
+
+    def mark(self, span: Optional[Span], phase: str, at: Optional[float] = None):
+        if span is not None and span.end is None:
+            span.phases.append((phase, at if at is not None else time.monotonic()))
+
+    def mark_id(self, span_id: Optional[int], phase: str):
+        if span_id is not None:
+            self.mark(self._open.get(span_id), phase)
+
+    def end_span(self, span: Optional[Span]):
+        if span is None or span.end is not None:
+            return
+
+        span.end = time.monotonic()
+        with self._lock:
+            self._open.pop(span.span_id, None)
+        for hook in self.hooks:
+            hook.on_span_end(span)
+
+    def end_id(self, span_id: Optional[int]):
+        if span_id is not None:
+            self.end_span(self._open.get(span_id))
+
+    def finish_request(self, span: Optional[Span]):
+        # Żądanie wysłane w trakcie interakcji kończy się razem z nią, czyli po wyrenderowaniu
+        if span is None:
+            return
+
+        stack = getattr(self._local, "interactions", None)
+        if stack:
+            stack[-1].children.append(span)
+        else:
+            self.end_span(span)
+
+    @contextmanager
+    def interaction(self, name: str):
+        span = self.start_span(name, "interaction", "slot")
+        if span is None:
+            yield None
+            return
+
+        stack = getattr(self._local, "interactions", None)
+        if stack is None:
+            stack = self._local.interactions = []
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            for child in span.children:
+                self.end_span(child)
+            self.end_span(span)
+
+
+class ChromeTraceExporter(TraceHook):
+    def __init__(self, max_spans: int = 100000):
+        self._spans: deque = deque(maxlen=max_spans)
+        self._pid = os.getpid()
+
+    def on_span_end(self, span: Span):
+        self._spans.append(span)
+
+    def _events(self, span: Span) -> list[dict]:
+        events = [{
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": span.start * 1e6,
+            "dur": (span.end - span.start) * 1e6,
+            "pid": self._pid,
+            "tid": span.thread_id,
+            "args": dict(span.args, spanId=span.span_id),
+        }]
+
+        if len(span.phases) < 2:
+            return events
+
+        bounds = span.phases + [("", span.end)]
+        for (phase, started), (_, ended) in zip(bounds, bounds[1:]):
+            events.append({
+                "name": phase,
+                "cat": span.category,
+                "ph": "X",
+                "ts": started * 1e6,
+                "dur": max(ended - started, 0.0) * 1e6,
+                "pid": self._pid,
+                "tid": span.thread_id,
+                "args": {"spanId": span.span_id},
+            })
+        return events
+
+    def export(self, path: str) -> int:
+        spans = list(self._spans)
+        events = []
+        for span in spans:
+            events.extend(self._events(span))
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(spans)
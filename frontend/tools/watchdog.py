@@ -0,0 +1,86 @@
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from tools.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+GUI_PACKAGE = os.sep + "gui" + os.sep
+
+
+class StallWatchdog:
+    def __init__(self, threshold: float = 0.05, metrics: Optional[Metrics] = None):
+        self.threshold = threshold
+        self.metrics = metrics
+        self.stalls = 0
+        self._watched_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        # Wywoływać z wątku, który ma być obserwowany (wątek GUI)
+        self._watched_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+
+    def beat(self):
+        now = time.monotonic()
+        if self._reported_beat == self._last_beat:
+            duration = now - self._last_beat
+            logger.warning("Wątek GUI odblokowany po %.0f ms", duration * 1000)
+            if self.metrics is not None:
+                self.metrics.observe("gui.stall", duration)
+        self._last_beat = now
+
+    def _run(self):
+        interval = max(self.threshold / 2, 0.005)
+        while self._running:
+            time.sleep(interval)
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat
+            if blocked_for < self.threshold or self._reported_beat == last_beat:
+                continue
+
+            self._reported_beat = last_beat
+            self.stalls += 1
+            if self.metrics is not None:
+                self.metrics.incr("gui.stalls")
+            self._report(blocked_for)
+
+    def _report(self, blocked_for: float):
+        frame = sys._current_frames().get(self._watched_thread_id)
+        if frame is None:
+            return
+
+        stack = traceback.extract_stack(frame)
+        logger.warning(
+            "Wątek GUI zablokowany od %.0f ms w slocie %s\n%s",
+            blocked_for * 1000, self.active_slot(frame), "".join(traceback.format_list(stack))
+        )
+
+    @staticmethod
+    def active_slot(frame) -> str:
+        # Slot wywołany przez pętlę zdarzeń to najbardziej zewnętrzna ramka z kodu pakietu gui
+        slot = "<pętla zdarzeń>"
+        while frame is not None:
+            # Pomijamy ramki dekoratorów (np. traced_slot) - liczy się udekorowana metoda
+            if GUI_PACKAGE in frame.f_code.co_filename and frame.f_code.co_name != "wrapper":
+                owner = frame.f_locals.get("self")
+                name = frame.f_code.co_name
+                slot = f"{type(owner).__name__}.{name}" if owner is not None else name
+            frame = frame.f_back
+        return slot